@@ -0,0 +1,102 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.agents.history import StimulusHistory
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from typing import Dict, Optional, Tuple
+
+
+class HistoryPolicyAgent:
+    """Base of the agents with a factorized x/y softmax policy over the stimulus history.
+
+    It keeps the StimulusHistory of every slot of a batched env in the "coords" observation
+    mode, and chooses saccades from the probabilities of x and of y that subclasses compute in
+    probabilities().
+    """
+
+    def __init__(self, env: VectorEnvironment, seed: Optional[int] = None) -> None:
+        """
+        Args:
+            env: VectorEnvironment
+                Batched env to train against. It has to use the "coords" observation mode.
+            seed: Optional[int]
+                Seed of the random stream of the agent, e.g. of the action sampling.
+        """
+        assert (
+            env.observation_mode == "coords"
+        ), f"{type(self).__name__} needs a VectorEnvironment in the coords observation mode"
+        self.env = env
+        self.width = env.task.width
+        self.height = env.task.height
+        self.tot_frames = env.task.tot_frames
+        self.rng = np.random.default_rng(seed)
+
+        self.history = StimulusHistory(
+            env.num_envs,
+            self.tot_frames,
+            env.schedule.max_signals,
+            self.width,
+            self.height,
+        )
+
+    def act(
+        self, observations: Dict[str, np.ndarray], times: np.ndarray, explore: bool = True
+    ) -> np.ndarray:
+        """Chooses the (x, y) saccade of every slot.
+        Args:
+            observations: Dict[str, np.ndarray]
+                Batched "coords" observations of the env.
+            times: np.ndarray
+                Frame of every slot.
+            explore: bool
+                Whether to sample from the policy instead of taking its most likely saccade.
+
+        Returns:
+            Integer array of shape (num_envs, 2).
+        """
+        self.history.update(observations, times)
+        probs_x, probs_y = self._probs = self.probabilities(times)
+        if explore:
+            actions_x = self._sample(probs_x)
+            actions_y = self._sample(probs_y)
+        else:
+            actions_x = probs_x.argmax(axis=1)
+            actions_y = probs_y.argmax(axis=1)
+        return np.stack([actions_x, actions_y], axis=1)
+
+    def probabilities(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Softmax probabilities of x and of y given the current history of every slot.
+        """
+        raise NotImplementedError
+
+    def _sample(self, probs: np.ndarray) -> np.ndarray:
+        """Helper function that draws one index per row of a batch of categorical distributions.
+        """
+        uniform = self.rng.random((len(probs), 1))
+        return np.minimum((probs.cumsum(axis=1) < uniform).sum(axis=1), probs.shape[1] - 1)
+
+
+def incidence(features: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Lists the distinct valid features of a batch of histories and the dense (num_slots,
+    num_distinct) matrix counting them in every slot. Few distinct features occur in a batch,
+    so products with this matrix replace gathers and scatters over every row.
+    """
+    slots = np.broadcast_to(np.arange(len(features))[:, None], features.shape)[mask]
+    unique, inverse = np.unique(features[mask], return_inverse=True)
+    counts = np.zeros((len(features), len(unique)))
+    np.add.at(counts, (slots, inverse.reshape(-1)), 1.0)
+    return unique, counts
+
+
+def time_sums(times: np.ndarray, values: np.ndarray, tot_frames: int) -> np.ndarray:
+    """Sums the rows of values belonging to each time step.
+    """
+    one_hot = np.zeros((len(times), tot_frames))
+    one_hot[np.arange(len(times)), times] = 1.0
+    return one_hot.T @ values
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    """Numerically stable softmax over the last axis.
+    """
+    exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.agents.base import HistoryPolicyAgent, incidence, softmax, time_sums
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+
+class Stage(NamedTuple):
+    """One developmental stage of GrowingAgent: the hidden size and the density of the
+    connections from the stimulus history to the hidden units. A stage ends after iterations
+    training iterations, or once the mean final-step reward of a batch reaches
+    reward_threshold, whichever comes first. The last stage never ends.
+    """
+
+    hidden_size: int
+    density: float = 1.0
+    iterations: Optional[int] = None
+    reward_threshold: Optional[float] = None
+
+
+# a Stage, a dict of its fields, or a tuple of its fields in order, e.g. from a sweep config
+StageLike = Union[Stage, Dict[str, Any], Sequence[Any]]
+
+
+class GrowingAgent(HistoryPolicyAgent):
+    """Actor-critic agent with one hidden layer that grows in developmental stages.
+
+    The hidden layer reads the sparse stimulus history of the episode through a masked input
+    layer: each hidden unit is connected to a random fraction density of the history features.
+    The factorized x/y softmax policy and the state value are read from the hidden units, with
+    a bias per time step as in PolicyGradientAgent.
+
+    Moving to the next stage grows the network without changing what it computes, so the
+    learned weights carry forward and training continues on the same batched env instead of
+    starting over:
+        - widening (Net2WiderNet) adds hidden units that copy the incoming weights of random
+          existing units, whose outgoing weights are split at random between the copies. The
+          sum over the copies is unchanged, while the unequal split breaks their symmetry.
+        - connecting enables new input connections with zero weights.
+    """
+
+    def __init__(
+        self,
+        env: VectorEnvironment,
+        stages: Sequence[StageLike] = (
+            Stage(16, 0.25, iterations=100),
+            Stage(32, 0.5, iterations=100),
+            Stage(64, 1.0),
+        ),
+        learning_rate: float = 0.5,
+        critic_learning_rate: float = 0.1,
+        init_scale: float = 0.1,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            env: VectorEnvironment
+                Batched env to train against. It has to use the "coords" observation mode.
+            stages: Sequence[Union[Stage, Dict[str, Any], Sequence[Any]]]
+                Developmental stages, with non-decreasing hidden sizes and densities. Every
+                stage but the last needs iterations or reward_threshold.
+            learning_rate: float
+                Step size of the policy updates.
+            critic_learning_rate: float
+                Step size of the critic updates.
+            init_scale: float
+                Standard deviation of the initial input weights.
+            seed: Optional[int]
+                Seed of the initial weights, of the growth and of the action sampling.
+        """
+        super().__init__(env, seed)
+        self.stages = [_as_stage(stage) for stage in stages]
+        assert self.stages, "GrowingAgent needs at least one stage"
+        for stage, following in zip(self.stages, self.stages[1:]):
+            assert (
+                following.hidden_size >= stage.hidden_size and following.density >= stage.density
+            ), "The stages have to keep or grow the hidden size and the density"
+            assert (
+                stage.iterations is not None or stage.reward_threshold is not None
+            ), "Every stage but the last needs iterations or a reward_threshold"
+        for stage in self.stages:
+            assert stage.hidden_size >= 1, "The hidden size has to be positive"
+            assert 0.0 < stage.density <= 1.0, "The density has to be in (0, 1]"
+        self.learning_rate = learning_rate
+        self.critic_learning_rate = critic_learning_rate
+
+        n_features = self.history.num_features
+        first = self.stages[0]
+        self.stage = 0
+        self.stage_iterations = 0
+        self.hidden_size = first.hidden_size
+        self.density = first.density
+        # input layer, with the weights of the disabled connections kept at zero
+        self.connectivity = self.rng.random((n_features, self.hidden_size)) < self.density
+        self.weights_in = (
+            self.rng.normal(0.0, init_scale, (n_features, self.hidden_size)) * self.connectivity
+        )
+        self.bias_in = np.zeros((self.tot_frames, self.hidden_size))
+        # policy and critic heads, starting from a uniform policy
+        self.weights_x = np.zeros((self.hidden_size, self.width))
+        self.weights_y = np.zeros((self.hidden_size, self.height))
+        self.bias_x = np.zeros((self.tot_frames, self.width))
+        self.bias_y = np.zeros((self.tot_frames, self.height))
+        self.value_weights = np.zeros(self.hidden_size)
+        self.value_bias = np.zeros(self.tot_frames)
+
+    def probabilities(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Softmax probabilities of x and of y given the current history of every slot.
+        """
+        hidden = self._hidden(self.history.features, times)[-1]
+        return (
+            softmax(hidden @ self.weights_x + self.bias_x[times]),
+            softmax(hidden @ self.weights_y + self.bias_y[times]),
+        )
+
+    def train(self, n_iterations: int) -> List[Dict[str, float]]:
+        """Trains on n_iterations batches of num_envs episodes, moving through the stages as
+        their iterations run out or their reward thresholds are reached.
+
+        Returns:
+            Per-iteration metrics with the mean final-step reward of the batch, and the stage,
+            hidden size and density it was trained with.
+        """
+        env = self.env
+        metrics = []
+        for _ in range(n_iterations):
+            observations = env.reset()
+            steps = []
+            done = False
+            while not done:
+                times = env.times.copy()
+                actions = self.act(observations, times)
+                steps.append((times, self.history.features.copy(), actions))
+                observations, rewards, dones, _ = env.step(actions)
+                steps[-1] += (rewards,)
+                done = dones.all()
+
+            final_rewards = steps[-1][-1]
+            returns = np.zeros(env.num_envs)
+            for times, features, actions, rewards in reversed(steps):
+                returns = returns + rewards
+                self._learn(times, features, actions, returns)
+            reward_mean = float(final_rewards.mean())
+            metrics.append(
+                {
+                    "reward_mean": reward_mean,
+                    "stage": self.stage,
+                    "hidden_size": self.hidden_size,
+                    "density": self.density,
+                }
+            )
+            self.stage_iterations += 1
+            self._advance(reward_mean)
+        return metrics
+
+    def grow(self, hidden_size: Optional[int] = None, density: Optional[float] = None) -> None:
+        """Widens the hidden layer to hidden_size units and connects a density fraction of the
+        input connections, keeping the policy and the values unchanged.
+        Args:
+            hidden_size: Optional[int]
+                New number of hidden units. Default keeps the current one.
+            density: Optional[float]
+                New expected fraction of enabled input connections. Default keeps the current one.
+        """
+        if hidden_size is not None and hidden_size > self.hidden_size:
+            self._widen(hidden_size)
+        if density is not None and density > self.density:
+            self._connect(density)
+
+    def _advance(self, reward_mean: float) -> None:
+        """Helper function that grows the network into the next stage once the current one ends.
+        """
+        if self.stage == len(self.stages) - 1:
+            return
+        stage = self.stages[self.stage]
+        if (stage.iterations is not None and self.stage_iterations >= stage.iterations) or (
+            stage.reward_threshold is not None and reward_mean >= stage.reward_threshold
+        ):
+            self.stage += 1
+            self.stage_iterations = 0
+            following = self.stages[self.stage]
+            self.grow(following.hidden_size, following.density)
+
+    def _widen(self, hidden_size: int) -> None:
+        """Helper function that adds hidden units copying random existing ones (Net2WiderNet).
+        Every unit ends up with a random share of the outgoing weights of its source, the shares
+        of the copies of a source summing to one, so the outputs are unchanged.
+        """
+        sources = np.concatenate(
+            [
+                np.arange(self.hidden_size),
+                self.rng.integers(self.hidden_size, size=hidden_size - self.hidden_size),
+            ]
+        )
+        shares = self.rng.uniform(0.5, 1.5, hidden_size)
+        shares /= np.bincount(sources, weights=shares, minlength=self.hidden_size)[sources]
+        self.connectivity = self.connectivity[:, sources]
+        self.weights_in = self.weights_in[:, sources]
+        self.bias_in = self.bias_in[:, sources]
+        self.weights_x = self.weights_x[sources] * shares[:, None]
+        self.weights_y = self.weights_y[sources] * shares[:, None]
+        self.value_weights = self.value_weights[sources] * shares
+        self.hidden_size = hidden_size
+
+    def _connect(self, density: float) -> None:
+        """Helper function that enables random disabled input connections, with zero weights, so
+        that the expected fraction of enabled connections becomes density.
+        """
+        probability = (density - self.density) / (1.0 - self.density)
+        self.connectivity |= self.rng.random(self.connectivity.shape) < probability
+        self.density = density
+
+    def _hidden(
+        self, features: np.ndarray, times: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Helper function that computes the hidden units of a batch of histories.
+
+        Returns:
+            The distinct valid features, their incidence matrix, the pre-activations and the
+            (ReLU) activations of the hidden units.
+        """
+        unique, counts = incidence(features, features >= 0)
+        pre_activations = counts @ self.weights_in[unique] + self.bias_in[times]
+        return unique, counts, pre_activations, np.maximum(pre_activations, 0.0)
+
+    def _learn(
+        self, times: np.ndarray, features: np.ndarray, actions: np.ndarray, returns: np.ndarray
+    ) -> None:
+        """Helper function that applies the actor-critic updates of one time step, backpropagated
+        through the hidden layer.
+        """
+        n = len(returns)
+        unique, counts, pre_activations, hidden = self._hidden(features, times)
+        values = hidden @ self.value_weights + self.value_bias[times]
+        errors = returns - values
+        # steps of the heads normalized by the squared norm of the hidden units, which grows with
+        # the copies made by widening, keep the updates stable from one stage to the next
+        scale = 1.0 / (1.0 + (hidden ** 2).sum(axis=1).mean())
+        value_grads = scale * self.critic_learning_rate * errors / n
+        # normalized advantages keep the step size independent of the reward scale
+        advantages = scale * errors / max(errors.std(), 1e-2)
+
+        # gradient of log softmax is onehot(action) - probabilities
+        heads = []
+        for weights, bias, chosen in (
+            (self.weights_x, self.bias_x, actions[:, 0]),
+            (self.weights_y, self.bias_y, actions[:, 1]),
+        ):
+            grads = -softmax(hidden @ weights + bias[times])
+            grads[np.arange(n), chosen] += 1.0
+            grads *= (self.learning_rate * advantages / n)[:, None]
+            heads.append((weights, bias, grads))
+        hidden_grads = value_grads[:, None] * self.value_weights[None, :]
+        for weights, _, grads in heads:
+            hidden_grads += grads @ weights.T
+        hidden_grads *= pre_activations > 0
+
+        for weights, bias, grads in heads:
+            weights += hidden.T @ grads
+            bias += time_sums(times, grads, self.tot_frames)
+        self.value_weights += hidden.T @ value_grads
+        self.value_bias += time_sums(times, value_grads, self.tot_frames)
+        self.weights_in[unique] += (counts.T @ hidden_grads) * self.connectivity[unique]
+        self.bias_in += time_sums(times, hidden_grads, self.tot_frames)
+
+
+def _as_stage(stage: StageLike) -> Stage:
+    """Helper function that converts a stage given as a dict or a tuple of fields to a Stage.
+    """
+    if isinstance(stage, Stage):
+        return stage
+    if isinstance(stage, dict):
+        return Stage(**stage)
+    return Stage(*stage)
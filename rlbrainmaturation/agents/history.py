@@ -0,0 +1,64 @@
+from __future__ import annotations
+import numpy as np
+from typing import Dict
+
+
+class StimulusHistory:
+    """Compact history of the stimuli seen in the current episode of every slot of a batched env.
+
+    Every lit pixel seen so far is one sparse binary feature, identified by the frame it was
+    shown in and its position on the screen. The whole history of an episode is therefore a
+    row of at most tot_frames * max_signals feature ids, padded with -1, which the agents use
+    as the (fully observed) state of the open-loop brain maturation tasks.
+    """
+
+    def __init__(
+        self, num_envs: int, tot_frames: int, max_signals: int, width: int, height: int
+    ) -> None:
+        """
+        Args:
+            num_envs: int
+                Number of slots of the batched env.
+            tot_frames: int
+                Total number of frames in the task.
+            max_signals: int
+                Maximum number of lit pixels on any frame of the task.
+            width: int
+                The width of the screen. The unit of width is pixel.
+            height: int
+                The height of the screen. The unit of height is pixel.
+        """
+        self.tot_frames = tot_frames
+        self.max_signals = max(max_signals, 1)
+        self.width = width
+        self.height = height
+        self.num_features = tot_frames * height * width  # frame x pixel
+        self.features = np.full(
+            (num_envs, tot_frames * self.max_signals), -1, dtype=np.int64
+        )
+        self._slots = np.arange(num_envs)
+
+    def update(self, observations: Dict[str, np.ndarray], times: np.ndarray) -> None:
+        """Appends the frame every slot just observed to its history.
+        Args:
+            observations: Dict[str, np.ndarray]
+                Batched "coords" observations of VectorEnvironment.
+            times: np.ndarray
+                Frame of every slot. Slots at frame 0 start a new history.
+        """
+        self.features[times == 0] = -1
+        coords = observations["coords"]
+        ids = (
+            times[:, None] * (self.height * self.width)
+            + coords[..., 0] * self.height
+            + coords[..., 1]
+        )
+        ids[observations["mask"] == 0] = -1
+        columns = times[:, None] * self.max_signals + np.arange(self.max_signals)
+        self.features[self._slots[:, None], columns] = ids
+
+    @property
+    def mask(self) -> np.ndarray:
+        """Boolean mask of the valid entries of features.
+        """
+        return self.features >= 0
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.agents.base import HistoryPolicyAgent, incidence, softmax, time_sums
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from typing import Dict, List, Optional, Tuple
+
+
+class PolicyGradientAgent(HistoryPolicyAgent):
+    """REINFORCE agent with a factorized x/y softmax policy and an optional linear critic (A2C).
+
+    The policy is linear in the sparse stimulus history of the episode: the logits of x and of
+    y are the sum of one weight row per lit pixel seen so far (indexed by frame and position)
+    plus a bias per time step. Since a batch of histories holds only a few distinct features,
+    acting and learning cost small products with a sparse incidence matrix rather than dense
+    products over the whole screen.
+    """
+
+    def __init__(
+        self,
+        env: VectorEnvironment,
+        learning_rate: float = 0.5,
+        critic: bool = True,
+        critic_learning_rate: float = 0.1,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            env: VectorEnvironment
+                Batched env to train against. It has to use the "coords" observation mode.
+            learning_rate: float
+                Step size of the policy updates.
+            critic: bool
+                Whether to use a learned linear state value as baseline (A2C). Otherwise the
+                baseline is the mean return of the batch at each time step (REINFORCE).
+            critic_learning_rate: float
+                Step size of the critic updates.
+            seed: Optional[int]
+                Seed of the action sampling.
+        """
+        super().__init__(env, seed)
+        self.learning_rate = learning_rate
+        self.critic = critic
+        self.critic_learning_rate = critic_learning_rate
+
+        n_features = self.history.num_features
+        # policy weights of every history feature, and biases of every time step
+        self.weights_x = np.zeros((n_features, self.width))
+        self.weights_y = np.zeros((n_features, self.height))
+        self.bias_x = np.zeros((self.tot_frames, self.width))
+        self.bias_y = np.zeros((self.tot_frames, self.height))
+        # critic weights
+        self.value_weights = np.zeros(n_features)
+        self.value_bias = np.zeros(self.tot_frames)
+
+    def probabilities(self, times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Softmax probabilities of x and of y given the current history of every slot.
+        """
+        features, mask = self.history.features, self.history.mask
+        logits_x = self.bias_x[times] + self._gather(self.weights_x, features, mask)
+        logits_y = self.bias_y[times] + self._gather(self.weights_y, features, mask)
+        return softmax(logits_x), softmax(logits_y)
+
+    def train(self, n_iterations: int) -> List[Dict[str, float]]:
+        """Trains on n_iterations batches of num_envs episodes.
+
+        Returns:
+            Per-iteration metrics with the mean final-step reward of the batch.
+        """
+        env = self.env
+        metrics = []
+        for _ in range(n_iterations):
+            observations = env.reset()
+            steps = []
+            done = False
+            while not done:
+                times = env.times.copy()
+                actions = self.act(observations, times)
+                steps.append(
+                    (
+                        times,
+                        self.history.features.copy(),
+                        actions,
+                        self._probs,
+                    )
+                )
+                observations, rewards, dones, _ = env.step(actions)
+                steps[-1] += (rewards,)
+                done = dones.all()
+
+            final_rewards = steps[-1][-1]
+            returns = np.zeros(env.num_envs)
+            for times, features, actions, (probs_x, probs_y), rewards in reversed(steps):
+                returns = returns + rewards
+                self._learn(times, features, actions, probs_x, probs_y, returns)
+            metrics.append({"reward_mean": float(final_rewards.mean())})
+        return metrics
+
+    def _learn(
+        self,
+        times: np.ndarray,
+        features: np.ndarray,
+        actions: np.ndarray,
+        probs_x: np.ndarray,
+        probs_y: np.ndarray,
+        returns: np.ndarray,
+    ) -> None:
+        """Helper function that applies the policy-gradient and critic updates of one time step.
+        """
+        n = len(returns)
+        mask = features >= 0
+        if self.critic:
+            values = self.value_bias[times] + (
+                self.value_weights[np.where(mask, features, 0)] * mask
+            ).sum(axis=1)
+            errors = returns - values
+            self._scatter(
+                self.value_weights, features, mask, self.critic_learning_rate * errors / n
+            )
+            self.value_bias += self.critic_learning_rate * time_sums(
+                times, errors / n, self.tot_frames
+            )
+            advantages = errors
+        else:
+            advantages = returns - returns.mean()
+        # normalized advantages keep the step size independent of the reward scale
+        advantages = advantages / max(advantages.std(), 1e-2)
+
+        for weights, bias, probs, chosen in (
+            (self.weights_x, self.bias_x, probs_x, actions[:, 0]),
+            (self.weights_y, self.bias_y, probs_y, actions[:, 1]),
+        ):
+            # gradient of log softmax is onehot(action) - probabilities
+            grads = -probs
+            grads[np.arange(n), chosen] += 1.0
+            grads *= (self.learning_rate * advantages / n)[:, None]
+            self._scatter(weights, features, mask, grads)
+            bias += time_sums(times, grads, self.tot_frames)
+
+    def _gather(
+        self, weights: np.ndarray, features: np.ndarray, mask: np.ndarray
+    ) -> np.ndarray:
+        """Helper function that sums the weight rows of the valid features of every slot.
+        """
+        unique, counts = incidence(features, mask)
+        return counts @ weights[unique]
+
+    def _scatter(
+        self, weights: np.ndarray, features: np.ndarray, mask: np.ndarray, grads: np.ndarray
+    ) -> None:
+        """Helper function that adds the gradient of every slot to the rows of its valid features.
+        """
+        unique, counts = incidence(features, mask)
+        weights[unique] += counts.T @ grads
@@ -0,0 +1,149 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.agents.history import StimulusHistory
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from typing import Dict, List, Optional, Tuple
+
+
+class QLearningAgent:
+    """Tabular Q-learning agent over the stimulus history of a batched env.
+
+    The state of a slot is its time step together with every lit pixel it has seen in the
+    episode, which fully determines the deterministic tasks (ODR, Gap, Overlap, ZeroGap).
+    Each joint (x, y) saccade is one action of the table, and a whole batch of transitions is
+    learned with a few array operations per step. Tasks with random signals make the number of
+    states grow with the number of random positions, so they are better served by
+    PolicyGradientAgent.
+    """
+
+    def __init__(
+        self,
+        env: VectorEnvironment,
+        learning_rate: float = 0.5,
+        gamma: float = 1.0,
+        epsilon: float = 1.0,
+        epsilon_decay: float = 0.95,
+        min_epsilon: float = 0.01,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            env: VectorEnvironment
+                Batched env to train against. It has to use the "coords" observation mode.
+            learning_rate: float
+                Step size of the Q-value updates.
+            gamma: float
+                Discount factor.
+            epsilon: float
+                Initial probability of taking a uniformly random action.
+            epsilon_decay: float
+                Factor applied to epsilon after every training iteration.
+            min_epsilon: float
+                Lower bound of epsilon.
+            seed: Optional[int]
+                Seed of the exploration.
+        """
+        assert (
+            env.observation_mode == "coords"
+        ), "QLearningAgent needs a VectorEnvironment in the coords observation mode"
+        self.env = env
+        self.width = env.task.width
+        self.height = env.task.height
+        self.learning_rate = learning_rate
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.epsilon_decay = epsilon_decay
+        self.min_epsilon = min_epsilon
+        self.rng = np.random.default_rng(seed)
+
+        self.history = StimulusHistory(
+            env.num_envs,
+            env.task.tot_frames,
+            env.schedule.max_signals,
+            self.width,
+            self.height,
+        )
+        self.state_ids: Dict[Tuple[int, ...], int] = {}
+        self.q_values = np.zeros((64, self.width * self.height))
+
+    def act(
+        self, observations: Dict[str, np.ndarray], times: np.ndarray, explore: bool = True
+    ) -> np.ndarray:
+        """Chooses the (x, y) saccade of every slot.
+        Args:
+            observations: Dict[str, np.ndarray]
+                Batched "coords" observations of the env.
+            times: np.ndarray
+                Frame of every slot.
+            explore: bool
+                Whether to take epsilon-greedy instead of greedy actions.
+
+        Returns:
+            Integer array of shape (num_envs, 2).
+        """
+        self.history.update(observations, times)
+        states = self._states(times)
+        actions = self.q_values[states].argmax(axis=1)
+        if explore:
+            random = self.rng.random(len(actions)) < self.epsilon
+            actions[random] = self.rng.integers(
+                self.width * self.height, size=random.sum()
+            )
+        self._last = (states, actions)
+        return np.stack([actions // self.height, actions % self.height], axis=1)
+
+    def train(self, n_iterations: int) -> List[Dict[str, float]]:
+        """Trains on n_iterations batches of num_envs episodes.
+
+        Returns:
+            Per-iteration metrics with the mean final-step reward of the batch.
+        """
+        env = self.env
+        metrics = []
+        for _ in range(n_iterations):
+            observations = env.reset()
+            done = False
+            while not done:
+                actions = self.act(observations, env.times)
+                states, flat_actions = self._last
+                observations, rewards, dones, _ = env.step(actions)
+                done = dones.all()
+                if done:
+                    next_values = np.zeros(len(rewards))
+                else:
+                    self.history.update(observations, env.times)
+                    # _states may grow the table, so index it only once the states are known
+                    next_states = self._states(env.times)
+                    next_values = self.q_values[next_states].max(axis=1)
+                self._learn(states, flat_actions, rewards + self.gamma * next_values)
+            self.epsilon = max(self.min_epsilon, self.epsilon * self.epsilon_decay)
+            metrics.append({"reward_mean": float(rewards.mean())})
+        return metrics
+
+    def _states(self, times: np.ndarray) -> np.ndarray:
+        """Helper function that maps the history of every slot to a row of the Q table.
+        """
+        keys = np.concatenate([times[:, None], self.history.features], axis=1)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        ids = np.empty(len(unique_keys), dtype=np.int64)
+        for i, key in enumerate(map(tuple, unique_keys)):
+            if key not in self.state_ids:
+                self.state_ids[key] = len(self.state_ids)
+            ids[i] = self.state_ids[key]
+        if len(self.state_ids) > len(self.q_values):
+            grown = np.zeros((2 * len(self.state_ids), self.q_values.shape[1]))
+            grown[: len(self.q_values)] = self.q_values
+            self.q_values = grown
+        return ids[inverse.reshape(-1)]
+
+    def _learn(self, states: np.ndarray, actions: np.ndarray, targets: np.ndarray) -> None:
+        """Helper function that moves Q(s, a) toward the mean target of every (s, a) in the batch.
+        """
+        pairs = states * self.q_values.shape[1] + actions
+        visited, inverse = np.unique(pairs, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        errors = np.zeros(len(visited))
+        np.add.at(errors, inverse, targets - self.q_values[states, actions])
+        counts = np.bincount(inverse, minlength=len(visited))
+        rows, columns = np.divmod(visited, self.q_values.shape[1])
+        self.q_values[rows, columns] += self.learning_rate * errors / counts
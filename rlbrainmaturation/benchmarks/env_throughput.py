@@ -0,0 +1,329 @@
+"""Throughput, latency and memory benchmark of the environments and tasks.
+
+Every task class is benchmarked on every screen size, for single-episode calls
+(EnvironmentCore.step/reset, Task.issue_instruction, Task.score), for batched stepping with
+VectorEnvironment, and for batched stepping spread over a process pool or over the workers
+of SubprocVectorEnvironment. The allocations of a call are reported as the bytes it allocates
+at its peak (transient_bytes_per_call) and the number of memory blocks it leaves allocated
+(retained_blocks_per_call), since tracemalloc does not count the blocks freed within a call.
+Results are written as JSON so two commits can be compared:
+
+    python -m rlbrainmaturation.benchmarks.env_throughput run --json base.json
+    python -m rlbrainmaturation.benchmarks.env_throughput run --json new.json
+    python -m rlbrainmaturation.benchmarks.env_throughput compare base.json new.json
+"""
+from __future__ import annotations
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from rlbrainmaturation.envs.core import EnvironmentCore
+from rlbrainmaturation.envs.subproc_vector_env import SubprocVectorEnvironment
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from rlbrainmaturation.tasks import registry
+from rlbrainmaturation.tasks.task import Task
+
+# fields identifying a benchmark case across reports
+CASE_FIELDS = ("task", "width", "height", "operation", "batch_size", "workers")
+
+
+def make_task(name: str, size: int) -> Task:
+    """Builds the benchmarked task on a size x size screen.
+    """
+    return registry.make_task(name, width=size, height=size)
+
+
+def time_calls(func: Callable[[], Any], n_calls: int) -> np.ndarray:
+    """Calls func n_calls times and returns the duration of every call in seconds.
+    """
+    durations = np.empty(n_calls)
+    clock = time.perf_counter
+    for i in range(n_calls):
+        start = clock()
+        func()
+        durations[i] = clock() - start
+    return durations
+
+
+def measure_memory(func: Callable[[], Any], n_calls: int) -> Dict[str, float]:
+    """Measures the traced memory of n_calls calls of func.
+
+    Returns:
+        peak_memory_bytes, the peak of the traced memory above the level before the calls,
+        transient_bytes_per_call, the mean peak of the memory allocated within a single call,
+        and retained_blocks_per_call, the mean number of blocks a call leaves allocated, e.g.
+        growing caches. Blocks allocated by the benchmark itself are not counted.
+    """
+    own = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        before = tracemalloc.take_snapshot().filter_traces(own)
+        transient = []
+        peak = 0
+        for _ in range(n_calls):
+            current, call_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, call_peak)
+            if hasattr(tracemalloc, "reset_peak"):  # Python >= 3.9
+                tracemalloc.reset_peak()
+                func()
+                transient.append(tracemalloc.get_traced_memory()[1] - current)
+            else:
+                func()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        after = tracemalloc.take_snapshot().filter_traces(own)
+    finally:
+        tracemalloc.stop()
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return {
+        "peak_memory_bytes": float(peak - base),
+        "transient_bytes_per_call": float(np.mean(transient)) if transient else None,
+        "retained_blocks_per_call": retained / n_calls,
+    }
+
+
+def summarize(
+    durations: np.ndarray, steps_per_call: int, memory: Dict[str, float]
+) -> Dict[str, Any]:
+    """Turns per-call durations into throughput and latency percentiles.
+    """
+    latency_us = durations * 1e6
+    return {
+        "steps_per_sec": steps_per_call * len(durations) / durations.sum(),
+        "latency_us": {
+            "p50": float(np.percentile(latency_us, 50)),
+            "p90": float(np.percentile(latency_us, 90)),
+            "p99": float(np.percentile(latency_us, 99)),
+            "mean": float(latency_us.mean()),
+        },
+        **memory,
+    }
+
+
+def bench_single(name: str, size: int, n_calls: int) -> List[Dict[str, Any]]:
+    """Benchmarks the single-episode calls of one task.
+    """
+    task = make_task(name, size)
+    env = EnvironmentCore({"task": task})
+    action = (task.target_pos.x, task.target_pos.y)
+    last = task.tot_frames - 1
+    times = itertools.cycle(range(task.tot_frames))
+
+    def step() -> None:
+        if env.step(action)[2]:
+            env.reset()
+
+    operations = {
+        "env.step": step,
+        "env.reset": env.reset,
+        "task.issue_instruction": lambda: task.issue_instruction(next(times)),
+        "task.score": lambda: task.score(action, last),
+    }
+    results = []
+    for operation, func in operations.items():
+        time_calls(func, min(n_calls, 100))  # warm up
+        durations = time_calls(func, n_calls)
+        memory = measure_memory(func, min(n_calls, 1000))
+        results.append(
+            {
+                "operation": operation,
+                "batch_size": 1,
+                "workers": 1,
+                **summarize(durations, 1, memory),
+            }
+        )
+    return results
+
+
+def bench_batched(
+    name: str, size: int, batch_size: int, n_calls: int
+) -> Dict[str, Any]:
+    """Benchmarks VectorEnvironment.step of one task on a batch of episodes.
+    """
+    env = VectorEnvironment({"task": make_task(name, size), "num_envs": batch_size})
+    actions = np.zeros((batch_size, 2), dtype=np.int64)
+
+    def step() -> None:
+        env.step(actions)
+
+    time_calls(step, min(n_calls, 100))  # warm up
+    durations = time_calls(step, n_calls)
+    memory = measure_memory(step, min(n_calls, 200))
+    return {
+        "operation": "vector.step",
+        "batch_size": batch_size,
+        "workers": 1,
+        **summarize(durations, batch_size, memory),
+    }
+
+
+def _batched_worker(args: tuple) -> float:
+    """Process-pool worker that steps a VectorEnvironment and returns the elapsed seconds.
+    """
+    name, size, batch_size, n_calls = args
+    env = VectorEnvironment({"task": make_task(name, size), "num_envs": batch_size})
+    actions = np.zeros((batch_size, 2), dtype=np.int64)
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        env.step(actions)
+    return time.perf_counter() - start
+
+
+def bench_multiprocess(
+    name: str, size: int, batch_size: int, n_calls: int, workers: int
+) -> Dict[str, Any]:
+    """Benchmarks batched stepping on a pool of workers, each owning a batch of episodes.
+    """
+    with multiprocessing.Pool(workers) as pool:
+        pool.map(_batched_worker, [(name, size, batch_size, 10)] * workers)  # warm up
+        start = time.perf_counter()
+        elapsed = pool.map(_batched_worker, [(name, size, batch_size, n_calls)] * workers)
+        wall = time.perf_counter() - start
+    return {
+        "operation": "multiprocess.step",
+        "batch_size": batch_size,
+        "workers": workers,
+        "steps_per_sec": workers * batch_size * n_calls / wall,
+        "worker_steps_per_sec": [batch_size * n_calls / seconds for seconds in elapsed],
+    }
+
+
+def bench_subproc(
+    name: str, size: int, batch_size: int, n_calls: int, workers: int
+) -> Dict[str, Any]:
+    """Benchmarks batched stepping of workers * batch_size episodes on a
+    SubprocVectorEnvironment, driven by the parent like a single env.
+    """
+    num_envs = workers * batch_size
+    config = {"task": make_task(name, size), "num_envs": num_envs, "num_workers": workers}
+    with SubprocVectorEnvironment(config) as env:
+        actions = np.zeros((num_envs, 2), dtype=np.int64)
+        step = lambda: env.step(actions)
+        time_calls(step, 10)  # warm up
+        durations = time_calls(step, n_calls)
+    return {
+        "operation": "subproc.step",
+        "batch_size": batch_size,
+        "workers": workers,
+        **summarize(durations, num_envs, {}),
+    }
+
+
+def run(
+    tasks: Sequence[str],
+    sizes: Sequence[int],
+    batch_sizes: Sequence[int],
+    workers: int,
+    n_calls: int,
+) -> Dict[str, Any]:
+    """Runs the whole benchmark grid and returns the JSON-serializable report.
+    """
+    results = []
+    for name in tasks:
+        for size in sizes:
+            cases = bench_single(name, size, n_calls)
+            for batch_size in batch_sizes:
+                cases.append(bench_batched(name, size, batch_size, n_calls))
+                if workers > 1:
+                    cases.append(
+                        bench_multiprocess(name, size, batch_size, n_calls, workers)
+                    )
+                    cases.append(bench_subproc(name, size, batch_size, n_calls, workers))
+            for case in cases:
+                results.append({"task": name, "width": size, "height": size, **case})
+    return {"meta": _metadata(), "results": results}
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Matches the cases of two reports and computes the new / base ratio of their metrics.
+    A speedup above 1 is an improvement, whatever the direction of the metric.
+    """
+    base_cases = {
+        tuple(result[field] for field in CASE_FIELDS): result
+        for result in base["results"]
+    }
+    rows = []
+    for result in new["results"]:
+        case = tuple(result[field] for field in CASE_FIELDS)
+        old = base_cases.get(case)
+        if old is None:
+            continue
+        row = dict(zip(CASE_FIELDS, case))
+        row["steps_per_sec_speedup"] = result["steps_per_sec"] / old["steps_per_sec"]
+        if "latency_us" in result and "latency_us" in old:
+            for percentile in ("p50", "p99"):
+                row[f"{percentile}_latency_speedup"] = (
+                    old["latency_us"][percentile] / result["latency_us"][percentile]
+                )
+        rows.append(row)
+    return rows
+
+
+def _metadata() -> Dict[str, Any]:
+    """Helper function that records where the benchmark ran.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run the benchmark grid.")
+    run_parser.add_argument(
+        "--tasks", nargs="+", default=list(registry.TASKS), choices=list(registry.TASKS)
+    )
+    run_parser.add_argument("--sizes", nargs="+", type=int, default=[42, 128, 256])
+    run_parser.add_argument("--batch-sizes", nargs="+", type=int, default=[64, 1024])
+    run_parser.add_argument("--workers", type=int, default=2)
+    run_parser.add_argument("--calls", type=int, default=2000)
+    run_parser.add_argument("--json", default=None, help="Path to write the JSON report to.")
+    compare_parser = subparsers.add_parser("compare", help="Compare two JSON reports.")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.tasks, args.sizes, args.batch_sizes, args.workers, args.calls)
+        text = json.dumps(report, indent=2)
+        if args.json is not None:
+            with open(args.json, "w") as fh:
+                fh.write(text)
+        print(text)
+    else:
+        with open(args.base) as fh:
+            base = json.load(fh)
+        with open(args.new) as fh:
+            new = json.load(fh)
+        print(json.dumps(compare(base, new), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Import-time benchmark of the NumPy-only part of rlbrainmaturation.
+
+Every module is imported in a fresh interpreter, so the numbers are cold-start times. The run
+fails when a module takes longer than the budget or pulls in one of the optional heavy
+dependencies (gym, ray, torch):
+
+    python -m rlbrainmaturation.benchmarks.import_time --budget 0.5 --json import_time.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Sequence
+
+# modules that have to stay importable with only NumPy
+CORE_MODULES = [
+    "rlbrainmaturation.tasks.task",
+    "rlbrainmaturation.tasks.odr",
+    "rlbrainmaturation.tasks.gap",
+    "rlbrainmaturation.tasks.overlap",
+    "rlbrainmaturation.tasks.zero_gap",
+    "rlbrainmaturation.tasks.odr_random",
+    "rlbrainmaturation.tasks.odr_distract",
+    "rlbrainmaturation.envs.core",
+    "rlbrainmaturation.envs.vector_environment",
+    "rlbrainmaturation.agents.q_learning",
+    "rlbrainmaturation.agents.policy_gradient",
+    "rlbrainmaturation.integrations.rllib",
+]
+
+HEAVY_MODULES = ("gym", "ray", "torch")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def measure_import(module: str, repeats: int = 5) -> Dict:
+    """Measures the cold import time of module as the median over repeats fresh interpreters.
+    """
+    samples: List[float] = []
+    heavy: List[str] = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        heavy = result["heavy"]
+    return {
+        "module": module,
+        "median_seconds": statistics.median(samples),
+        "max_seconds": max(samples),
+        "heavy_modules": heavy,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget", type=float, default=0.5, help="Maximum median import time in seconds."
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--json", default=None, help="Path to write the JSON report to.")
+    parser.add_argument("modules", nargs="*", default=CORE_MODULES)
+    args = parser.parse_args(argv)
+
+    results = [measure_import(module, args.repeats) for module in args.modules]
+    failures = [
+        result
+        for result in results
+        if result["median_seconds"] > args.budget or result["heavy_modules"]
+    ]
+    report = {"budget_seconds": args.budget, "results": results, "passed": not failures}
+    text = json.dumps(report, indent=2)
+    if args.json is not None:
+        with open(args.json, "w") as fh:
+            fh.write(text)
+    print(text)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
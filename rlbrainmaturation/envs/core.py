@@ -0,0 +1,459 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.tasks.registry import resolve_task
+from rlbrainmaturation.tasks.task import Task
+from rlbrainmaturation.envs.observation import LitPixels, make_encoder
+from rlbrainmaturation.envs.episode_cache import CachedEpisode, resolve_cache
+from rlbrainmaturation.envs.frame_buffer import FrameBuffer
+from rlbrainmaturation.envs.recorder import TrajectoryRecorder
+from rlbrainmaturation.utils.general_utils import cached_property
+from rlbrainmaturation.utils.profiling import Profiler
+from typing import Any, Callable, List, Optional, Tuple, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from gym import spaces
+
+
+class EnvironmentCore:
+    """Core of the environment that simulate the environement of the brain maturation experiments.
+    
+    The environment assumes the observation is the 2D screen with 1 color channel. 
+    The task of the brain maturation experiments is configged via the dictionary of env_config.
+
+    Screens are rendered into a ring buffer of frames owned by the env, and dense observations
+    are read-only views into it. An observation stays unchanged at least until the next call
+    to reset(); copy it to keep it longer, or pass a larger "frame_buffer_size".
+
+    The core only depends on NumPy. Its gym spaces are built on first access, and the gym.Env
+    interface is added by rlbrainmaturation.envs.environment.Environment.
+    """
+
+    def __init__(self, env_config: Dict[str, Any]) -> None:
+        """Inits the env based on the env_config dictionary. 
+        Args:
+            env_config: Dict[str, Any]
+                Environment config dictionary, i.e. env_config = {"task": Task}. The task may
+                also be a TaskDescriptor (tasks.registry.describe_task), which is rebuilt from a
+                per-process cache and gives every (worker_index, vector_index) of RLlib its own
+                reproducible stream. An optional "rng" entry (np.random.Generator) sets the
+                stream of the randomized signals, which otherwise is a new stream spawned from
+                the task seed. An optional "observation_mode" entry selects the encoding of the
+                observation: "dense" (default) for the screen image, "coords" for a padded list
+                of lit (x, y) coordinates with a validity mask, "packed" for the np.packbits
+                bit-packed screen, "multires" for pooled views of the screen plus a foveal
+                crop around the last saccade, or "delta" for the pixels turned on and off since
+                the previous frame (decoded with DeltaDecoder), with the encoder options in
+                "observation_options". Only the dense mode renders dense screens; the other
+                modes cost O(number of signals) per step. If the task has a target distribution
+                (Task.set_target_distribution), every episode draws its own target and the cues
+                following it. An optional "frame_stack" entry k > 1 makes dense observations
+                (height, width, k) views of the last k frames, for agents without recurrence. An
+                optional "recorder" entry (TrajectoryRecorder) records every step to disk. The
+                frames without randomized signals are served from an EpisodeCache: the
+                process-wide default one, the one given as "episode_cache", or none if
+                "episode_cache" is False. An optional "profiler" entry (Profiler) times the
+                phases of step and reset, and of the task. Steps onto a frame identical to the
+                previous one, e.g. within a long epoch of Task.from_epochs, keep the previous
+                observation at O(1) cost. An optional "frame_skip" entry (bool) makes every step
+                advance through the whole run of identical frames it enters, with the number of
+                frames advanced in info["frames"].
+        """
+        # Brain maturation task, built here if given as a TaskDescriptor
+        self.task, rng = resolve_task(env_config)
+        height = self.task.height  # height_of_screen
+        width = self.task.width  # width_of_screen
+
+        # compiled per-frame stimulus schedule of the task
+        self.schedule = self.task.compile()
+        # observation is the image with only 1 color channel by default,
+        # or one of the compact encodings of it
+        self.observation_mode = env_config.get("observation_mode", "dense")
+        self.frame_stack = int(env_config.get("frame_stack", 1))
+        self.observation_options = env_config.get("observation_options", {})
+        self.encoder = make_encoder(
+            self.observation_mode,
+            width,
+            height,
+            self.schedule.max_signals,
+            frame_stack=self.frame_stack,
+            **self.observation_options,
+        )
+        # unchanged frames keep the previous observation when it depends on nothing else
+        self.reuse_unchanged = (
+            self.frame_stack == 1
+            and not self.encoder.needs_focus
+            and not self.encoder.stateful
+        )
+        # optionally, a step advances through the whole run of unchanged frames
+        self.frame_skip = bool(env_config.get("frame_skip", False))
+        # ring buffer of screens, large enough to keep every frame of an episode
+        # (including the blank frames padding the first frame stack) until the next reset
+        rendered = (
+            len(self.schedule.run_starts) if self.reuse_unchanged else self.task.tot_frames
+        )
+        capacity = max(
+            int(env_config.get("frame_buffer_size", 0)), rendered + self.frame_stack - 1
+        )
+        self.frames = FrameBuffer(height, width, capacity=capacity)
+        # precomputed read-only frames shared by every env of the same task
+        self._cache = resolve_cache(env_config.get("episode_cache"))
+        self.episode: Optional[CachedEpisode] = None
+        self._fetch_episode()
+        self.time = 0  # intial frame
+        self.focus = self._center()  # current focus point, i.e. the last action
+        # block sampler of the randomized signals, on its own stream of the task seed
+        if rng is None:
+            rng = self.task.spawn_rngs(1)[0]
+        self.sampler = self.schedule.sampler(rng)
+        # positions of the randomized signals in the current episode
+        self.random_positions = self.sampler.draw(1)[0]
+        # target of the current episode, drawn per episode in target-distribution mode
+        self.target = self._draw_target()
+        # optional on-disk record of the steps, with the episode id assigned on its first step
+        self.recorder: Optional[TrajectoryRecorder] = env_config.get("recorder")
+        if self.recorder is not None:
+            self._recorded_task = self.recorder.task_id(self.task)
+        self._episode: Optional[int] = None
+        self._pad_frame_stack()
+        self.observation = self._observe(self.time)  # screen output
+        # optional instrumentation, which leaves the methods untouched when disabled
+        profiler: Optional[Profiler] = env_config.get("profiler")
+        if profiler is not None:
+            self._instrument(profiler)
+
+    @cached_property
+    def action_space(self) -> spaces.Space:
+        """Action space, defined based on where the object would be moved to.
+        """
+        from gym import spaces
+
+        return spaces.Tuple(
+            (spaces.Discrete(self.task.width), spaces.Discrete(self.task.height))
+        )
+
+    @cached_property
+    def observation_space(self) -> spaces.Space:
+        """Observation space of the observation mode.
+        """
+        return self.encoder.space()
+
+    def step(self, action: Tuple[int, int]) -> Tuple[Any, float, bool, Dict]:
+        """Updates the env state/observation based on the action taken by the agent.
+        In this base environment, agent's action won't change the environment during 
+        simple brain maturation tasks. As a result, the environment will only change
+        according to the instructions predefined by the input task/rule.
+
+        Args:
+            action: Tuple[int, int]
+                Action output by the RL agent. The action is the position where the 
+                agent is looking to. 
+
+        """
+        seen, previous = self._lit, self.time
+        self.time += 1
+        changed = True
+        if self.time < self.schedule.tot_frames:
+            changed = bool(self.schedule.changes[self.time])
+            if self.frame_skip:
+                self.time = int(self.schedule.run_end[self.time])
+        self.focus = action
+        # only update according to the task rather than agent's action
+        if changed or not self.reuse_unchanged:
+            self.observation = self._observe(self.time)
+        done = self.time >= self.task.tot_frames - 1
+        # reward = self.task.score(action) if done else 0.0
+        reward = self.task.score(action, self.time, self.target)
+        if self.recorder is not None:
+            self._record(previous, action, reward, seen)
+        info = {"frames": self.time - previous} if self.frame_skip else {}
+        return (
+            self.observation,
+            reward,
+            done,
+            info,
+        )  # return observation, reward, done, info
+
+    def reset(self) -> Any:
+        """Reset the env to the initial config.
+        """
+        self.time = 0
+        self.focus = self._center()
+        if self.task.revision != self._task_revision:
+            self._fetch_episode()  # the target distribution changed since the last episode
+        self.random_positions = self.sampler.draw(1)[0]
+        self.target = self._draw_target()
+        self._episode = None
+        self.encoder.reset_episodes()
+        self._pad_frame_stack()
+        self.observation = self._observe(self.time)
+        return self.observation
+
+    def rollout(
+        self, policy_fn: Callable[[Any, np.ndarray], np.ndarray], n_episodes: int
+    ) -> Dict[str, Any]:
+        """Runs n_episodes whole episodes of the task in one call, in lockstep.
+
+        The policy is only called once per time step, on the batched observations of every
+        episode. When the observation does not depend on the actions (every mode but
+        "multires", which follows the focus, and the stateful "delta"), the frames of all
+        time steps are rendered and encoded up front in one batch, stacked like step does
+        when frame_stack > 1, and all rewards are scored in one call after the last step.
+        Other modes step a VectorEnvironment. The env's own episode is left untouched; the
+        episodes draw their randomized signals and targets from its stream.
+
+        Args:
+            policy_fn: Callable[[Any, np.ndarray], np.ndarray]
+                Maps the batched observations of a time step and the (n_episodes,) array of
+                their time to the (n_episodes, 2) actions, as in evaluation.harness.evaluate.
+            n_episodes: int
+                Number of episodes.
+
+        Returns:
+            {"observations": (T, n_episodes, ...) observations of the frames 0 to T - 1, as an
+            array or a dict of arrays like the observation mode, "actions": (T - 1,
+            n_episodes, 2) actions, "rewards" and "dones": (T - 1, n_episodes) arrays, and
+            "targets": (n_episodes, 2) targets}, where T is tot_frames.
+        """
+        steps = self.task.tot_frames - 1
+        encoder = self.encoder
+        if encoder.needs_focus or encoder.stateful:
+            return self._rollout_steps(policy_fn, n_episodes)
+        rng = self.sampler.rng
+        positions = self.sampler.draw(n_episodes)
+        targets = self.task.sample_targets(n_episodes, rng)
+        # every frame of every episode, time-major: entry t * n_episodes + i
+        n_frames = (steps + 1) * n_episodes
+        lit = self.schedule.frame_coordinates(
+            np.repeat(np.arange(steps + 1), n_episodes),
+            np.tile(positions, (steps + 1, 1, 1)),
+            None if self.task.targets is None else np.tile(targets, (steps + 1, 1)),
+        )
+        frames = None
+        if encoder.needs_frames:
+            frames = np.zeros((n_frames, self.task.height, self.task.width, 1), dtype=np.uint8)
+            frames[lit[0], lit[1], lit[2], 0] = 1
+        encoded = encoder.encode(frames, lit, np.zeros((n_frames, 2), dtype=np.int64))
+        observations = _split_time(encoded, steps + 1, n_episodes)
+        if self.frame_stack > 1:
+            observations = _stack_frames(observations, self.frame_stack)
+
+        actions = np.zeros((steps, n_episodes, 2), dtype=np.int64)
+        for t in range(steps):
+            time = np.full(n_episodes, t)
+            observation = _index_time(observations, t)
+            actions[t] = np.asarray(policy_fn(observation, time)).reshape(n_episodes, 2)
+        times = np.arange(1, steps + 1)[:, None]
+        rewards = self.task.score_batch(
+            actions, times, None if self.task.targets is None else targets
+        )
+        return {
+            "observations": observations,
+            "actions": actions,
+            "rewards": rewards,
+            "dones": np.broadcast_to(times >= steps, (steps, n_episodes)).copy(),
+            "targets": targets,
+        }
+
+    def _rollout_steps(
+        self, policy_fn: Callable[[Any, np.ndarray], np.ndarray], n_episodes: int
+    ) -> Dict[str, Any]:
+        """Helper function that runs the rollout on a VectorEnvironment, for observations
+        that depend on the actions.
+        """
+        from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+
+        steps = self.task.tot_frames - 1
+        env = VectorEnvironment(
+            {
+                "task": self.task,
+                "num_envs": n_episodes,
+                "rng": self.sampler.rng,
+                "observation_mode": self.observation_mode,
+                "observation_options": self.observation_options,
+            }
+        )
+        targets = env.targets.copy()
+        observations = [_copy_observation(env.reset())]
+        actions = np.zeros((steps, n_episodes, 2), dtype=np.int64)
+        rewards = np.zeros((steps, n_episodes))
+        dones = np.zeros((steps, n_episodes), dtype=bool)
+        for t in range(steps):
+            actions[t] = np.asarray(policy_fn(observations[-1], env.times.copy())).reshape(
+                n_episodes, 2
+            )
+            observation, rewards[t], dones[t], info = env.step(actions[t])
+            # every episode ends at the last step, and the env starts the next ones
+            observations.append(
+                info["final_observation"] if t == steps - 1 else _copy_observation(observation)
+            )
+        return {
+            "observations": _stack_time(observations),
+            "actions": actions,
+            "rewards": rewards,
+            "dones": dones,
+            "targets": targets,
+        }
+
+    def _fetch_episode(self) -> None:
+        """Helper function that gets the cached frames of the task in its current target mode.
+        """
+        self._task_revision = self.task.revision
+        if self._cache is not None:
+            self.episode = self._cache.get(self.task, self.frame_stack)
+
+    def _observe(self, time: int) -> Any:
+        """Helper function that renders the screen at time and encodes it in the observation mode.
+        """
+        lit = self._lit = self._lit_pixels(time)
+        frame = self._update_observation(time, lit) if self.encoder.needs_frames else None
+        return self.encoder.encode_one(frame, lit, self.focus)
+
+    def _center(self) -> Tuple[int, int]:
+        """Helper function that returns the center of the screen, the focus before any saccade.
+        """
+        return self.task.width // 2, self.task.height // 2
+
+    def _lit_pixels(self, time: int) -> LitPixels:
+        """Helper function that lists the (episode index, x, y) of the pixels lit at time.
+        """
+        if self.episode is not None and self.episode.serves(time):
+            return self.episode.lit[time]
+        if time >= self.schedule.tot_frames:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return self.schedule.frame_coordinates(
+            np.array([time]),
+            self.random_positions[None],
+            None if self.task.targets is None else np.array([self.target]),
+        )
+
+    def _draw_target(self) -> Tuple[int, int]:
+        """Helper function that draws the target of a new episode.
+        """
+        if self.task.targets is None:
+            return self.task.target_pos
+        x, y = self.task.sample_targets(1, self.sampler.rng)[0]
+        return int(x), int(y)
+
+    def _record(
+        self, time: int, action: Tuple[int, int], reward: float, seen: LitPixels
+    ) -> None:
+        """Helper function that records a step with the frame the action was taken on.
+        """
+        if self._episode is None:
+            self._episode = self.recorder.new_episode()
+        self.recorder.record(
+            self._episode,
+            time,
+            self._recorded_task,
+            action,
+            self.target,
+            reward,
+            seen[1],
+            seen[2],
+        )
+
+    def _instrument(self, profiler: Profiler) -> None:
+        """Helper function that attaches profiler to the hot paths of the env and of its task.
+        The task is profiled for every env sharing it.
+        """
+        sampler = self.sampler
+        profiler.instrument(self, "step", "env.step", counter="steps")
+        profiler.instrument(self, "reset", "env.reset", counter="resets")
+        profiler.instrument(self, "_lit_pixels", "env.instructions")
+        profiler.instrument(self, "_update_observation", "env.render")
+        profiler.instrument(
+            self.frames,
+            "write",
+            "env.render.write",
+            counter="pixels_written",
+            amount=lambda x, y: len(x),
+        )
+        profiler.instrument(self.encoder, "encode_one", "env.encode")
+        profiler.instrument(sampler, "draw", "env.rng")
+        profiler.instrument(
+            sampler,
+            "_draw_block",
+            "env.rng.generator",
+            counter="rng_draws",
+            amount=lambda n: 2 * n * len(sampler.scale),
+        )
+        if self.recorder is not None:
+            profiler.instrument(self.recorder, "record", "env.record")
+        profiler.instrument(self.task, "compile", "task.compile")
+        profiler.instrument(self.task, "issue_instruction", "task.issue_instruction")
+        profiler.instrument(self.task, "score", "task.score")
+
+    def _pad_frame_stack(self) -> None:
+        """Helper function that writes blank frames so the first stack of an episode is padded.
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        for _ in range(self.frame_stack - 1):
+            self.frames.write(empty, empty)
+
+    def _update_observation(
+        self, time: int, lit: Optional[LitPixels] = None
+    ) -> np.ndarray:
+        """Helper function that updates the observation (screen output)
+        Args:
+            time: int
+                The time step to update the observation
+            lit: Optional[LitPixels]
+                Pixels lit at time, if already known.
+
+        Returns:
+            Read-only view of the new screen in the frame buffer or in the episode cache, or of
+            the frame stack.
+        """
+        if self.episode is not None and self.episode.serves(time):
+            return self.episode.observation(time)
+        if lit is None:
+            lit = self._lit_pixels(time)
+        observation = self.frames.write(lit[1], lit[2])
+        if self.frame_stack > 1:
+            observation = self.frames.stacked(self.frame_stack)
+        return observation
+
+
+def _split_time(observation: Any, steps: int, n: int) -> Any:
+    """Helper function that reshapes a time-major batch of steps * n observations into
+    (steps, n, ...) arrays, copied out of the arrays the encoder may reuse.
+    """
+    if isinstance(observation, dict):
+        return {key: _split_time(value, steps, n) for key, value in observation.items()}
+    return observation.reshape((steps, n) + observation.shape[1:]).copy()
+
+
+def _stack_frames(frames: np.ndarray, k: int) -> np.ndarray:
+    """Helper function that turns (steps, n, height, width, 1) frames into the (steps, n,
+    height, width, k) stacks of the last k frames, padded with blank frames at the start of
+    the episodes as in step.
+    """
+    steps = len(frames)
+    padded = np.zeros((k - 1 + steps,) + frames.shape[1:-1], dtype=frames.dtype)
+    padded[k - 1 :] = frames[..., 0]
+    return np.stack([padded[j : j + steps] for j in range(k)], axis=-1)
+
+
+def _index_time(observations: Any, t: int) -> Any:
+    """Helper function that selects the observations of time step t.
+    """
+    if isinstance(observations, dict):
+        return {key: value[t] for key, value in observations.items()}
+    return observations[t]
+
+
+def _copy_observation(observation: Any) -> Any:
+    """Helper function that copies a batched observation out of the arrays the env reuses.
+    """
+    if isinstance(observation, dict):
+        return {key: value.copy() for key, value in observation.items()}
+    return observation.copy()
+
+
+def _stack_time(observations: List[Any]) -> Any:
+    """Helper function that stacks the batched observations of every time step.
+    """
+    if isinstance(observations[0], dict):
+        return {key: np.stack([o[key] for o in observations]) for key in observations[0]}
+    return np.stack(observations)
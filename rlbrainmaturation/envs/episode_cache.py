@@ -0,0 +1,140 @@
+from __future__ import annotations
+from collections import OrderedDict
+import numpy as np
+from rlbrainmaturation.envs.observation import LitPixels
+from rlbrainmaturation.tasks.task import Task
+from typing import List, Optional, Tuple
+
+
+class CachedEpisode:
+    """Precomputed, read-only screens of the frames of a task that hold no randomized signal.
+
+    The frames are stored once, so that the observation of any cached frame is a view: the
+    screen of its run of unchanged frames, or, when frames are stacked, the slice of the last
+    frame_stack frames, preceded by the frame_stack - 1 blank frames padding the first stack of
+    an episode. A deterministic task is cached whole,
+    while a task with random signals only has its fixed-only frames served from here.
+    """
+
+    def __init__(self, task: Task, frame_stack: int = 1) -> None:
+        """
+        Args:
+            task: Task
+                The task whose frames are precomputed.
+            frame_stack: int
+                Number of latest frames in one observation.
+        """
+        schedule = task.compile()
+        self.frame_stack = frame_stack
+        self.deterministic = not schedule.has_random
+        # frames without randomized signals, nor cues following per-episode targets
+        self.static = ~schedule.random_mask.any(axis=1)
+        if task.targets is not None:
+            self.static &= ~schedule.target_dependent
+        # row of the frames array showing every frame: without stacking, one screen per run
+        # of unchanged frames is kept, so long schedules cost as much as their runs
+        if frame_stack == 1:
+            frames = schedule.run_template[..., None]
+            self.rows = schedule.frame_run
+        else:
+            frames = np.zeros(
+                (frame_stack - 1 + schedule.tot_frames, task.height, task.width, 1),
+                dtype=np.uint8,
+            )
+            frames[frame_stack - 1 :, :, :, 0] = schedule.template
+            frames.flags.writeable = False
+            self.rows = np.arange(schedule.tot_frames)
+        self.frames = frames
+        # lit pixels of every frame, as rendered from the fixed signals only
+        run_lit: List[LitPixels] = []
+        for t in schedule.run_starts:
+            mask = schedule.fixed_mask[t]
+            x, y = schedule.fixed_x[t][mask], schedule.fixed_y[t][mask]
+            for array in (x, y):
+                array.flags.writeable = False
+            run_lit.append((np.zeros(len(x), dtype=np.int64), x, y))
+        self.lit: List[LitPixels] = [run_lit[run] for run in schedule.frame_run]
+        self.nbytes = frames.nbytes
+
+    def serves(self, time: int) -> bool:
+        """Whether the observation at time can be served from the cache. Frame stacks of tasks
+        with random signals mix cached and random frames, so only deterministic tasks serve them.
+        """
+        return (
+            time < len(self.static)
+            and self.static[time]
+            and (self.frame_stack == 1 or self.deterministic)
+        )
+
+    def observation(self, time: int) -> np.ndarray:
+        """Read-only view of the (height, width, 1) frame, or (height, width, k) frame stack.
+        """
+        if self.frame_stack == 1:
+            return self.frames[self.rows[time]]
+        return self.frames[time : time + self.frame_stack, :, :, 0].transpose(1, 2, 0)
+
+
+class EpisodeCache:
+    """Bounded LRU cache of CachedEpisode, keyed by task fingerprint and frame stack.
+
+    Tasks built with the same parameters share one entry, so every env of a sweep or of a pool
+    of RLlib workers renders a given task only once per process. The least recently used
+    entries are evicted once more than max_entries are held.
+    """
+
+    def __init__(self, max_entries: int = 128) -> None:
+        """
+        Args:
+            max_entries: int
+                Maximum number of cached tasks.
+        """
+        assert max_entries >= 1, "The episode cache has to hold at least one entry"
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Tuple[str, int], CachedEpisode] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task: Task, frame_stack: int = 1) -> CachedEpisode:
+        """Returns the cached frames of task, computing them on a miss.
+        """
+        key = (task.fingerprint(), frame_stack)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = self._entries[key] = CachedEpisode(task, frame_stack)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        """Drops every entry.
+        """
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the cached frames.
+        """
+        return sum(entry.nbytes for entry in self._entries.values())
+
+
+# cache shared by the envs of a process unless env_config provides its own
+DEFAULT_EPISODE_CACHE = EpisodeCache()
+
+
+def resolve_cache(cache: Optional[object]) -> Optional[EpisodeCache]:
+    """Resolves the "episode_cache" entry of env_config: None selects the shared default cache,
+    False disables caching, and an EpisodeCache is used as is.
+    """
+    if cache is None:
+        return DEFAULT_EPISODE_CACHE
+    if cache is False:
+        return None
+    assert isinstance(cache, EpisodeCache), "episode_cache has to be an EpisodeCache or False"
+    return cache
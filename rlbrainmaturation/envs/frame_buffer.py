@@ -0,0 +1,67 @@
+from __future__ import annotations
+import numpy as np
+from typing import List, Tuple
+
+
+class FrameBuffer:
+    """Preallocated ring buffer of screens owned by an environment.
+
+    Writing a frame reuses the oldest slot of the ring and clears only the pixels that slot
+    had lit, so rendering costs O(number of signals) and never allocates. Every slot is kept
+    twice, at i and i + capacity, so the last k frames are always one contiguous slice and a
+    frame stack is a view rather than a copy.
+
+    Views handed out by write() and stacked() are read-only. A frame stays unchanged for the
+    next capacity - 1 writes, and a stack of k frames for the next capacity - k writes.
+    """
+
+    def __init__(self, height: int, width: int, capacity: int = 2) -> None:
+        """
+        Args:
+            height: int
+                The height of the screen. The unit of height is pixel.
+            width: int
+                The width of the screen. The unit of width is pixel.
+            capacity: int
+                Number of frames kept in the ring.
+        """
+        assert capacity >= 1, "Capacity of the frame buffer has to be positive"
+        self.capacity = capacity
+        self._frames = np.zeros((2 * capacity, height, width, 1), dtype=np.uint8)
+        empty = np.zeros(0, dtype=np.int64)
+        # pixels lit in every slot, so only they need to be cleared on reuse
+        self._lit: List[Tuple[np.ndarray, np.ndarray]] = [(empty, empty)] * capacity
+        self._index = capacity - 1  # slot of the latest frame
+
+    def write(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Writes the next frame, lit at the given pixels, into the oldest slot of the ring.
+        Args:
+            x: np.ndarray
+                The first (row) index of every lit pixel.
+            y: np.ndarray
+                The second (column) index of every lit pixel.
+
+        Returns:
+            Read-only (height, width, 1) view of the new frame.
+        """
+        i = (self._index + 1) % self.capacity
+        rows = (i, i + self.capacity)
+        old_x, old_y = self._lit[i]
+        for row in rows:
+            self._frames[row, old_x, old_y, 0] = 0
+            self._frames[row, x, y, 0] = 1
+        self._lit[i] = (x, y)
+        self._index = i
+
+        frame = self._frames[i]
+        frame.flags.writeable = False
+        return frame
+
+    def stacked(self, k: int) -> np.ndarray:
+        """Read-only (height, width, k) view of the last k frames, the latest one last.
+        """
+        assert 1 <= k <= self.capacity, "Cannot stack more frames than the buffer keeps"
+        end = self._index + self.capacity + 1
+        frames = self._frames[end - k : end, :, :, 0].transpose(1, 2, 0)
+        frames.flags.writeable = False
+        return frames
@@ -0,0 +1,369 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.envs.observation import LitPixels, make_encoder
+from rlbrainmaturation.tasks.registry import resolve_task
+from rlbrainmaturation.tasks.schedule import StackedSchedule
+from rlbrainmaturation.tasks.task import StackedScorer, Task
+from rlbrainmaturation.utils.general_utils import cached_property
+from rlbrainmaturation.utils.profiling import Profiler
+from typing import Any, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from gym import spaces
+
+# number of episodes whose tasks are drawn per call into the generator
+TASK_BLOCK_SIZE = 4096
+
+
+class MultiTaskVectorEnvironment:
+    """Batched environment whose slots run episodes drawn from a weighted mixture of tasks.
+
+    The compiled schedules and reward kernels of the tasks are stacked into tables indexed by
+    task id (StackedSchedule and StackedScorer), so one step renders, encodes and scores the
+    whole mixture with the same handful of NumPy operations as VectorEnvironment runs for a
+    single task, and steps onto unchanged frames keep the previous observation, as
+    VectorEnvironment does. Every episode is padded to the longest tot_frames of the mixture
+    with blank frames: all slots finish together, and info["valid"] masks out the padded
+    steps, which are never rewarded. When a slot is reset, its next task is drawn from the
+    mixture.
+
+    Observations are dicts with the encoding of the screen (under "screen" for the array
+    encodings, or with its own keys for the dict encodings) and the one-hot (num_envs,
+    num_tasks) "rule" input identifying the task of every slot. All tasks need the same screen
+    size.
+    """
+
+    def __init__(self, env_config: Dict[str, Any]) -> None:
+        """Inits the batched env based on the env_config dictionary.
+        Args:
+            env_config: Dict[str, Any]
+                Environment config dictionary, i.e. env_config = {"tasks": {name: Task},
+                "num_envs": int}. The tasks may also be given as a list, or as
+                TaskDescriptors. An optional "weights" entry ({name: weight} or a list) sets
+                the mixture, uniform by default. An optional "rng" entry (np.random.Generator)
+                sets the stream of the mixture, of the randomized signals and of the targets.
+                "observation_mode" and "observation_options" select the encoding of the screen,
+                and the optional "profiler" and "frame_skip" entries work as in
+                VectorEnvironment. A skip never passes the last frame of a task.
+        """
+        tasks = env_config.get("tasks")
+        if not isinstance(tasks, dict):
+            names = [_task_name(task) for task in tasks]
+            tasks = {
+                name if names.count(name) == 1 else f"{name}_{i}": task
+                for i, (name, task) in enumerate(zip(names, tasks))
+            }
+        self.task_names: List[str] = list(tasks)
+        self.tasks: List[Task] = [resolve_task({"task": task})[0] for task in tasks.values()]
+        assert self.tasks, "The mixture needs at least one task"
+        width, height = self.tasks[0].width, self.tasks[0].height
+        assert all(
+            (task.width, task.height) == (width, height) for task in self.tasks
+        ), "All tasks of the mixture need the same screen size"
+        self.width, self.height = width, height
+        self.num_tasks = len(self.tasks)
+        self.num_envs = int(env_config.get("num_envs", 1))
+
+        weights = env_config.get("weights")
+        if weights is None:
+            weights = np.ones(self.num_tasks)
+        elif isinstance(weights, dict):
+            weights = [weights.get(name, 0.0) for name in self.task_names]
+        weights = np.asarray(weights, dtype=np.float64)
+        assert len(weights) == self.num_tasks and (weights >= 0).all() and weights.sum() > 0
+        self.weights = weights / weights.sum()
+
+        schedules = [task.compile() for task in self.tasks]
+        self.schedule = StackedSchedule(schedules)
+        # every episode lasts as long as the longest task of the mixture
+        self.tot_frames = self.schedule.tot_frames
+        # reward of every focus offset from the target, per task
+        self.scorer = StackedScorer(self.tasks)
+
+        self.observation_mode = env_config.get("observation_mode", "dense")
+        self.encoder = make_encoder(
+            self.observation_mode,
+            width,
+            height,
+            self.schedule.max_signals,
+            **env_config.get("observation_options", {}),
+        )
+
+        rng = env_config.get("rng")
+        if rng is None:
+            rng = self.tasks[0].spawn_rngs(1)[0]
+        self.rng = rng
+        self.samplers = [schedule.sampler(rng) for schedule in schedules]
+        self._cumulative_weights = np.cumsum(self.weights)
+        self._task_block = np.zeros(0, dtype=np.int64)
+        self._task_cursor = 0
+        # targets the tasks were built with
+        self._task_targets = np.array([task.target_pos for task in self.tasks], dtype=np.int64)
+        self._track_targets()
+        self._rule_rows = np.eye(self.num_tasks, dtype=np.uint8)
+
+        # task of the current episode of every slot
+        self.task_ids = np.zeros(self.num_envs, dtype=np.int64)
+        # target of the current episode of every slot
+        self.targets = np.zeros((self.num_envs, 2), dtype=np.int64)
+        # positions of the randomized signals of the current episode of every slot
+        self.random_positions = np.zeros(
+            (self.num_envs, self.schedule.num_random, 2), dtype=np.int64
+        )
+        self.observations = np.zeros(
+            (self.num_envs if self.encoder.needs_frames else 0, height, width, 1),
+            dtype=np.uint8,
+        )
+        self.rules = np.zeros((self.num_envs, self.num_tasks), dtype=np.uint8)
+        self.focus = np.tile([width // 2, height // 2], (self.num_envs, 1))
+        self.times = np.zeros(self.num_envs, dtype=np.int64)  # current frame of each slot
+        # first row of the stacked tables and last frame of the task of every slot
+        self._first_rows = np.zeros(self.num_envs, dtype=np.int64)
+        self._last_frames = np.zeros(self.num_envs, dtype=np.int64)
+        # steps onto frames identical for every slot keep the previous observation
+        self.reuse_unchanged = not self.encoder.needs_focus and not self.encoder.stateful
+        self.frame_skip = bool(env_config.get("frame_skip", False))
+        self._slots = np.arange(self.num_envs)
+        empty = np.zeros(0, dtype=np.int64)
+        self._lit = (empty, empty, empty)
+        profiler: Optional[Profiler] = env_config.get("profiler")
+        if profiler is not None:
+            self._instrument(profiler)
+        self.reset()
+
+    @cached_property
+    def single_action_space(self) -> spaces.Space:
+        """Action space of a single episode, matching Environment.
+        """
+        from gym import spaces
+
+        return spaces.Tuple((spaces.Discrete(self.width), spaces.Discrete(self.height)))
+
+    @cached_property
+    def single_observation_space(self) -> spaces.Space:
+        """Observation space of a single episode: the screen encoding plus the rule input.
+        """
+        from gym import spaces
+
+        screen = self.encoder.space()
+        entries = dict(screen.spaces) if isinstance(screen, spaces.Dict) else {"screen": screen}
+        entries["rule"] = spaces.MultiBinary(self.num_tasks)
+        return spaces.Dict(entries)
+
+    @cached_property
+    def action_space(self) -> spaces.Space:
+        """Batched action space of (num_envs, 2) saccade positions.
+        """
+        from gym import spaces
+
+        return spaces.Box(
+            low=0,
+            high=max(self.width, self.height) - 1,
+            shape=(self.num_envs, 2),
+            dtype=np.int64,
+        )
+
+    @cached_property
+    def observation_space(self) -> spaces.Space:
+        """Batched observation space, with num_envs as the leading dimension.
+        """
+        from gym import spaces
+
+        screen = self.encoder.batch_space(self.num_envs)
+        entries = dict(screen.spaces) if isinstance(screen, spaces.Dict) else {"screen": screen}
+        entries["rule"] = spaces.MultiBinary([self.num_envs, self.num_tasks])
+        return spaces.Dict(entries)
+
+    @property
+    def lit(self) -> LitPixels:
+        """(slot index, x, y) of every pixel lit in the current frames of the slots.
+        """
+        return self._lit
+
+    @property
+    def valid(self) -> np.ndarray:
+        """Whether the current frame of every slot is a frame of its task, not padding.
+        """
+        return self.times <= self._last_frames
+
+    def step(
+        self, actions: Union[np.ndarray, List[Tuple[int, int]]]
+    ) -> Tuple[Dict[str, np.ndarray], np.ndarray, np.ndarray, Dict]:
+        """Advances every slot by one frame.
+
+        Args:
+            actions: Union[np.ndarray, List[Tuple[int, int]]]
+                Array-like of shape (num_envs, 2) with the (x, y) position each agent is looking to.
+
+        Returns:
+            observations, rewards, dones and info, as in VectorEnvironment.step. info["valid"]
+            flags the slots whose step belongs to their task rather than to the padding, and
+            info["task_ids"] holds the task of the episode of every slot at this step.
+        """
+        actions = np.asarray(actions).reshape(self.num_envs, 2)
+        previous = self.times.copy() if self.frame_skip else None
+        self.times += 1
+        schedule = self.schedule
+        rows = self._first_rows + self.times
+        changed = schedule.changes[rows].any()
+        if self.frame_skip:
+            self.times = schedule.run_end[rows]
+        self.focus[:] = actions
+        info: Dict[str, Any] = {"valid": self.valid, "task_ids": self.task_ids.copy()}
+        rewards = self.scorer.score_batch(
+            self.task_ids, actions, self.times, self.targets, self._last_frames
+        )
+        dones = self.times >= self.tot_frames - 1
+
+        if self.frame_skip:
+            info["frames"] = self.times - previous
+        if not changed and self.reuse_unchanged and not dones.any():
+            return self._observation, rewards, dones, info
+        self._render()
+        if dones.any():
+            final = self._encode(peek=True)
+            info["final_observation"] = {key: value[dones] for key, value in final.items()}
+            self.times[dones] = 0
+            self.encoder.reset_episodes(dones)
+            self._render(reset_slots=dones)
+        self._observation = self._encode()
+        return self._observation, rewards, dones, info
+
+    def reset(self, indices: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Resets all slots, or only the slots selected by indices, to the initial frame of a
+        task newly drawn from the mixture.
+        Args:
+            indices: Optional[np.ndarray]
+                Integer indices or boolean mask of the slots to reset. Default resets every slot.
+        """
+        if indices is None:
+            indices = self._slots
+        self.times[indices] = 0
+        self.focus[indices] = (self.width // 2, self.height // 2)
+        self.encoder.reset_episodes(indices)
+        self._render(reset_slots=indices)
+        self._observation = self._encode()
+        return self._observation
+
+    def _render(self, reset_slots: Optional[np.ndarray] = None) -> None:
+        """Helper function that redraws the frame of every slot at its current time, drawing
+        the task, randomized signals and target of the slots starting a new episode first.
+        """
+        if reset_slots is not None:
+            self._draw_episodes(self._slots[reset_slots])
+        lit = self.schedule.frame_coordinates(
+            self.task_ids,
+            self.times,
+            self.random_positions,
+            self.targets if self._moving_targets else None,
+            rows=self._first_rows + self.times,
+        )
+        if self.encoder.needs_frames:
+            obs = self.observations
+            obs[self._lit[0], self._lit[1], self._lit[2], 0] = 0
+            obs[lit[0], lit[1], lit[2], 0] = 1
+        self._lit = lit
+
+    def _draw_episodes(self, slots: np.ndarray) -> None:
+        """Helper function that draws the tasks of new episodes in slots, then the randomized
+        signals and targets of the tasks drawing them, with one draw per task.
+        """
+        if [task.revision for task in self.tasks] != self._task_revisions:
+            self._track_targets()  # a target distribution changed since the last episode
+        task_ids = self._next_task_ids(len(slots))
+        if len(slots) == self.num_envs:
+            slots = self._slots  # every slot restarts, so whole arrays are written
+            self.rules[:] = self._rule_rows[task_ids]
+            self.task_ids[:] = task_ids
+            self.targets[:] = self._task_targets[task_ids]
+        else:
+            self.rules[slots] = self._rule_rows[task_ids]
+            self.task_ids[slots] = task_ids
+            self.targets[slots] = self._task_targets[task_ids]
+        # per-slot lookups of the task tables, kept for the steps of the episode
+        self._first_rows[slots] = task_ids * self.tot_frames
+        self._last_frames[slots] = self.schedule.task_frames[task_ids] - 1
+        for k in self._drawn_tasks:
+            group = slots[task_ids == k]
+            if not len(group):
+                continue
+            task = self.tasks[k]
+            if task.targets is not None:
+                self.targets[group] = task.sample_targets(len(group), self.rng)
+            num_random = self.samplers[k].scale.shape[0]
+            if num_random:
+                self.random_positions[group, :num_random] = self.samplers[k].draw(len(group))
+
+    def _track_targets(self) -> None:
+        """Helper function that lists the tasks drawing targets or random signals in the current
+        target mode of every task.
+        """
+        self._task_revisions = [task.revision for task in self.tasks]
+        self._drawn_tasks = [
+            k
+            for k, task in enumerate(self.tasks)
+            if task.targets is not None or self.samplers[k].scale.shape[0]
+        ]
+        # without target distributions, the cues are gathered as compiled
+        self._moving_targets = any(task.targets is not None for task in self.tasks)
+
+    def _next_task_ids(self, n: int) -> np.ndarray:
+        """Helper function that returns the tasks of the next n episodes, drawn from the mixture
+        in blocks of episodes like the randomized signals (see SignalPositionSampler).
+        """
+        if self.num_tasks == 1:
+            return np.zeros(n, dtype=np.int64)
+        available = len(self._task_block) - self._task_cursor
+        if n > available:
+            uniform = self.rng.random(max(TASK_BLOCK_SIZE, n - available))
+            block = np.searchsorted(self._cumulative_weights, uniform, side="right")
+            self._task_block = np.concatenate(
+                [self._task_block[self._task_cursor :], np.minimum(block, self.num_tasks - 1)]
+            )
+            self._task_cursor = 0
+        task_ids = self._task_block[self._task_cursor : self._task_cursor + n]
+        self._task_cursor += n
+        return task_ids
+
+    def _instrument(self, profiler: Profiler) -> None:
+        """Helper function that attaches profiler to the hot paths of the env, as
+        VectorEnvironment does. Steps and resets are counted per slot.
+        """
+        profiler.instrument(
+            self, "step", "multitask.step", counter="steps", amount=lambda a: self.num_envs
+        )
+        profiler.instrument(
+            self,
+            "reset",
+            "multitask.reset",
+            counter="resets",
+            amount=lambda indices=None: (
+                self.num_envs if indices is None else len(self._slots[indices])
+            ),
+        )
+        profiler.instrument(
+            self,
+            "_render",
+            "multitask.render",
+            counter="pixels_written",
+            amount=lambda reset_slots=None: len(self._lit[0]),
+        )
+        profiler.instrument(self, "_encode", "multitask.encode")
+        profiler.instrument(self, "_draw_episodes", "multitask.rng")
+        profiler.instrument(self.scorer, "score_batch", "multitask.score_batch")
+
+    def _encode(self, peek: bool = False) -> Dict[str, np.ndarray]:
+        """Helper function that encodes the frames of every slot and adds the rule inputs.
+        """
+        frames = self.observations if self.encoder.needs_frames else None
+        encode = self.encoder.peek if peek else self.encoder.encode
+        screen = encode(frames, self._lit, self.focus)
+        observation = dict(screen) if isinstance(screen, dict) else {"screen": screen}
+        observation["rule"] = self.rules
+        return observation
+
+
+def _task_name(task: Any) -> str:
+    """Helper function that names a task of a mixture given as a list.
+    """
+    return getattr(task, "name", type(task).__name__)
@@ -0,0 +1,544 @@
+from __future__ import annotations
+import numpy as np
+from typing import Any, Dict, Optional, Sequence, Tuple, Type, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from gym import spaces
+
+# (episode index, x, y) arrays of the lit pixels of a batch of frames
+LitPixels = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class ObservationEncoder:
+    """Base class of the observation encodings of the environments.
+
+    An encoder turns a batch of rendered frames, together with the coordinates of their lit
+    pixels, into the observation handed to the agent. Every encoding works on a leading batch
+    dimension, so Environment uses it with a batch of one and VectorEnvironment with num_envs.
+
+    Encodings that do not read the dense frames are computed from the lit pixels alone, so
+    their cost grows with the number of signals rather than with the screen area, and the envs
+    skip rendering dense screens for them. Their arrays may be owned by the encoder and
+    overwritten by the next call to encode.
+    """
+
+    # whether encode needs the lit pixels rather than only the dense frames
+    needs_coordinates = False
+    # whether encode reads the dense frames, which the envs only render when needed
+    needs_frames = True
+    # whether the observation depends on the focus points, i.e. on the actions
+    needs_focus = False
+    # whether encode depends on the previously encoded frames
+    stateful = False
+
+    def __init__(
+        self, width: int, height: int, max_signals: int, frame_stack: int = 1
+    ) -> None:
+        """
+        Args:
+            width: int
+                The width of the screen. The unit of width is pixel.
+            height: int
+                The height of the screen. The unit of height is pixel.
+            max_signals: int
+                Maximum number of lit pixels on any frame of the task.
+            frame_stack: int
+                Number of latest frames in one observation. Only the dense encoding stacks frames.
+        """
+        self.width = width
+        self.height = height
+        self.max_signals = max(max_signals, 1)
+        self.frame_stack = frame_stack
+
+    def space(self) -> spaces.Space:
+        """Observation space of a single episode. gym is only imported when a space is built.
+        """
+        raise NotImplementedError
+
+    def batch_space(self, n: int) -> spaces.Space:
+        """Observation space of a batch of n episodes, with n as the leading dimension.
+        """
+        return _batch_space(self.space(), n)
+
+    def encode(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> Any:
+        """Encodes a batch of frames.
+        Args:
+            frames: Optional[np.ndarray]
+                uint8 array of shape (n, height, width, 1) with the rendered screens. Only read
+                when needs_frames, and None otherwise.
+            lit: Tuple[np.ndarray, np.ndarray, np.ndarray]
+                (episode index, x, y) of every lit pixel. Only read when needs_coordinates.
+            focus: Optional[np.ndarray]
+                Integer array of shape (n, 2) with the current focus point of every episode,
+                i.e. its last action. Only read by foveated encodings.
+        """
+        raise NotImplementedError
+
+    def peek(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> Any:
+        """Encodes a batch of frames like encode, but without advancing the state of stateful
+        encodings, e.g. for the final observation of an episode.
+        """
+        return self.encode(frames, lit, focus)
+
+    def reset_episodes(self, indices: Optional[np.ndarray] = None) -> None:
+        """Forgets the state of the episodes at indices (integer indices or boolean mask), or of
+        every episode, when they are reset. Only stateful encodings keep any.
+        """
+
+    def encode_one(
+        self,
+        frame: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[Tuple[int, int]] = None,
+    ) -> Any:
+        """Encodes a single (height, width, 1) frame whose lit pixels all have episode index 0.
+        The observation is copied out of the arrays the encoder may reuse.
+        """
+        observation = self.encode(
+            None if frame is None else frame[None],
+            lit,
+            None if focus is None else np.asarray(focus).reshape(1, 2),
+        )
+        if isinstance(observation, dict):
+            return {key: value[0].copy() for key, value in observation.items()}
+        return observation[0].copy()
+
+
+class DenseEncoder(ObservationEncoder):
+    """The full screen image with 1 color channel, or with one channel per stacked frame.
+    """
+
+    def space(self) -> spaces.Space:
+        from gym import spaces
+
+        return spaces.Box(
+            low=0.0,
+            high=1.0,
+            shape=(self.width, self.height, self.frame_stack),
+            dtype=np.uint8,
+        )
+
+    def encode(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        return frames
+
+    def encode_one(
+        self,
+        frame: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[Tuple[int, int]] = None,
+    ) -> np.ndarray:
+        return frame  # already a read-only view owned by the env
+
+
+class CoordinateEncoder(ObservationEncoder):
+    """A fixed-length list of lit (x, y) coordinates, padded with zeros, and its validity mask.
+    """
+
+    needs_coordinates = True
+    needs_frames = False
+
+    def space(self) -> spaces.Space:
+        from gym import spaces
+
+        return spaces.Dict(
+            {
+                "coords": spaces.Box(
+                    low=0,
+                    high=max(self.width, self.height) - 1,
+                    shape=(self.max_signals, 2),
+                    dtype=np.int64,
+                ),
+                "mask": spaces.MultiBinary(self.max_signals),
+            }
+        )
+
+    def encode(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> Dict[str, np.ndarray]:
+        coords, mask = _pad_coordinates(_batch_size(frames, lit, focus), lit, self.max_signals)
+        return {"coords": coords, "mask": mask}
+
+
+class PackedEncoder(ObservationEncoder):
+    """The screen image flattened and bit-packed with np.packbits, 8 pixels per byte.
+    Use np.unpackbits(observation)[: height * width] to restore the flattened screen.
+
+    The packed screens are kept by the encoder and only the bytes of the lit pixels are
+    updated, so encoding costs O(number of signals) whatever the screen size.
+    """
+
+    needs_coordinates = True
+    needs_frames = False
+
+    def __init__(
+        self, width: int, height: int, max_signals: int, frame_stack: int = 1
+    ) -> None:
+        super().__init__(width, height, max_signals, frame_stack)
+        self._packed = np.zeros((0, (width * height + 7) // 8), dtype=np.uint8)
+        self._set = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    def space(self) -> spaces.Space:
+        from gym import spaces
+
+        n_bytes = (self.width * self.height + 7) // 8
+        return spaces.Box(low=0, high=255, shape=(n_bytes,), dtype=np.uint8)
+
+    def encode(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        n = _batch_size(frames, lit, focus)
+        if len(self._packed) != n:
+            self._packed = np.zeros((n, self._packed.shape[1]), dtype=np.uint8)
+        else:
+            self._packed[self._set] = 0
+        episode_idx, x_idx, y_idx = lit
+        # same flattening as frames.reshape(n, -1), with the most significant bit first
+        flat = x_idx * self.width + y_idx
+        byte = flat // 8
+        np.bitwise_or.at(
+            self._packed, (episode_idx, byte), (128 >> (flat % 8)).astype(np.uint8)
+        )
+        self._set = (episode_idx, byte)
+        return self._packed
+
+
+class MultiResolutionEncoder(ObservationEncoder):
+    """Coarse views of the whole screen plus a full-resolution foveal crop around the focus.
+
+    Every pooling factor f gives a view of ceil(width / f) x ceil(height / f) cells, each lit if
+    any pixel of its f x f block is lit (max pooling). The fovea is the fovea_size x fovea_size
+    crop of the screen centered on the current focus point, i.e. the last saccade, with pixels
+    outside the screen left dark. All views are drawn from the lit pixels only, so they stay
+    cheap on large screens, for the env as for the model reading them.
+    """
+
+    needs_coordinates = True
+    needs_frames = False
+    needs_focus = True
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        max_signals: int,
+        frame_stack: int = 1,
+        factors: Sequence[int] = (4, 16),
+        fovea_size: int = 16,
+    ) -> None:
+        """
+        Args:
+            width: int
+                The width of the screen. The unit of width is pixel.
+            height: int
+                The height of the screen. The unit of height is pixel.
+            max_signals: int
+                Maximum number of lit pixels on any frame of the task.
+            frame_stack: int
+                Unused, frames are not stacked.
+            factors: Sequence[int]
+                Pooling factor of every coarse view.
+            fovea_size: int
+                Side of the foveal crop, in pixels.
+        """
+        super().__init__(width, height, max_signals, frame_stack)
+        assert all(factor >= 1 for factor in factors), "Pooling factors have to be positive"
+        self.factors = tuple(factors)
+        self.fovea_size = fovea_size
+        self._views = {
+            f"pool_{factor}": _SparseCanvas(-(-width // factor), -(-height // factor))
+            for factor in self.factors
+        }
+        self._views["fovea"] = _SparseCanvas(fovea_size, fovea_size)
+
+    def space(self) -> spaces.Space:
+        from gym import spaces
+
+        shapes = {
+            f"pool_{factor}": (-(-self.width // factor), -(-self.height // factor), 1)
+            for factor in self.factors
+        }
+        shapes["fovea"] = (self.fovea_size, self.fovea_size, 1)
+        return spaces.Dict(
+            {
+                key: spaces.Box(low=0, high=1, shape=shape, dtype=np.uint8)
+                for key, shape in shapes.items()
+            }
+        )
+
+    def encode(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> Dict[str, np.ndarray]:
+        n = _batch_size(frames, lit, focus)
+        episode_idx, x_idx, y_idx = lit
+        observation = {
+            f"pool_{factor}": self._views[f"pool_{factor}"].draw(
+                n, episode_idx, x_idx // factor, y_idx // factor
+            )
+            for factor in self.factors
+        }
+        if focus is None:  # e.g. before the first saccade: look at the center
+            focus = np.tile([self.width // 2, self.height // 2], (n, 1))
+        half = self.fovea_size // 2
+        crop_x = x_idx - focus[episode_idx, 0] + half
+        crop_y = y_idx - focus[episode_idx, 1] + half
+        inside = (
+            (crop_x >= 0)
+            & (crop_x < self.fovea_size)
+            & (crop_y >= 0)
+            & (crop_y < self.fovea_size)
+        )
+        observation["fovea"] = self._views["fovea"].draw(
+            n, episode_idx[inside], crop_x[inside], crop_y[inside]
+        )
+        return observation
+
+
+class DeltaEncoder(ObservationEncoder):
+    """The pixels turned on and off since the previous observation of each episode.
+
+    Both lists are padded to max_signals (x, y) coordinates with a validity mask, as in the
+    "coords" encoding: "on" and "on_mask" for the pixels lit since the previous frame, "off"
+    and "off_mask" for the pixels turned dark. The first observation of every episode is
+    relative to a blank screen, so it lists every lit pixel. A step thus carries a few bytes
+    instead of the height * width screen, and DeltaDecoder rebuilds the dense frames where
+    they are needed.
+
+    The encoder keeps the lit pixels of the last encoded frame of every episode. Envs call
+    reset_episodes on every reset, and peek for the final observation of an episode, so that
+    the deltas of the returned observations always chain.
+    """
+
+    needs_coordinates = True
+    needs_frames = False
+    stateful = True
+
+    def __init__(
+        self, width: int, height: int, max_signals: int, frame_stack: int = 1
+    ) -> None:
+        super().__init__(width, height, max_signals, frame_stack)
+        # sorted keys episode * width * height + x * height + y of the previous lit pixels
+        self._previous = np.zeros(0, dtype=np.int64)
+
+    def space(self) -> spaces.Space:
+        from gym import spaces
+
+        coords = spaces.Box(
+            low=0,
+            high=max(self.width, self.height) - 1,
+            shape=(self.max_signals, 2),
+            dtype=np.int64,
+        )
+        mask = spaces.MultiBinary(self.max_signals)
+        return spaces.Dict({"on": coords, "on_mask": mask, "off": coords, "off_mask": mask})
+
+    def encode(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> Dict[str, np.ndarray]:
+        observation, self._previous = self._delta(frames, lit, focus)
+        return observation
+
+    def peek(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray] = None,
+    ) -> Dict[str, np.ndarray]:
+        return self._delta(frames, lit, focus)[0]
+
+    def reset_episodes(self, indices: Optional[np.ndarray] = None) -> None:
+        if indices is None:
+            self._previous = self._previous[:0]
+            return
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        area = self.width * self.height
+        self._previous = self._previous[~np.isin(self._previous // area, indices)]
+
+    def _delta(
+        self,
+        frames: Optional[np.ndarray],
+        lit: LitPixels,
+        focus: Optional[np.ndarray],
+    ) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+        """Helper function that computes the padded deltas to the previous frames, and the keys
+        of the current lit pixels.
+        """
+        n = _batch_size(frames, lit, focus)
+        area = self.width * self.height
+        episode_idx, x_idx, y_idx = lit
+        current = np.unique(episode_idx * area + x_idx * self.height + y_idx)
+        observation = {}
+        for name, keys in (
+            ("on", np.setdiff1d(current, self._previous, assume_unique=True)),
+            ("off", np.setdiff1d(self._previous, current, assume_unique=True)),
+        ):
+            flat = keys % area
+            observation[name], observation[name + "_mask"] = _pad_coordinates(
+                n, (keys // area, flat // self.height, flat % self.height), self.max_signals
+            )
+        return observation, current
+
+
+class DeltaDecoder:
+    """Accumulates the observations of the "delta" mode into dense frames on the consumer side.
+    """
+
+    def __init__(self, width: int, height: int, num_envs: int = 1) -> None:
+        """
+        Args:
+            width: int
+                The width of the screen. The unit of width is pixel.
+            height: int
+                The height of the screen. The unit of height is pixel.
+            num_envs: int
+                Number of episodes in the decoded batch.
+        """
+        self.frames = np.zeros((num_envs, height, width, 1), dtype=np.uint8)
+
+    def update(
+        self, observation: Dict[str, np.ndarray], reset: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Applies the deltas of a batched observation, or of the observation of a single env,
+        and returns the (num_envs, height, width, 1) frames, which are updated in place.
+        Args:
+            observation: Dict[str, np.ndarray]
+                Observation of the "delta" mode.
+            reset: Optional[np.ndarray]
+                Indices or boolean mask of the episodes that start with this observation,
+                e.g. the dones of the previous step, whose frames are cleared first.
+        """
+        if reset is not None:
+            self.frames[reset] = 0
+        for name, value in (("off", 0), ("on", 1)):
+            coords = observation[name].reshape(-1, observation[name].shape[-2], 2)
+            mask = observation[name + "_mask"].reshape(len(coords), -1)
+            episode, rank = np.nonzero(mask)
+            self.frames[episode, coords[episode, rank, 0], coords[episode, rank, 1], 0] = value
+        return self.frames
+
+
+class _SparseCanvas:
+    """Helper batch of binary images that only clears the cells lit by its previous draw.
+    """
+
+    def __init__(self, rows: int, columns: int) -> None:
+        self.shape = (rows, columns)
+        self.images = np.zeros((0, rows, columns, 1), dtype=np.uint8)
+        empty = np.zeros(0, dtype=np.int64)
+        self._lit = (empty, empty, empty)
+
+    def draw(self, n: int, episode: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Lights the given cells of a batch of n images, and returns the reused images.
+        """
+        if len(self.images) != n:
+            self.images = np.zeros((n,) + self.shape + (1,), dtype=np.uint8)
+        else:
+            self.images[self._lit[0], self._lit[1], self._lit[2], 0] = 0
+        self.images[episode, x, y, 0] = 1
+        self._lit = (episode, x, y)
+        return self.images
+
+
+def _pad_coordinates(
+    n: int, lit: LitPixels, max_signals: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Helper function that lists the lit (x, y) of every episode of a batch of n, padded with
+    zeros to max_signals, with the int8 validity mask.
+    """
+    episode_idx, x_idx, y_idx = lit
+    coords = np.zeros((n, max_signals, 2), dtype=np.int64)
+    mask = np.zeros((n, max_signals), dtype=np.int8)
+    # rank of every lit pixel within its own episode
+    order = np.argsort(episode_idx, kind="stable")
+    episode_sorted = episode_idx[order]
+    counts = np.bincount(episode_sorted, minlength=n)
+    starts = np.cumsum(counts) - counts
+    rank = np.arange(len(order)) - starts[episode_sorted]
+    coords[episode_sorted, rank, 0] = x_idx[order]
+    coords[episode_sorted, rank, 1] = y_idx[order]
+    mask[episode_sorted, rank] = 1
+    return coords, mask
+
+
+def _batch_size(
+    frames: Optional[np.ndarray], lit: LitPixels, focus: Optional[np.ndarray]
+) -> int:
+    """Helper function that infers the batch size of encode from its arguments.
+    """
+    if frames is not None:
+        return len(frames)
+    assert focus is not None, "Encoding without frames needs the focus points of the batch"
+    return len(focus)
+
+
+def _batch_space(space: spaces.Space, n: int) -> spaces.Space:
+    """Helper function that stacks n copies of a Box, MultiBinary or Dict space.
+    """
+    from gym import spaces
+
+    if isinstance(space, spaces.Dict):
+        return spaces.Dict(
+            {key: _batch_space(value, n) for key, value in space.spaces.items()}
+        )
+    if isinstance(space, spaces.MultiBinary):
+        return spaces.MultiBinary([n] + list(np.atleast_1d(space.n)))
+    low = np.broadcast_to(space.low, (n,) + space.shape)
+    high = np.broadcast_to(space.high, (n,) + space.shape)
+    return spaces.Box(low=low, high=high, dtype=space.dtype)
+
+
+OBSERVATION_ENCODERS: Dict[str, Type[ObservationEncoder]] = {
+    "dense": DenseEncoder,
+    "coords": CoordinateEncoder,
+    "packed": PackedEncoder,
+    "multires": MultiResolutionEncoder,
+    "delta": DeltaEncoder,
+}
+
+
+def make_encoder(
+    mode: str,
+    width: int,
+    height: int,
+    max_signals: int,
+    frame_stack: int = 1,
+    **options: Any,
+) -> ObservationEncoder:
+    """Builds the encoder of an observation mode, one of OBSERVATION_ENCODERS. Extra keyword
+    options are passed to the encoder, e.g. factors and fovea_size of "multires".
+    """
+    assert (
+        mode in OBSERVATION_ENCODERS
+    ), f"Unknown observation mode {mode}, expected one of {list(OBSERVATION_ENCODERS)}"
+    assert (
+        frame_stack == 1 or mode == "dense"
+    ), "Frame stacking is only supported by the dense observation mode"
+    return OBSERVATION_ENCODERS[mode](width, height, max_signals, frame_stack, **options)
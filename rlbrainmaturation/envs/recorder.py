@@ -0,0 +1,432 @@
+from __future__ import annotations
+import json
+import os
+import numpy as np
+from rlbrainmaturation.tasks.task import Task
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# per-step columns: dtype and shape after the step dimension ("K" is max_signals)
+COLUMNS: Dict[str, Tuple[str, Tuple[Union[int, str], ...]]] = {
+    "episode": ("int64", ()),
+    "time": ("int32", ()),
+    "task": ("int32", ()),
+    "seed": ("int64", ()),
+    "iteration": ("int64", ()),
+    "action": ("int32", (2,)),
+    "target": ("int32", (2,)),
+    "reward": ("float32", ()),
+    "num_lit": ("int16", ()),
+    "lit": ("int16", ("K", 2)),
+}
+
+# columns summarized per chunk, so readers can skip chunks without opening them
+INDEXED_COLUMNS = ("task", "seed", "iteration")
+
+METADATA_FILE = "metadata.json"
+
+
+class TrajectoryRecorder:
+    """Appends the steps of environments to chunked, memory-mapped column files.
+
+    Every step is one row of the columns of COLUMNS: the episode id, the frame the action was
+    taken on, the task, seed and training iteration it belongs to, the (x, y) action, the target
+    of the episode, the reward,
+    and the observation in compact form, i.e. the padded list of its lit pixels. The rows are
+    written into chunks of chunk_size rows, one .npy file per column and chunk, which are
+    memory-mapped so that recording never holds more than the current chunk in RAM. The list of
+    chunks, the tasks and the value ranges of every chunk are kept in metadata.json.
+
+    A recorder is attached to an env with the "recorder" entry of env_config, and read back with
+    TrajectoryReader. Recording to an existing directory appends new chunks to it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_signals: int,
+        chunk_size: int = 1 << 16,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Args:
+            path: str
+                Directory of the dataset.
+            max_signals: int
+                Maximum number of lit pixels stored per observation.
+            chunk_size: int
+                Number of steps per chunk.
+            metadata: Optional[Dict[str, Any]]
+                Free-form metadata stored with the dataset, e.g. the run config.
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        metadata_path = os.path.join(path, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as fh:
+                self.metadata = json.load(fh)
+            assert (
+                self.metadata["max_signals"] >= max_signals
+            ), "Dataset stores fewer lit pixels per observation than max_signals"
+            self.metadata["info"].update(metadata or {})
+        else:
+            self.metadata = {
+                "max_signals": max(max_signals, 1),
+                "num_steps": 0,
+                "num_episodes": 0,
+                "tasks": [],
+                "chunks": [],
+                "info": metadata or {},
+            }
+        self.max_signals = self.metadata["max_signals"]
+        # context of the steps recorded from now on, the seed defaulting to the task seed
+        self.iteration = 0
+        self.seed: Optional[int] = None
+        self._task_seeds = _task_seeds(self.metadata["tasks"])
+        self._chunk: Optional[Dict[str, np.ndarray]] = None
+        self._rows = 0  # rows written to the current chunk
+
+    def task_id(self, task: Task) -> int:
+        """Index of the description of task in the dataset, adding it if it is new.
+        """
+        description = task_metadata(task)
+        tasks = self.metadata["tasks"]
+        if description not in tasks:
+            tasks.append(description)
+            self._task_seeds = _task_seeds(tasks)
+        return tasks.index(description)
+
+    def new_episode(self) -> int:
+        """Reserves the id of a new episode.
+        """
+        return int(self.new_episodes(1)[0])
+
+    def new_episodes(self, n: int) -> np.ndarray:
+        """Reserves the ids of n new episodes, e.g. one per slot of a batched env.
+        """
+        start = self.metadata["num_episodes"]
+        self.metadata["num_episodes"] += n
+        return np.arange(start, start + n)
+
+    def set_context(
+        self, iteration: Optional[int] = None, seed: Optional[int] = None
+    ) -> None:
+        """Sets the training iteration and the seed of the steps recorded from now on. A seed
+        overrides the seeds of the tasks, which are recorded by default.
+        """
+        if iteration is not None:
+            self.iteration = iteration
+        if seed is not None:
+            self.seed = seed
+
+    def record(
+        self,
+        episode: int,
+        time: int,
+        task: int,
+        action: Tuple[int, int],
+        target: Tuple[int, int],
+        reward: float,
+        lit_x: np.ndarray,
+        lit_y: np.ndarray,
+    ) -> None:
+        """Appends one step.
+        Args:
+            episode: int
+                Episode id, from new_episode().
+            time: int
+                Frame the action was taken on.
+            task: int
+                Task index, from task_id().
+            action: Tuple[int, int]
+                (x, y) action of the agent.
+            target: Tuple[int, int]
+                (x, y) target of the episode.
+            reward: float
+                Reward of the action.
+            lit_x, lit_y: np.ndarray
+                Coordinates of the pixels lit on the frame the action was taken on.
+        """
+        n_lit = len(lit_x)
+        assert n_lit <= self.max_signals, "More lit pixels than the dataset stores"
+        lit = np.full((1, self.max_signals, 2), -1, dtype=np.int64)
+        lit[0, :n_lit, 0] = lit_x
+        lit[0, :n_lit, 1] = lit_y
+        self.append(
+            {
+                "episode": np.array([episode]),
+                "time": np.array([time]),
+                "task": np.array([task]),
+                "action": np.array([action]),
+                "target": np.array([target]),
+                "reward": np.array([reward]),
+                "num_lit": np.array([n_lit]),
+                "lit": lit,
+            }
+        )
+
+    def append(self, rows: Dict[str, np.ndarray]) -> None:
+        """Appends a batch of steps, e.g. one step of every slot of a batched env.
+        Args:
+            rows: Dict[str, np.ndarray]
+                Arrays of every column of COLUMNS with a leading step dimension. "iteration"
+                and "seed" default to the current context, the seed to the seed of the task
+                of every step when none was set, and "lit" may hold fewer than max_signals
+                pixels per step.
+        """
+        n = len(rows["episode"])
+        if self.seed is None:
+            seeds = self._task_seeds[np.asarray(rows["task"], dtype=np.int64)]
+        else:
+            seeds = np.full(n, self.seed)
+        rows = dict({"iteration": np.full(n, self.iteration), "seed": seeds}, **rows)
+        assert (
+            rows["lit"].shape[1] <= self.max_signals
+        ), "More lit pixels than the dataset stores"
+        start = 0
+        while start < n:
+            if self._chunk is None or self._rows == self.chunk_size:
+                self._open_chunk()
+            stop = min(n, start + self.chunk_size - self._rows)
+            self._write_rows(rows, start, stop)
+            start = stop
+
+    def _write_rows(self, rows: Dict[str, np.ndarray], start: int, stop: int) -> None:
+        """Helper function that copies rows[start:stop] into the current chunk.
+        """
+        chunk = self._chunk
+        rows_slice = slice(self._rows, self._rows + stop - start)
+        for name, column in chunk.items():
+            values = rows[name][start:stop]
+            if name == "lit":
+                column[rows_slice, : values.shape[1]] = values
+                column[rows_slice, values.shape[1] :] = -1
+            else:
+                column[rows_slice] = values
+        self._rows += stop - start
+
+        summary = self.metadata["chunks"][-1]
+        summary["num_steps"] = self._rows
+        for name in INDEXED_COLUMNS:
+            low, high = int(rows[name][start:stop].min()), int(rows[name][start:stop].max())
+            if name in summary["ranges"]:
+                low = min(low, summary["ranges"][name][0])
+                high = max(high, summary["ranges"][name][1])
+            summary["ranges"][name] = (low, high)
+        self.metadata["num_steps"] += stop - start
+
+    def flush(self) -> None:
+        """Writes the current chunk and the metadata to disk.
+        """
+        if self._chunk is not None:
+            for column in self._chunk.values():
+                column.flush()
+        _write_json(os.path.join(self.path, METADATA_FILE), self.metadata)
+
+    def close(self) -> None:
+        """Flushes and releases the current chunk.
+        """
+        self.flush()
+        self._chunk = None
+
+    def __enter__(self) -> TrajectoryRecorder:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _open_chunk(self) -> None:
+        """Helper function that flushes the current chunk and memory-maps the files of a new one.
+        """
+        self.flush()
+        name = f"chunk_{len(self.metadata['chunks']):06d}"
+        os.makedirs(os.path.join(self.path, name))
+        self._chunk = {
+            column: np.lib.format.open_memmap(
+                os.path.join(self.path, name, f"{column}.npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(self.chunk_size,) + self._shape(shape),
+            )
+            for column, (dtype, shape) in COLUMNS.items()
+        }
+        self._rows = 0
+        self.metadata["chunks"].append({"name": name, "num_steps": 0, "ranges": {}})
+
+    def _shape(self, shape: Tuple[Union[int, str], ...]) -> Tuple[int, ...]:
+        """Helper function that resolves the symbolic dimensions of a column shape.
+        """
+        return tuple(self.max_signals if dim == "K" else dim for dim in shape)
+
+
+class TrajectoryReader:
+    """Streams the steps of a dataset written by TrajectoryRecorder.
+
+    Chunks are memory-mapped one at a time, and chunks whose value ranges cannot match the
+    filters are skipped without being opened, so a scan only reads the matching data.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: str
+                Directory of the dataset.
+        """
+        self.path = path
+        with open(os.path.join(path, METADATA_FILE)) as fh:
+            self.metadata = json.load(fh)
+        self.tasks: List[Dict[str, Any]] = self.metadata["tasks"]
+
+    def __len__(self) -> int:
+        return self.metadata["num_steps"]
+
+    def iter_chunks(
+        self,
+        task: Union[None, int, str, Sequence[Union[int, str]]] = None,
+        seed: Union[None, int, Sequence[int]] = None,
+        iteration: Union[None, int, Sequence[int], range] = None,
+        columns: Optional[Sequence[str]] = None,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """Iterates over the matching steps, one chunk at a time.
+        Args:
+            task: Union[None, int, str, Sequence]
+                Task index, task class name (e.g. "Gap"), or a sequence of them.
+            seed: Union[None, int, Sequence[int]]
+                Seed or seeds to keep.
+            iteration: Union[None, int, Sequence[int], range]
+                Training iteration or iterations to keep.
+            columns: Optional[Sequence[str]]
+                Columns to read. Default reads every column.
+
+        Yields:
+            Dictionaries of column name to the arrays of the matching steps of one chunk.
+            Chunks without matching steps are skipped.
+        """
+        filters = {
+            name: values
+            for name, values in (
+                ("task", self._task_ids(task)),
+                ("seed", _as_values(seed)),
+                ("iteration", _as_values(iteration)),
+            )
+            if values is not None
+        }
+        columns = list(columns or COLUMNS)
+        for summary in self.metadata["chunks"]:
+            n = summary["num_steps"]
+            if n == 0 or not all(
+                _overlaps(values, summary["ranges"][name])
+                for name, values in filters.items()
+            ):
+                continue
+            directory = os.path.join(self.path, summary["name"])
+            chunk = {
+                column: np.load(
+                    os.path.join(directory, f"{column}.npy"), mmap_mode="r"
+                )[:n]
+                for column in set(columns) | set(filters)
+            }
+            keep = np.ones(n, dtype=bool)
+            for name, values in filters.items():
+                keep &= np.isin(chunk[name], values)
+            if not keep.any():
+                continue
+            if keep.all():
+                yield {column: np.asarray(chunk[column]) for column in columns}
+            else:
+                yield {column: chunk[column][keep] for column in columns}
+
+    def iter_steps(self, **filters: Any) -> Iterator[Dict[str, Any]]:
+        """Iterates over the matching steps one at a time. Takes the filters of iter_chunks.
+        """
+        for chunk in self.iter_chunks(**filters):
+            names = list(chunk)
+            for values in zip(*(chunk[name] for name in names)):
+                yield dict(zip(names, values))
+
+    def read(self, **filters: Any) -> Dict[str, np.ndarray]:
+        """Loads every matching step in memory. Takes the filters of iter_chunks.
+        """
+        chunks = list(self.iter_chunks(**filters))
+        columns = filters.get("columns") or list(COLUMNS)
+        if not chunks:
+            return {
+                column: np.zeros(
+                    (0,) + tuple(
+                        self.metadata["max_signals"] if dim == "K" else dim
+                        for dim in COLUMNS[column][1]
+                    ),
+                    dtype=COLUMNS[column][0],
+                )
+                for column in columns
+            }
+        return {
+            column: np.concatenate([chunk[column] for chunk in chunks])
+            for column in columns
+        }
+
+    def _task_ids(
+        self, task: Union[None, int, str, Sequence[Union[int, str]]]
+    ) -> Optional[np.ndarray]:
+        """Helper function that resolves task names to task indices.
+        """
+        if task is None:
+            return None
+        if isinstance(task, (int, str)):
+            task = [task]
+        ids = []
+        for item in task:
+            if isinstance(item, str):
+                ids.extend(
+                    i for i, description in enumerate(self.tasks)
+                    if description["class"] == item
+                )
+            else:
+                ids.append(item)
+        return np.array(ids, dtype=np.int64)
+
+
+def _task_seeds(tasks: List[Dict[str, Any]]) -> np.ndarray:
+    """Helper function that lists the seed of every task description, -1 for unseeded tasks.
+    """
+    seeds = [description.get("seed") for description in tasks]
+    return np.array([-1 if seed is None else seed for seed in seeds], dtype=np.int64)
+
+
+def task_metadata(task: Task) -> Dict[str, Any]:
+    """JSON-serializable description of a task, used as its key in a dataset.
+    """
+    return {
+        "class": getattr(task, "name", type(task).__name__),
+        "target": [int(task.target_pos.x), int(task.target_pos.y)],
+        "tot_frames": int(task.tot_frames),
+        "width": int(task.width),
+        "height": int(task.height),
+        "encourage_mode": bool(task.encourage_mode),
+        "epsilon": float(task.epsilon),
+        "seed": task.seed if isinstance(task.seed, int) else None,
+    }
+
+
+def _as_values(values: Union[None, int, Sequence[int], range]) -> Optional[np.ndarray]:
+    """Helper function that turns a filter value into an array of accepted values.
+    """
+    if values is None:
+        return None
+    return np.atleast_1d(np.asarray(values, dtype=np.int64))
+
+
+def _overlaps(values: np.ndarray, value_range: Tuple[int, int]) -> bool:
+    """Helper function that checks whether any value lies in the closed range.
+    """
+    low, high = value_range
+    return bool(((values >= low) & (values <= high)).any())
+
+
+def _write_json(path: str, data: Any) -> None:
+    """Helper function that writes JSON through a temporary file, so readers never see half a file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp_path, path)
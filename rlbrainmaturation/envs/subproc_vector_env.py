@@ -0,0 +1,365 @@
+from __future__ import annotations
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from rlbrainmaturation.envs.observation import make_encoder
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from rlbrainmaturation.tasks.registry import resolve_task
+from rlbrainmaturation.tasks.task import Task
+from rlbrainmaturation.utils.general_utils import cached_property
+from rlbrainmaturation.utils.random_utils import spawn_generators
+from typing import Any, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from gym import spaces
+
+# (name, shape, dtype) of one array of the shared block
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+
+
+class SubprocVectorEnvironment:
+    """Batched environment whose episodes are split across worker processes.
+
+    Every worker owns a VectorEnvironment with a contiguous slice of the num_envs episodes and
+    writes its observations, rewards, dones, times and targets straight into one preallocated
+    multiprocessing.shared_memory block, from which the parent reads them as NumPy views. The
+    pipes to the workers only carry the commands ("step", "reset", "close") and an
+    acknowledgement, so a step costs one round trip per worker whatever the size of the
+    observations, and the throughput scales with the number of cores.
+
+    It has the interface of VectorEnvironment, with the returned observations owned by the env
+    and overwritten in place by the next call to step or reset. Call close, or use the env as
+    a context manager, to stop the workers and free the shared block.
+    """
+
+    def __init__(self, env_config: Dict[str, Any]) -> None:
+        """Inits the workers based on the env_config dictionary.
+        Args:
+            env_config: Dict[str, Any]
+                Environment config dictionary of VectorEnvironment, i.e. env_config = {"task":
+                Task, "num_envs": int}, with an optional "num_workers" entry (default is the
+                number of CPUs) and an optional "start_method" entry of multiprocessing. The
+                "rng" entry, if any, is split into one independent stream per worker. A
+                "profiler" entry is not supported, as it would only see the parent.
+        """
+        assert "profiler" not in env_config, "Profile the workers' VectorEnvironment instead"
+        self.task, rng = resolve_task(env_config)
+        self.num_envs = int(env_config.get("num_envs", 1))
+        num_workers = int(env_config.get("num_workers", multiprocessing.cpu_count()))
+        self.num_workers = max(1, min(num_workers, self.num_envs))
+        self.observation_mode = env_config.get("observation_mode", "dense")
+        self.schedule = self.task.compile()
+        self.encoder = make_encoder(
+            self.observation_mode,
+            self.task.width,
+            self.task.height,
+            self.schedule.max_signals,
+            **env_config.get("observation_options", {}),
+        )
+
+        # boundaries of the slices of episodes owned by the workers
+        self.bounds = np.linspace(0, self.num_envs, self.num_workers + 1).astype(np.int64)
+        specs = self._array_specs()
+        size = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, shape, dtype in specs)
+        self._memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self._arrays = _attach(self._memory, specs)
+        self.focus = np.tile(
+            [self.task.width // 2, self.task.height // 2], (self.num_envs, 1)
+        )
+
+        if rng is None:
+            rngs = self.task.spawn_rngs(self.num_workers)
+        else:
+            # Generator.spawn needs numpy >= 1.25: seed the workers from draws of rng instead
+            entropy = rng.integers(2**32, size=4, dtype=np.uint64)
+            rngs = spawn_generators(np.random.SeedSequence(entropy), self.num_workers)
+        # a TaskDescriptor is shipped as is, and rebuilt by the workers
+        worker_config = {
+            key: value
+            for key, value in env_config.items()
+            if key not in ("num_workers", "start_method", "rng")
+        }
+        context = multiprocessing.get_context(env_config.get("start_method"))
+        self._remotes = []
+        self._processes = []
+        for i in range(self.num_workers):
+            remote, worker_remote = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(
+                    worker_remote,
+                    dict(worker_config, num_envs=self._slice_size(i), rng=rngs[i]),
+                    self._memory.name,
+                    specs,
+                    (int(self.bounds[i]), int(self.bounds[i + 1])),
+                ),
+                daemon=True,
+            )
+            process.start()
+            worker_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+        self.closed = False
+        self._gather()  # workers are ready once they reset their episodes
+
+    @cached_property
+    def single_action_space(self) -> spaces.Space:
+        """Action space of a single episode, matching Environment.
+        """
+        from gym import spaces
+
+        return spaces.Tuple(
+            (spaces.Discrete(self.task.width), spaces.Discrete(self.task.height))
+        )
+
+    @cached_property
+    def single_observation_space(self) -> spaces.Space:
+        """Observation space of a single episode, matching Environment.
+        """
+        return self.encoder.space()
+
+    @cached_property
+    def action_space(self) -> spaces.Space:
+        """Batched action space of (num_envs, 2) saccade positions.
+        """
+        from gym import spaces
+
+        return spaces.Box(
+            low=0,
+            high=max(self.task.width, self.task.height) - 1,
+            shape=(self.num_envs, 2),
+            dtype=np.int64,
+        )
+
+    @cached_property
+    def observation_space(self) -> spaces.Space:
+        """Batched observation space, with num_envs as the leading dimension.
+        """
+        return self.encoder.batch_space(self.num_envs)
+
+    @property
+    def times(self) -> np.ndarray:
+        """Current frame of each slot.
+        """
+        return self._arrays["times"]
+
+    @property
+    def targets(self) -> np.ndarray:
+        """Target of the current episode of each slot.
+        """
+        return self._arrays["targets"]
+
+    def step(
+        self, actions: Union[np.ndarray, List[Tuple[int, int]]]
+    ) -> Tuple[Any, np.ndarray, np.ndarray, Dict]:
+        """Advances every slot by one frame on the workers.
+
+        Args:
+            actions: Union[np.ndarray, List[Tuple[int, int]]]
+                Array-like of shape (num_envs, 2) with the (x, y) position each agent is looking to.
+
+        Returns:
+            observations, rewards, dones and info, as in VectorEnvironment.step.
+        """
+        actions = np.asarray(actions).reshape(self.num_envs, 2)
+        self._arrays["actions"][:] = actions
+        self.focus[:] = actions
+        self._broadcast(("step", None))
+        dones = self._arrays["dones"].copy()
+        info: Dict[str, Any] = {}
+        if dones.any():
+            final = self._observation("final_")
+            if isinstance(final, dict):
+                info["final_observation"] = {key: value[dones] for key, value in final.items()}
+            else:
+                info["final_observation"] = final[dones]
+        return self._observation("obs_"), self._arrays["rewards"].copy(), dones, info
+
+    def reset(self, indices: Optional[np.ndarray] = None) -> Any:
+        """Resets all slots, or only the slots selected by indices, to the initial frame.
+        Args:
+            indices: Optional[np.ndarray]
+                Integer indices or boolean mask of the slots to reset. Default resets every slot.
+        """
+        if indices is None:
+            self.focus[:] = (self.task.width // 2, self.task.height // 2)
+            self._broadcast(("reset", None))
+            return self._observation("obs_")
+        mask = np.zeros(self.num_envs, dtype=bool)
+        mask[indices] = True
+        self.focus[mask] = (self.task.width // 2, self.task.height // 2)
+        for i, remote in enumerate(self._remotes):
+            remote.send(("reset", mask[self.bounds[i] : self.bounds[i + 1]]))
+        self._gather()
+        return self._observation("obs_")
+
+    def close(self) -> None:
+        """Stops the workers and frees the shared memory.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for remote in self._remotes:
+            try:
+                remote.send(("close", None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for remote in self._remotes:
+            remote.close()
+        self._arrays = {}
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self) -> SubprocVectorEnvironment:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        if not getattr(self, "closed", True):
+            self.close()
+
+    def _slice_size(self, i: int) -> int:
+        """Helper function that returns the number of episodes of worker i.
+        """
+        return int(self.bounds[i + 1] - self.bounds[i])
+
+    def _array_specs(self) -> List[ArraySpec]:
+        """Helper function that lays out the arrays of the shared block. The shapes and dtypes
+        of the observations are found by encoding an empty batch of one episode.
+        """
+        n = self.num_envs
+        frames = (
+            np.zeros((1, self.task.height, self.task.width, 1), dtype=np.uint8)
+            if self.encoder.needs_frames
+            else None
+        )
+        empty = np.zeros(0, dtype=np.int64)
+        sample = self.encoder.encode(
+            frames, (empty, empty, empty), np.zeros((1, 2), dtype=np.int64)
+        )
+        sample = sample if isinstance(sample, dict) else {"": sample}
+        specs: List[ArraySpec] = [
+            ("actions", (n, 2), "int64"),
+            ("rewards", (n,), "float64"),
+            ("dones", (n,), "bool"),
+            ("times", (n,), "int64"),
+            ("targets", (n, 2), "int64"),
+        ]
+        for prefix in ("obs_", "final_"):
+            for key, value in sample.items():
+                specs.append((prefix + key, (n,) + value.shape[1:], value.dtype.str))
+        return specs
+
+    def _observation(self, prefix: str) -> Any:
+        """Helper function that returns the shared observation arrays of prefix, as an array or
+        as a dict like the encoder.
+        """
+        observation = {
+            name[len(prefix) :]: array
+            for name, array in self._arrays.items()
+            if name.startswith(prefix)
+        }
+        return observation[""] if "" in observation else observation
+
+    def _broadcast(self, command: Tuple[str, Any]) -> None:
+        """Helper function that sends command to every worker and waits for them.
+        """
+        for remote in self._remotes:
+            remote.send(command)
+        self._gather()
+
+    def _gather(self) -> None:
+        """Helper function that waits for the acknowledgement of every worker, raising the
+        error of a failed one.
+        """
+        errors = []
+        for remote in self._remotes:
+            try:
+                message = remote.recv()
+            except EOFError:
+                message = "The worker exited"
+            if message:
+                errors.append(message)
+        if errors:
+            raise RuntimeError(f"Worker of SubprocVectorEnvironment failed:\n{errors[0]}")
+
+
+def _attach(
+    memory: shared_memory.SharedMemory, specs: List[ArraySpec]
+) -> Dict[str, np.ndarray]:
+    """Helper function that maps the arrays of specs, laid out one after the other, onto the
+    buffer of the shared block.
+    """
+    arrays = {}
+    offset = 0
+    for name, shape, dtype in specs:
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)
+        arrays[name] = array
+        offset += array.nbytes
+    return arrays
+
+
+def _worker(
+    remote: Any,
+    env_config: Dict[str, Any],
+    memory_name: str,
+    specs: List[ArraySpec],
+    bounds: Tuple[int, int],
+) -> None:
+    """Helper function that runs a worker: it steps a VectorEnvironment over the slice bounds
+    of the episodes and writes its outputs to the shared block on every command. Replies with
+    None on success and with the traceback on failure.
+    """
+    memory = shared_memory.SharedMemory(name=memory_name)
+    try:
+        lo, hi = bounds
+        shared = {name: array[lo:hi] for name, array in _attach(memory, specs).items()}
+        env = VectorEnvironment(env_config)
+        if env.encoder.needs_frames:
+            # the dense encoding is the rendered screen itself, so render straight to the block
+            env.observations = shared["obs_"]
+        # first episodes, whose stateful encodings (e.g. "delta") start from a blank screen
+        observation = env.reset()
+
+        def publish(observation: Any) -> None:
+            observation = observation if isinstance(observation, dict) else {"": observation}
+            for key, value in observation.items():
+                if not np.shares_memory(value, shared["obs_" + key]):
+                    shared["obs_" + key][:] = value
+            shared["times"][:] = env.times
+            shared["targets"][:] = env.targets
+
+        publish(observation)
+        remote.send(None)
+        while True:
+            command, argument = remote.recv()
+            try:
+                if command == "step":
+                    observation, rewards, dones, info = env.step(shared["actions"])
+                    shared["rewards"][:] = rewards
+                    shared["dones"][:] = dones
+                    if dones.any():
+                        final = info["final_observation"]
+                        final = final if isinstance(final, dict) else {"": final}
+                        for key, value in final.items():
+                            shared["final_" + key][dones] = value
+                    publish(observation)
+                elif command == "reset":
+                    publish(env.reset(argument))
+                elif command == "close":
+                    break
+                remote.send(None)
+            except Exception:
+                remote.send(traceback.format_exc())
+    except Exception:
+        remote.send(traceback.format_exc())
+    finally:
+        memory.close()
+        remote.close()
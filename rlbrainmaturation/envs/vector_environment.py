@@ -0,0 +1,272 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.tasks.registry import resolve_task
+from rlbrainmaturation.tasks.task import Task
+from rlbrainmaturation.envs.observation import LitPixels, make_encoder
+from rlbrainmaturation.utils.general_utils import cached_property
+from rlbrainmaturation.utils.profiling import Profiler
+from typing import Any, Dict, List, Optional, Tuple, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from gym import spaces
+
+
+class VectorEnvironment:
+    """Batched environment that runs num_envs episodes of the same task at once.
+
+    All episodes share one (num_envs, height, width, 1) uint8 observation array, and
+    each step renders, scores and resets every slot with a handful of NumPy operations
+    instead of a Python loop over Environment instances. Slots whose episode ends are
+    reset automatically, so the returned observation of a finished slot is already the
+    first frame of its next episode.
+
+    Like EnvironmentCore, it only depends on NumPy; gym is imported when a space is accessed.
+    """
+
+    def __init__(self, env_config: Dict[str, Any]) -> None:
+        """Inits the batched env based on the env_config dictionary.
+        Args:
+            env_config: Dict[str, Any]
+                Environment config dictionary, i.e. env_config = {"task": Task, "num_envs": int}.
+                An optional "rng" entry (np.random.Generator) sets the stream of the randomized
+                signals (and of the targets, if the task has a target distribution), which
+                otherwise is a new stream spawned from the task seed. An optional
+                "observation_mode" entry selects the encoding, with its options in
+                "observation_options", an optional "profiler" entry (Profiler) times the
+                phases of step and reset, and an optional "frame_skip" entry advances every
+                slot through its run of identical frames, as in Environment.
+        """
+        # Brain maturation task, built here if given as a TaskDescriptor
+        self.task, rng = resolve_task(env_config)
+        self.num_envs = int(env_config.get("num_envs", 1))  # number of parallel episodes
+        height = self.task.height  # height_of_screen
+        width = self.task.width  # width_of_screen
+
+        # compiled per-frame stimulus schedule of the task
+        self.schedule = self.task.compile()
+        self.observation_mode = env_config.get("observation_mode", "dense")
+        self.encoder = make_encoder(
+            self.observation_mode,
+            width,
+            height,
+            self.schedule.max_signals,
+            **env_config.get("observation_options", {}),
+        )
+
+        # block sampler of the randomized signals, on its own stream of the task seed
+        if rng is None:
+            rng = self.task.spawn_rngs(1)[0]
+        self.sampler = self.schedule.sampler(rng)
+        # target of the current episode of every slot, drawn per episode in
+        # target-distribution mode
+        self.targets = self.task.sample_targets(self.num_envs, self.sampler.rng)
+        # positions of the randomized signals of the current episode of every slot
+        self.random_positions = np.zeros(
+            (self.num_envs, self.schedule.num_random, 2), dtype=np.int64
+        )
+
+        # dense screens, only rendered for encodings reading them
+        self.observations = np.zeros(
+            (self.num_envs if self.encoder.needs_frames else 0, height, width, 1),
+            dtype=np.uint8,
+        )
+        # current focus point of every slot, i.e. its last action
+        self.focus = np.tile([width // 2, height // 2], (self.num_envs, 1))
+        self.times = np.zeros(self.num_envs, dtype=np.int64)  # current frame of each slot
+        # steps onto frames identical for every slot keep the previous observation
+        self.reuse_unchanged = not self.encoder.needs_focus and not self.encoder.stateful
+        self.frame_skip = bool(env_config.get("frame_skip", False))
+        self._slots = np.arange(self.num_envs)
+        # pixels lit by the last render, so only they need to be cleared next time
+        self._lit = (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+        )
+        profiler: Optional[Profiler] = env_config.get("profiler")
+        if profiler is not None:
+            self._instrument(profiler)
+        self.reset()
+
+    @cached_property
+    def single_action_space(self) -> spaces.Space:
+        """Action space of a single episode, matching Environment.
+        """
+        from gym import spaces
+
+        return spaces.Tuple(
+            (spaces.Discrete(self.task.width), spaces.Discrete(self.task.height))
+        )
+
+    @cached_property
+    def single_observation_space(self) -> spaces.Space:
+        """Observation space of a single episode, matching Environment.
+        """
+        return self.encoder.space()
+
+    @cached_property
+    def action_space(self) -> spaces.Space:
+        """Batched action space of (num_envs, 2) saccade positions.
+        """
+        from gym import spaces
+
+        return spaces.Box(
+            low=0,
+            high=max(self.task.width, self.task.height) - 1,
+            shape=(self.num_envs, 2),
+            dtype=np.int64,
+        )
+
+    @cached_property
+    def observation_space(self) -> spaces.Space:
+        """Batched observation space, with num_envs as the leading dimension.
+        """
+        return self.encoder.batch_space(self.num_envs)
+
+    @property
+    def lit(self) -> LitPixels:
+        """(slot index, x, y) of every pixel lit in the current frames of the slots.
+        """
+        return self._lit
+
+    def step(
+        self, actions: Union[np.ndarray, List[Tuple[int, int]]]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict]:
+        """Advances every slot by one frame.
+
+        Args:
+            actions: Union[np.ndarray, List[Tuple[int, int]]]
+                Array-like of shape (num_envs, 2) with the (x, y) position each agent is looking to.
+
+        Returns:
+            observations, rewards, dones and info. The observation arrays are owned by the env
+            and are overwritten in place by the next call to step or reset.
+            info["final_observation"] holds a copy of the last observation of the slots that
+            finished at this step, in the observation mode. In the "delta" mode, the returned
+            observation of a finished slot is the first frame of its next episode relative to
+            a blank screen, as after reset.
+        """
+        actions = np.asarray(actions).reshape(self.num_envs, 2)
+        previous = self.times.copy() if self.frame_skip else None
+        self.times += 1
+        schedule = self.schedule
+        # slots past the end of the episode hold the blank frame after the last one
+        inside = self.times < schedule.tot_frames
+        frames = np.minimum(self.times, schedule.tot_frames - 1)
+        changed = (~inside | schedule.changes[frames]).any()
+        if self.frame_skip:
+            self.times = np.where(inside, schedule.run_end[frames], self.times)
+        self.focus[:] = actions
+        rewards = self.task.score_batch(actions, self.times, self._episode_targets())
+        dones = self.times >= self.task.tot_frames - 1
+
+        info: Dict[str, Any] = {}
+        if self.frame_skip:
+            info["frames"] = self.times - previous
+        if not changed and self.reuse_unchanged and not dones.any():
+            return self._observation, rewards, dones, info
+        self._render()
+        if dones.any():
+            final = self._encode(peek=True)
+            if isinstance(final, dict):
+                info["final_observation"] = {
+                    key: value[dones] for key, value in final.items()
+                }
+            else:
+                info["final_observation"] = final[dones]
+            self.times[dones] = 0
+            self.encoder.reset_episodes(dones)
+            self._render(reset_slots=dones)
+        self._observation = self._encode()
+        return self._observation, rewards, dones, info
+
+    def reset(self, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Resets all slots, or only the slots selected by indices, to the initial frame.
+        Args:
+            indices: Optional[np.ndarray]
+                Integer indices or boolean mask of the slots to reset. Default resets every slot.
+        """
+        if indices is None:
+            indices = self._slots
+        self.times[indices] = 0
+        self.focus[indices] = (self.task.width // 2, self.task.height // 2)
+        self.encoder.reset_episodes(indices)
+        self._render(reset_slots=indices)
+        self._observation = self._encode()
+        return self._observation
+
+    def _render(self, reset_slots: Optional[np.ndarray] = None) -> None:
+        """Helper function that redraws the frame of every slot at its current time.
+        Only the pixels lit by the previous render are cleared, and dense screens are only drawn
+        for the encodings reading them.
+
+        Args:
+            reset_slots: Optional[np.ndarray]
+                Slots starting a new episode, whose randomized signals are redrawn first.
+        """
+        schedule = self.schedule
+        if schedule.has_random and reset_slots is not None:
+            self.random_positions[reset_slots] = self.sampler.draw(
+                len(self._slots[reset_slots])
+            )
+        if self.task.targets is not None and reset_slots is not None:
+            self.targets[reset_slots] = self.task.sample_targets(
+                len(self._slots[reset_slots]), self.sampler.rng
+            )
+        lit = schedule.frame_coordinates(
+            self.times, self.random_positions, self._episode_targets()
+        )
+        if self.encoder.needs_frames:
+            obs = self.observations
+            obs[self._lit[0], self._lit[1], self._lit[2], 0] = 0
+            obs[lit[0], lit[1], lit[2], 0] = 1
+        self._lit = lit
+
+    def _episode_targets(self) -> Optional[np.ndarray]:
+        """Helper function that returns the per-slot targets, or None when every slot shares
+        the target of the task.
+        """
+        return None if self.task.targets is None else self.targets
+
+    def _instrument(self, profiler: Profiler) -> None:
+        """Helper function that attaches profiler to the hot paths of the env and of its task.
+        Steps and resets are counted per slot.
+        """
+        sampler = self.sampler
+        profiler.instrument(
+            self, "step", "vector.step", counter="steps", amount=lambda a: self.num_envs
+        )
+        profiler.instrument(
+            self,
+            "reset",
+            "vector.reset",
+            counter="resets",
+            amount=lambda indices=None: (
+                self.num_envs if indices is None else len(self._slots[indices])
+            ),
+        )
+        profiler.instrument(
+            self,
+            "_render",
+            "vector.render",
+            counter="pixels_written",
+            amount=lambda reset_slots=None: len(self._lit[0]),
+        )
+        profiler.instrument(self, "_encode", "vector.encode")
+        profiler.instrument(sampler, "draw", "vector.rng")
+        profiler.instrument(
+            sampler,
+            "_draw_block",
+            "vector.rng.generator",
+            counter="rng_draws",
+            amount=lambda n: 2 * n * len(sampler.scale),
+        )
+        profiler.instrument(self.task, "score_batch", "task.score_batch")
+
+    def _encode(self, peek: bool = False) -> Any:
+        """Helper function that encodes the frames of every slot in the observation mode. peek
+        leaves the state of stateful encodings untouched.
+        """
+        frames = self.observations if self.encoder.needs_frames else None
+        encode = self.encoder.peek if peek else self.encoder.encode
+        return encode(frames, self._lit, self.focus)
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.envs.observation import make_encoder
+from rlbrainmaturation.envs.recorder import TrajectoryRecorder
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from rlbrainmaturation.tasks.task import Task
+from typing import Any, Callable, Dict, Optional
+
+# a batched policy maps the observations and frames of every episode to (n, 2) saccades
+BatchPolicy = Callable[[Any, np.ndarray], np.ndarray]
+
+
+def evaluate(
+    task: Task,
+    policy: BatchPolicy,
+    n_episodes: int = 1024,
+    observation_mode: str = "dense",
+    rng: Optional[np.random.Generator] = None,
+    bins: int = 32,
+    recorder: Optional[TrajectoryRecorder] = None,
+) -> Dict[str, Any]:
+    """Runs n_episodes evaluation episodes of task together and summarizes the final saccades.
+
+    All episodes advance in lockstep on one VectorEnvironment, so the policy is queried once per
+    time step for the whole batch and the cost barely grows with n_episodes.
+
+    Args:
+        task: Task
+            The task to evaluate on.
+        policy: Callable[[Any, np.ndarray], np.ndarray]
+            Maps the batched observations and the frame of every episode to the (n, 2) saccades.
+        n_episodes: int
+            Number of episodes.
+        observation_mode: str
+            Observation mode handed to the policy, as in Environment.
+        rng: Optional[np.random.Generator]
+            Stream of the randomized signals. Default spawns a new stream from the task seed.
+        bins: int
+            Number of bins of the histogram of saccade distances.
+        recorder: Optional[TrajectoryRecorder]
+            Records every evaluation step when given.
+
+    Returns:
+        Report with the mean and variance of the final-step reward, the hit rate under the
+        epsilon criterion of the task (squared distance to the target below epsilon), and the
+        distribution of the saccade errors (final saccade minus target of the episode).
+    """
+    assert task.tot_frames > 1, "evaluate needs a task with at least one step (tot_frames > 1)"
+    env = VectorEnvironment(
+        {
+            "task": task,
+            "num_envs": n_episodes,
+            "observation_mode": observation_mode,
+            "rng": rng,
+        }
+    )
+    if recorder is not None:
+        task_id = recorder.task_id(task)
+        episodes = recorder.new_episodes(n_episodes)
+        coordinates = make_encoder(
+            "coords", task.width, task.height, env.schedule.max_signals
+        )
+
+    observations = env.reset()
+    for _ in range(task.tot_frames - 1):
+        times = env.times.copy()
+        targets = env.targets.copy()  # redrawn for the slots reset by the last step
+        if recorder is not None:
+            seen = coordinates.encode(None, env.lit, env.focus)
+        actions = np.asarray(policy(observations, times)).reshape(n_episodes, 2)
+        observations, rewards, _, _ = env.step(actions)
+        if recorder is not None:
+            recorder.append(
+                {
+                    "episode": episodes,
+                    "time": times,
+                    "task": np.full(n_episodes, task_id),
+                    "action": actions,
+                    "target": targets,
+                    "reward": rewards,
+                    "num_lit": seen["mask"].sum(axis=1),
+                    "lit": np.where(seen["mask"][..., None] == 1, seen["coords"], -1),
+                }
+            )
+    # every slot finished exactly one episode, with actions and rewards of its final step
+    return summarize(task, actions, rewards, bins=bins, targets=targets)
+
+
+def evaluate_tasks(
+    tasks: Dict[str, Task], policy: BatchPolicy, **kwargs: Any
+) -> Dict[str, Dict[str, Any]]:
+    """Evaluates policy on every task. Takes the keyword arguments of evaluate.
+    """
+    return {name: evaluate(task, policy, **kwargs) for name, task in tasks.items()}
+
+
+def summarize(
+    task: Task,
+    actions: np.ndarray,
+    rewards: np.ndarray,
+    bins: int = 32,
+    targets: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """Summarizes the final saccades and rewards of a batch of episodes.
+    Args:
+        task: Task
+            The evaluated task.
+        actions: np.ndarray
+            Integer array of shape (n, 2) with the final saccade of every episode.
+        rewards: np.ndarray
+            Final-step reward of every episode.
+        bins: int
+            Number of bins of the histogram of saccade distances.
+        targets: Optional[np.ndarray]
+            Integer array of shape (n, 2) with the target of every episode. Default is the
+            target of the task.
+    """
+    errors = actions - (np.asarray(task.target_pos) if targets is None else targets)
+    distance_square = (errors ** 2).sum(axis=1)
+    distances = np.sqrt(distance_square)
+    counts, edges = np.histogram(
+        distances, bins=bins, range=(0.0, float(np.hypot(task.width, task.height)))
+    )
+    return {
+        "n_episodes": len(rewards),
+        "reward_mean": float(rewards.mean()),
+        "reward_var": float(rewards.var()),
+        "hit_rate": float((distance_square < task.epsilon).mean()),
+        "epsilon": float(task.epsilon),
+        "error": {
+            "mean_x": float(errors[:, 0].mean()),
+            "mean_y": float(errors[:, 1].mean()),
+            "mean_distance": float(distances.mean()),
+            "percentiles": {
+                f"p{q}": float(np.percentile(distances, q)) for q in (50, 90, 99)
+            },
+            "histogram": {"bin_edges": edges.tolist(), "counts": counts.tolist()},
+        },
+    }
@@ -0,0 +1,352 @@
+from __future__ import annotations
+import numpy as np
+from rlbrainmaturation.tasks.task import Task
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+
+class RunningMoments:
+    """Streaming mean and variance of batches of values, in constant memory.
+
+    Every batch is reduced to its own count, mean and sum of squared deviations, which are then
+    combined with the running ones by the parallel form of Welford's algorithm (Chan et al.).
+    The same combination merges the moments gathered by different workers, so the result does
+    not depend on how the values were batched or split.
+    """
+
+    def __init__(self, shape: Tuple[int, ...] = ()) -> None:
+        """
+        Args:
+            shape: Tuple[int, ...]
+                Shape of one value, e.g. (2,) for the (x, y) errors of one saccade.
+        """
+        self.shape = tuple(shape)
+        self.count = 0
+        self.mean = np.zeros(self.shape, dtype=np.float64)
+        self.m2 = np.zeros(self.shape, dtype=np.float64)
+
+    def update(self, values: np.ndarray) -> None:
+        """Adds a batch of values of shape (n,) + shape.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape((-1,) + self.shape)
+        if len(values) == 0:
+            return
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        self._combine(len(values), mean, m2)
+
+    def merge(self, other: RunningMoments) -> RunningMoments:
+        """Adds the values gathered by other, in place. Returns self.
+        """
+        assert other.shape == self.shape, "Cannot merge moments of different shapes"
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+        return self
+
+    @property
+    def var(self) -> np.ndarray:
+        """Population variance, 0 before the first value.
+        """
+        return self.m2 / max(self.count, 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.var)
+
+    def _combine(self, count: int, mean: np.ndarray, m2: np.ndarray) -> None:
+        """Helper function that folds the moments of count values into the running ones.
+        """
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+
+
+class FixedHistogram:
+    """Streaming histogram with bins of equal width fixed in advance, in constant memory.
+
+    Values below low or above high are counted in the first or last bin, so the total of the
+    counts is the number of values. Histograms with the same bins merge by adding their counts.
+    """
+
+    def __init__(self, low: float, high: float, bins: int = 32) -> None:
+        """
+        Args:
+            low: float
+                Left edge of the first bin.
+            high: float
+                Right edge of the last bin.
+            bins: int
+                Number of bins.
+        """
+        assert high > low, "The histogram range has to be non-empty"
+        assert bins >= 1, "The histogram needs at least one bin"
+        self.low = float(low)
+        self.high = float(high)
+        self.bins = bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    @property
+    def edges(self) -> np.ndarray:
+        """Array of the bins + 1 bin edges.
+        """
+        return np.linspace(self.low, self.high, self.bins + 1)
+
+    def update(self, values: np.ndarray) -> None:
+        """Counts a batch of values.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        index = np.floor((values - self.low) * (self.bins / (self.high - self.low)))
+        index = np.clip(index, 0, self.bins - 1).astype(np.int64)
+        self.counts += np.bincount(index, minlength=self.bins)
+
+    def merge(self, other: FixedHistogram) -> FixedHistogram:
+        """Adds the counts of other, in place. Returns self.
+        """
+        assert (other.low, other.high, other.bins) == (
+            self.low,
+            self.high,
+            self.bins,
+        ), "Cannot merge histograms with different bins"
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (q in [0, 1]), interpolated linearly within its bin. Returns
+        nan before the first value.
+        """
+        total = self.counts.sum()
+        if total == 0:
+            return float("nan")
+        cumulative = np.cumsum(self.counts)
+        rank = q * total
+        i = min(int(np.searchsorted(cumulative, rank)), self.bins - 1)
+        below = cumulative[i] - self.counts[i]
+        fraction = (rank - below) / self.counts[i] if self.counts[i] else 0.0
+        width = (self.high - self.low) / self.bins
+        return float(self.low + (i + fraction) * width)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"bin_edges": self.edges.tolist(), "counts": self.counts.tolist()}
+
+
+class SaccadeMetrics:
+    """Streaming statistics of the saccade endpoints relative to the target.
+
+    Updated from batches of (action, target) arrays, e.g. the actions of every training step of
+    a VectorEnvironment with its targets, it tracks in constant memory:
+        - the moments (Welford) and histograms of the per-axis errors, action minus target,
+        - the moments and histogram of the radial error, the distance to the target,
+        - the hit rate at several epsilons, with the criterion of Task.score (squared distance
+          below epsilon),
+        - the moments of the rewards, when given,
+        - for anti-saccade tasks such as Gap and Overlap, the rate of direction errors, i.e. of
+          saccades towards the cue's side of the mirror point instead of the target's side.
+    Metrics of different workers merge exactly, so each worker can keep its own and the
+    learner merges them before calling summary. Call reset after logging a summary to track
+    the statistics over windows of training time.
+    """
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        epsilons: Sequence[float] = (1.0,),
+        bins: int = 32,
+        target: Optional[Tuple[int, int]] = None,
+        mirror: Optional[Tuple[float, float]] = None,
+    ) -> None:
+        """
+        Args:
+            width: int
+                The width of the screen.
+            height: int
+                The height of the screen.
+            epsilons: Sequence[float]
+                Thresholds of the squared distance at which hit rates are tracked.
+            bins: int
+                Number of bins of every histogram.
+            target: Optional[Tuple[int, int]]
+                Target of the updates that do not give their own targets.
+            mirror: Optional[Tuple[float, float]]
+                Point the cue of an anti-saccade task is mirrored through. A saccade whose
+                vector from the mirror point does not point to the target's side is a
+                direction error. Default does not track direction errors.
+        """
+        self.width = width
+        self.height = height
+        self.epsilons = np.asarray(sorted(epsilons), dtype=np.float64)
+        self.bins = bins
+        self.target = None if target is None else np.asarray(target, dtype=np.int64)
+        self.mirror = None if mirror is None else np.asarray(mirror, dtype=np.float64)
+        self.reset()
+
+    @classmethod
+    def from_task(
+        cls, task: Task, epsilons: Optional[Sequence[float]] = None, bins: int = 32
+    ) -> SaccadeMetrics:
+        """Builds the metrics of task: its screen and target, its epsilon unless epsilons are
+        given, and the mirror point of its anti-saccade cue, if any.
+        """
+        return cls(
+            task.width,
+            task.height,
+            epsilons=(task.epsilon,) if epsilons is None else epsilons,
+            bins=bins,
+            target=tuple(task.target_pos),
+            mirror=mirror_point(task),
+        )
+
+    def reset(self) -> None:
+        """Drops every value gathered so far.
+        """
+        self.errors = RunningMoments((2,))
+        self.distances = RunningMoments()
+        self.rewards = RunningMoments()
+        self.x_histogram = FixedHistogram(-self.width, self.width, self.bins)
+        self.y_histogram = FixedHistogram(-self.height, self.height, self.bins)
+        self.distance_histogram = FixedHistogram(
+            0.0, float(np.hypot(self.width, self.height)), self.bins
+        )
+        self.hits = np.zeros(len(self.epsilons), dtype=np.int64)
+        self.direction_errors = 0
+
+    @property
+    def count(self) -> int:
+        """Number of saccades gathered.
+        """
+        return self.errors.count
+
+    def update(
+        self,
+        actions: np.ndarray,
+        targets: Optional[np.ndarray] = None,
+        rewards: Optional[np.ndarray] = None,
+        mask: Optional[np.ndarray] = None,
+    ) -> None:
+        """Adds a batch of saccades.
+        Args:
+            actions: np.ndarray
+                Integer array of shape (n, 2) with the (x, y) saccades.
+            targets: Optional[np.ndarray]
+                Integer array of shape (n, 2) with the target of every saccade. Default is the
+                target the metrics were built with.
+            rewards: Optional[np.ndarray]
+                Reward of every saccade.
+            mask: Optional[np.ndarray]
+                Boolean array of shape (n,) selecting the saccades to add, e.g. the scored steps
+                of info["valid"] of MultiTaskVectorEnvironment. Default adds all of them.
+        """
+        actions = np.asarray(actions, dtype=np.int64).reshape(-1, 2)
+        if targets is None:
+            assert self.target is not None, "The targets are required without a default target"
+            targets = np.broadcast_to(self.target, actions.shape)
+        targets = np.asarray(targets, dtype=np.int64).reshape(-1, 2)
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)
+            actions, targets = actions[mask], targets[mask]
+            rewards = None if rewards is None else np.asarray(rewards)[mask]
+        if len(actions) == 0:
+            return
+
+        errors = actions - targets
+        distance_square = (errors ** 2).sum(axis=1)
+        distances = np.sqrt(distance_square)
+        self.errors.update(errors)
+        self.distances.update(distances)
+        self.x_histogram.update(errors[:, 0])
+        self.y_histogram.update(errors[:, 1])
+        self.distance_histogram.update(distances)
+        self.hits += (distance_square[:, None] < self.epsilons[None, :]).sum(axis=0)
+        if rewards is not None:
+            self.rewards.update(rewards)
+        if self.mirror is not None:
+            # wrong side of the mirror point: the saccade went towards the cue
+            alignment = ((actions - self.mirror) * (targets - self.mirror)).sum(axis=1)
+            self.direction_errors += int((alignment <= 0).sum())
+
+    def merge(self, other: SaccadeMetrics) -> SaccadeMetrics:
+        """Adds the saccades gathered by other, e.g. by another worker, in place. Returns self.
+        """
+        assert np.array_equal(
+            other.epsilons, self.epsilons
+        ), "Cannot merge metrics with different epsilons"
+        assert (other.mirror is None) == (
+            self.mirror is None
+        ), "Cannot merge metrics with and without direction errors"
+        self.errors.merge(other.errors)
+        self.distances.merge(other.distances)
+        self.rewards.merge(other.rewards)
+        self.x_histogram.merge(other.x_histogram)
+        self.y_histogram.merge(other.y_histogram)
+        self.distance_histogram.merge(other.distance_histogram)
+        self.hits += other.hits
+        self.direction_errors += other.direction_errors
+        return self
+
+    def summary(self) -> Dict[str, Any]:
+        """Report of the saccades gathered so far, with the keys of harness.summarize where
+        they apply. The percentiles are interpolated from the distance histogram.
+        """
+        n = max(self.count, 1)
+        report: Dict[str, Any] = {
+            "n_episodes": self.count,
+            "hit_rate": {
+                float(eps): float(hits / n) for eps, hits in zip(self.epsilons, self.hits)
+            },
+            "error": {
+                "mean_x": float(self.errors.mean[0]),
+                "mean_y": float(self.errors.mean[1]),
+                "var_x": float(self.errors.var[0]),
+                "var_y": float(self.errors.var[1]),
+                "mean_distance": float(self.distances.mean),
+                "var_distance": float(self.distances.var),
+                "percentiles": {
+                    f"p{q}": self.distance_histogram.quantile(q / 100) for q in (50, 90, 99)
+                },
+                "histogram": self.distance_histogram.to_dict(),
+                "x_histogram": self.x_histogram.to_dict(),
+                "y_histogram": self.y_histogram.to_dict(),
+            },
+        }
+        if self.rewards.count:
+            report["reward_mean"] = float(self.rewards.mean)
+            report["reward_var"] = float(self.rewards.var)
+        if self.mirror is not None:
+            report["direction_error_rate"] = float(self.direction_errors / n)
+        return report
+
+
+def merge(metrics: Iterable[SaccadeMetrics]) -> SaccadeMetrics:
+    """Merges the metrics of several workers into a new SaccadeMetrics, leaving them unchanged.
+    """
+    metrics = list(metrics)
+    assert metrics, "Nothing to merge"
+    first = metrics[0]
+    merged = SaccadeMetrics(
+        first.width,
+        first.height,
+        epsilons=first.epsilons,
+        bins=first.bins,
+        target=None if first.target is None else tuple(first.target),
+        mirror=None if first.mirror is None else tuple(first.mirror),
+    )
+    for other in metrics:
+        merged.merge(other)
+    return merged
+
+
+def mirror_point(task: Task) -> Optional[Tuple[float, float]]:
+    """Point through which the anti-saccade cue of task (a signal with target_coef -1, as in Gap
+    and Overlap) mirrors the target, i.e. the midpoint of the cue and the target. Returns None
+    for tasks without such a cue.
+    """
+    schedule = task.compile()
+    mirrored = (schedule.fixed_coef == -1) & schedule.fixed_mask
+    if not mirrored.any():
+        return None
+    t, i = np.argwhere(mirrored)[0]
+    return (
+        float(schedule.fixed_x[t, i] + schedule.target[0]) / 2,
+        float(schedule.fixed_y[t, i] + schedule.target[1]) / 2,
+    )
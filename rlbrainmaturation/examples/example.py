@@ -2,16 +2,17 @@ from rlbrainmaturation.tasks.task import Task, Instruction
 from rlbrainmaturation.tasks.odr import ODR
 from rlbrainmaturation.tasks.gap import Gap
 from rlbrainmaturation.tasks.odr_distract import ODRDistract
-from rlbrainmaturation.envs.environment import Environment
-
-import ray
-from ray.rllib.agents.ppo import PPOTrainer
-from ray.rllib.agents.a3c import A2CTrainer
-from ray.tune.registry import register_env
+from rlbrainmaturation.tasks.registry import describe_task
 import numpy as np
 
 
 def main() -> None:
+    # gym and ray are optional dependencies, only loaded once the example runs
+    import ray
+    from rlbrainmaturation.envs.recorder import TrajectoryRecorder
+    from rlbrainmaturation.evaluation.harness import evaluate
+    from rlbrainmaturation.integrations.rllib import batched_policy, make_trainer
+
     ray.init()
     np.random.seed(0)
 
@@ -31,12 +32,12 @@ def main() -> None:
 
     # task = ODR(target_x=1, target_y=5, width=42, height=42)
     # task = Gap(target_x=1, target_y=5, width=42, height=42)
-    task = ODRDistract(target_x=1, target_y=5, width=42, height=42)
-
-    def env_creator(env_config):
-        return Environment(env_config)  # return an env instance
-
-    register_env("my_env", env_creator)
+    # task = ODRDistract(target_x=1, target_y=5, width=42, height=42)
+    # the workers rebuild the task from this small descriptor, each with its own random stream
+    descriptor = describe_task(
+        "ODRDistract", seed=0, target_x=1, target_y=5, width=42, height=42
+    )
+    task = descriptor.build()
 
     # trainer_config = DEFAULT_CONFIG.copy()
     # trainer_config["num_workers"] = 1
@@ -44,87 +45,51 @@ def main() -> None:
     # trainer_config["sgd_minibatch_size"] = 15  # 32
     # trainer_config["num_sgd_iter"] = 50
 
-    trainer = PPOTrainer(
-        env="my_env",
-        config={
-            "env_config": {"task": task},
+    # one of rlbrainmaturation.integrations.rllib.TRAINERS, e.g. "PPO", "A2C" or "DQN"
+    algorithm = "PPO"
+    trainer_configs = {
+        "PPO": {
             "framework": "torch",
             "num_workers": 1,
             "train_batch_size": 10,
             "sgd_minibatch_size": 5,
             "num_sgd_iter": 10,
-            # "model": {
-            #     # Whether to wrap the model with an LSTM.
-            #     "use_lstm": True,
-            #     # Max seq len for training the LSTM, defaults to 20.
-            #     "max_seq_len": task.tot_frames - 1,
-            #     # # Size of the LSTM cell.
-            #     "lstm_cell_size": task.tot_frames - 1,
-            #     # # Whether to feed a_{t-1}, r_{t-1} to LSTM.
-            #     # # "lstm_use_prev_action_reward": False,
-            # },
-        },
-    )
-
-    trainer = A2CTrainer(
-        env="my_env",
-        config={
-            "env_config": {"task": task},
-            "framework": "torch",
-            "num_workers": 1,
-            "train_batch_size": 10,
-            # "model": {
-            #     # Whether to wrap the model with an LSTM.
-            #     "use_lstm": True,
-            #     # Max seq len for training the LSTM, defaults to 20.
-            #     "max_seq_len": task.tot_frames - 1,
-            #     # # Size of the LSTM cell.
-            #     "lstm_cell_size": task.tot_frames - 1,
-            #     # # Whether to feed a_{t-1}, r_{t-1} to LSTM.
-            #     # # "lstm_use_prev_action_reward": False,
-            # },
         },
+        "A2C": {"framework": "torch", "num_workers": 1, "train_batch_size": 10},
+        "DQN": {"framework": "torch", "num_workers": 1, "train_batch_size": 10},
+        # "model": {
+        #     # Whether to wrap the model with an LSTM.
+        #     "use_lstm": True,
+        #     # Max seq len for training the LSTM, defaults to 20.
+        #     "max_seq_len": task.tot_frames - 1,
+        #     # # Size of the LSTM cell.
+        #     "lstm_cell_size": task.tot_frames - 1,
+        #     # # Whether to feed a_{t-1}, r_{t-1} to LSTM.
+        #     # # "lstm_use_prev_action_reward": False,
+        # },
+    }
+    trainer = make_trainer(algorithm, {"task": descriptor}, trainer_configs[algorithm])
+
+    # evaluation steps are kept on disk, read them back with TrajectoryReader("trajectories")
+    recorder = TrajectoryRecorder(
+        "trajectories", max_signals=task.compile().max_signals, metadata={"algorithm": algorithm}
     )
-
-    # trainer = DQNTrainer(
-    #     env="my_env",
-    #     config={
-    #         "env_config": {"task": task},
-    #         "framework": "torch",
-    #         "num_workers": 1,
-    #         "train_batch_size": 10,
-    #         # "model": {
-    #         #     # Whether to wrap the model with an LSTM.
-    #         #     "use_lstm": True,
-    #         #     # Max seq len for training the LSTM, defaults to 20.
-    #         #     "max_seq_len": task.tot_frames - 1,
-    #         #     # # Size of the LSTM cell.
-    #         #     "lstm_cell_size": task.tot_frames - 1,
-    #         #     # # Whether to feed a_{t-1}, r_{t-1} to LSTM.
-    #         #     # # "lstm_use_prev_action_reward": False,
-    #         # },
-    #     },
-    # )
-
-    env = Environment(env_config={"task": task})
+    # K evaluation episodes run together, with one policy query per frame for the whole batch
+    policy = batched_policy(trainer)
 
     for i in range(200):
         print(f"Training iteration {i}...")
         trainer.train()
+        recorder.set_context(iteration=i)
 
-        done = False
-        cumulative_reward = 0.0
-        observation = env.reset()
-
-        while not done:
-            action = trainer.compute_action(observation)
-
-            observation, reward, done, results = env.step(action)
-            print(f"Time: {env.time}. Action: {action}")
-            cumulative_reward += reward
+        report = evaluate(task, policy, n_episodes=1024, recorder=recorder)
         print(
-            f"Last step reward: {reward: .3e}; Cumulative reward: {cumulative_reward:.3e}"
+            f"Last step reward: {report['reward_mean']: .3e} "
+            f"+/- {report['reward_var'] ** 0.5:.3e}; "
+            f"Hit rate: {report['hit_rate']:.3f}; "
+            f"Median saccade error: {report['error']['percentiles']['p50']:.2f}"
         )
+    recorder.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,190 @@
+"""Parallel, resumable sweeps over task x seed x hyperparameter grids.
+
+A sweep file describes the grid and the values shared by every run:
+
+    {
+        "grid": {"task": ["ODR", "Gap", "Overlap"], "seed": [0, 1, 2], "learning_rate": [0.1, 0.5]},
+        "fixed": {"iterations": 200, "num_envs": 1024}
+    }
+
+    python -m rlbrainmaturation.experiments.sweep sweep.json --output runs/ --max-workers 8
+
+Every run gets its own directory under the output directory, named by the hash of its config,
+holding config.json, metrics.jsonl (one line per training iteration, written as it trains) and
+result.json once it finished. Runs with a result.json are skipped, so an interrupted sweep is
+resumed by starting it again. state.json keeps the status of every run of the sweep.
+"""
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import os
+import sys
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from rlbrainmaturation.experiments.training import MetricsLogger, train_native
+
+TrainFunction = Callable[[Dict[str, Any], MetricsLogger], Dict[str, Any]]
+
+
+def expand_grid(
+    grid: Dict[str, Sequence[Any]], fixed: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """Expands a grid of values into the list of every combination, in a deterministic order.
+    Args:
+        grid: Dict[str, Sequence[Any]]
+            Values of every swept key.
+        fixed: Optional[Dict[str, Any]]
+            Values shared by every run.
+    """
+    keys = sorted(grid)
+    return [
+        dict(fixed or {}, **dict(zip(keys, values)))
+        for values in itertools.product(*(grid[key] for key in keys))
+    ]
+
+
+def run_id(config: Dict[str, Any]) -> str:
+    """Stable identifier of a run config, used as the name of its directory.
+    """
+    canonical = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()[:12]
+
+
+class Sweep:
+    """Schedules the runs of a sweep on a local process pool.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        configs: List[Dict[str, Any]],
+        train_fn: TrainFunction = train_native,
+        max_workers: Optional[int] = None,
+    ):
+        """
+        Args:
+            output_dir: str
+                Directory holding the state of the sweep and one directory per run.
+            configs: List[Dict[str, Any]]
+                Config of every run, e.g. from expand_grid.
+            train_fn: Callable[[Dict[str, Any], MetricsLogger], Dict[str, Any]]
+                Module-level function training one config, called with a logger of per-iteration
+                metrics and returning the final metrics. Default trains the NumPy agents.
+            max_workers: Optional[int]
+                Maximum number of runs at once. Default is the number of CPUs.
+        """
+        self.output_dir = output_dir
+        self.configs = {run_id(config): config for config in configs}
+        self.train_fn = train_fn
+        self.max_workers = max_workers or os.cpu_count()
+        self.state_path = os.path.join(output_dir, "state.json")
+
+    def run_dir(self, rid: str) -> str:
+        """Directory of the run rid.
+        """
+        return os.path.join(self.output_dir, "runs", rid)
+
+    def is_done(self, rid: str) -> bool:
+        """Whether the run rid already finished, i.e. wrote its result.
+        """
+        return os.path.exists(os.path.join(self.run_dir(rid), "result.json"))
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """Runs every unfinished config, at most max_workers at once.
+
+        Returns:
+            The state of the sweep: status ("done", "failed" or "skipped") of every run.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        state = {
+            rid: {"status": "pending", "config": config}
+            for rid, config in self.configs.items()
+        }
+        pending = []
+        for rid in self.configs:
+            if self.is_done(rid):
+                state[rid]["status"] = "skipped"
+            else:
+                pending.append(rid)
+        self._save_state(state)
+
+        with concurrent.futures.ProcessPoolExecutor(self.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _run_one, self.run_dir(rid), self.configs[rid], self.train_fn
+                ): rid
+                for rid in pending
+            }
+            for rid in pending:
+                state[rid]["status"] = "running"
+            self._save_state(state)
+            for future in concurrent.futures.as_completed(futures):
+                rid = futures[future]
+                error = future.exception()
+                if error is None:
+                    state[rid]["status"] = "done"
+                    state[rid]["result"] = future.result()
+                else:
+                    state[rid]["status"] = "failed"
+                    state[rid]["error"] = "".join(
+                        traceback.format_exception(type(error), error, error.__traceback__)
+                    )
+                self._save_state(state)
+        return state
+
+    def _save_state(self, state: Dict[str, Dict[str, Any]]) -> None:
+        """Helper function that atomically rewrites state.json.
+        """
+        _write_json(self.state_path, state)
+
+
+def _run_one(
+    run_dir: str, config: Dict[str, Any], train_fn: TrainFunction
+) -> Dict[str, Any]:
+    """Worker function that trains one config and streams its metrics to run_dir.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    _write_json(os.path.join(run_dir, "config.json"), config)
+    # an interrupted earlier attempt is restarted from scratch
+    with open(os.path.join(run_dir, "metrics.jsonl"), "w") as metrics_file:
+
+        def log(metrics: Dict[str, Any]) -> None:
+            metrics_file.write(json.dumps(metrics) + "\n")
+            metrics_file.flush()
+
+        result = train_fn(config, log)
+    _write_json(os.path.join(run_dir, "result.json"), result)
+    return result
+
+
+def _write_json(path: str, data: Any) -> None:
+    """Helper function that writes JSON through a temporary file, so readers never see half a file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(data, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sweep", help="Path to the sweep JSON file.")
+    parser.add_argument("--output", required=True, help="Output directory of the sweep.")
+    parser.add_argument("--max-workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    with open(args.sweep) as fh:
+        spec = json.load(fh)
+    configs = expand_grid(spec.get("grid", {}), spec.get("fixed"))
+    state = Sweep(args.output, configs, max_workers=args.max_workers).run()
+    statuses = [run["status"] for run in state.values()]
+    print(json.dumps({status: statuses.count(status) for status in set(statuses)}))
+    return 1 if "failed" in statuses else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+from __future__ import annotations
+import inspect
+import numpy as np
+from rlbrainmaturation.agents.growing import GrowingAgent
+from rlbrainmaturation.agents.policy_gradient import PolicyGradientAgent
+from rlbrainmaturation.agents.q_learning import QLearningAgent
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from rlbrainmaturation.tasks.registry import make_task
+from typing import Any, Callable, Dict
+
+# agent classes by name, as used in sweep configs
+AGENTS = {
+    "growing": GrowingAgent,
+    "policy_gradient": PolicyGradientAgent,
+    "q_learning": QLearningAgent,
+}
+
+# config keys forwarded to the task constructor
+TASK_KEYS = ("target_x", "target_y", "width", "height", "encourage_mode")
+
+MetricsLogger = Callable[[Dict[str, Any]], None]
+
+
+def train_native(config: Dict[str, Any], log: MetricsLogger) -> Dict[str, Any]:
+    """Trains one of the NumPy agents on a batched env, as described by a flat sweep config.
+
+    Args:
+        config: Dict[str, Any]
+            Run config with "task" (a name of tasks.registry.TASKS), optional task arguments
+            (target_x, target_y, width, height, encourage_mode), "agent" (a name of AGENTS,
+            default "policy_gradient"), "num_envs" (default 1024), "iterations" (default 100),
+            "seed", and any keyword argument of the agent constructor, e.g. "learning_rate".
+        log: Callable[[Dict[str, Any]], None]
+            Called with the metrics of every training iteration.
+
+    Returns:
+        Metrics of the last iteration.
+    """
+    task = make_task(
+        config["task"], **{key: config[key] for key in TASK_KEYS if key in config}
+    )
+    # independent streams for the env and the agent, both derived from the run seed
+    env_seed, agent_seed = np.random.SeedSequence(config.get("seed")).spawn(2)
+    env = VectorEnvironment(
+        {
+            "task": task,
+            "num_envs": config.get("num_envs", 1024),
+            "observation_mode": "coords",
+            "rng": np.random.default_rng(env_seed),
+        }
+    )
+    agent_class = AGENTS[config.get("agent", "policy_gradient")]
+    agent_params = inspect.signature(agent_class.__init__).parameters
+    agent = agent_class(
+        env,
+        seed=agent_seed,
+        **{
+            key: value
+            for key, value in config.items()
+            if key in agent_params and key not in ("self", "env", "seed")
+        },
+    )
+
+    metrics: Dict[str, Any] = {}
+    for iteration in range(config.get("iterations", 100)):
+        metrics = {"iteration": iteration, **agent.train(1)[0]}
+        log(metrics)
+    return metrics
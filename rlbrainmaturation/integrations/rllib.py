@@ -0,0 +1,84 @@
+"""Ray/RLlib integration. ray is only imported when one of these functions is called.
+"""
+from __future__ import annotations
+import importlib
+import numpy as np
+from typing import Any, Callable, Dict, Optional
+
+# import path of the RLlib trainer class of every supported algorithm
+TRAINERS = {
+    "PPO": ("ray.rllib.agents.ppo", "PPOTrainer"),
+    "A2C": ("ray.rllib.agents.a3c", "A2CTrainer"),
+    "A3C": ("ray.rllib.agents.a3c", "A3CTrainer"),
+    "DQN": ("ray.rllib.agents.dqn", "DQNTrainer"),
+}
+
+DEFAULT_ENV_NAME = "brain_maturation_env"
+
+
+def env_creator(env_config: Dict[str, Any]) -> Any:
+    """Builds the gym-compatible Environment from an RLlib env_config.
+    """
+    from rlbrainmaturation.envs.environment import Environment
+
+    return Environment(env_config)  # return an env instance
+
+
+def register_env(name: str = DEFAULT_ENV_NAME) -> str:
+    """Registers the Environment with ray.tune under name. ray is imported on first use.
+    """
+    from ray.tune.registry import register_env as ray_register_env
+
+    ray_register_env(name, env_creator)
+    return name
+
+
+def make_trainer(
+    algorithm: str,
+    env_config: Dict[str, Any],
+    config: Optional[Dict[str, Any]] = None,
+    env_name: str = DEFAULT_ENV_NAME,
+) -> Any:
+    """Builds an RLlib trainer on the registered Environment, importing only that trainer.
+    Args:
+        algorithm: str
+            One of TRAINERS, e.g. "PPO" or "A2C".
+        env_config: Dict[str, Any]
+            Environment config dictionary, i.e. env_config = {"task": Task}. A TaskDescriptor
+            is cheaper to ship to the workers than a Task, see tasks.registry.describe_task.
+        config: Optional[Dict[str, Any]]
+            Additional trainer config, e.g. {"framework": "torch", "num_workers": 1}.
+        env_name: str
+            Name the Environment is registered under.
+    """
+    assert (
+        algorithm in TRAINERS
+    ), f"Unknown algorithm {algorithm}, expected one of {list(TRAINERS)}"
+    module_name, class_name = TRAINERS[algorithm]
+    trainer_class = getattr(importlib.import_module(module_name), class_name)
+    register_env(env_name)
+    return trainer_class(env=env_name, config=dict(config or {}, env_config=env_config))
+
+
+def batched_policy(
+    trainer: Any, policy_id: str = "default_policy", explore: bool = False
+) -> Callable[[Any, np.ndarray], np.ndarray]:
+    """Wraps the policy of an RLlib trainer as a batched policy of evaluation.harness.evaluate,
+    computing the actions of a whole batch of observations in one call.
+    Args:
+        trainer: Any
+            RLlib trainer, e.g. from make_trainer.
+        policy_id: str
+            Id of the policy to evaluate.
+        explore: bool
+            Whether to sample exploratory actions instead of the deterministic ones.
+    """
+    policy = trainer.get_policy(policy_id)
+
+    def compute_actions(observations: Any, times: np.ndarray) -> np.ndarray:
+        actions = policy.compute_actions(observations, explore=explore)[0]
+        if isinstance(actions, (tuple, list)):  # one array per component of the Tuple space
+            actions = np.stack(actions, axis=1)
+        return np.asarray(actions)
+
+    return compute_actions
@@ -39,7 +39,11 @@ class Gap(Task):
 
         instructions: Dict[int, List[Instruction]] = {
             0: [Instruction(time=0, x=5, y=5)],  # fixation
-            2: [Instruction(time=1, x=width - target_x, y=height - target_y)],  # cue
+            2: [
+                Instruction(
+                    time=1, x=width - target_x, y=height - target_y, target_coef=-1
+                )
+            ],  # cue
         }
 
         super().__init__(
@@ -41,7 +41,7 @@ class ODR(Task):
             0: [Instruction(time=0, x=5, y=5)],  # fixation
             1: [
                 Instruction(time=1, x=5, y=5),  # fixation
-                Instruction(time=1, x=target_x, y=target_y),
+                Instruction(time=1, x=target_x, y=target_y, target_coef=1),
             ],  # cue
             2: [Instruction(time=2, x=5, y=5)],  # fixation
         }
@@ -3,6 +3,7 @@ from typing import Dict, List, Tuple, Union
 from rlbrainmaturation.tasks.task import Task, Instruction
 import numpy as np
 from rlbrainmaturation.utils.general_utils import Coordinates
+from rlbrainmaturation.utils.random_utils import Seed
 
 
 class ODRDistract(Task):
@@ -23,6 +24,7 @@ class ODRDistract(Task):
         width: int = 42,
         height: int = 42,
         encourage_mode: bool = True,
+        seed: Seed = None,
     ):
         """
         Args:
@@ -37,19 +39,21 @@ class ODRDistract(Task):
             encourage_mode: bool
                 Encourage mode or not. Default value is True, which allows to return the score as np.exp(-distance).
                 When encourage_mode is false, a sparse reward of 1 is only returned when the distance is smaller than epsilon. 
+            seed: Union[None, int, np.random.SeedSequence]
+                Seed of the random signal. Default value is None, which draws fresh entropy.
         """
 
         instructions = {
             0: [Instruction(time=0, x=5, y=5)],  # fixation
             1: [
                 Instruction(time=1, x=5, y=5),  # fixation
-                Instruction(time=1, x=target_x, y=target_y),  # cue
+                Instruction(time=1, x=target_x, y=target_y, target_coef=1),  # cue
             ],
             2: [Instruction(time=0, x=5, y=5)],  # fixation
             3: [
                 Instruction(time=0, x=5, y=5),  # fixation
                 Instruction(
-                    time=2, x=width, y=height, rng=np.random.default_rng()
+                    time=2, x=width, y=height, rng=np.random.default_rng(seed)
                 ),  # random distractor signal
             ],
             4: [Instruction(time=0, x=5, y=5)],  # fixation
@@ -63,4 +67,5 @@ class ODRDistract(Task):
             width=width,
             height=height,
             encourage_mode=encourage_mode,
+            seed=seed,
         )
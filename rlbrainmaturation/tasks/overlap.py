@@ -40,7 +40,9 @@ class Overlap(Task):
             0: [Instruction(time=0, x=5, y=5)],  # fixation
             1: [
                 Instruction(time=1, x=5, y=5),  # fixation
-                Instruction(time=1, x=width - target_x, y=height - target_y),  # cue
+                Instruction(
+                    time=1, x=width - target_x, y=height - target_y, target_coef=-1
+                ),  # cue
             ],
         }
 
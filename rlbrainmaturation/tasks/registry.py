@@ -0,0 +1,108 @@
+from __future__ import annotations
+import inspect
+import json
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Type
+import numpy as np
+from rlbrainmaturation.tasks.task import Task
+from rlbrainmaturation.tasks.gap import Gap
+from rlbrainmaturation.tasks.odr import ODR
+from rlbrainmaturation.tasks.odr_distract import ODRDistract
+from rlbrainmaturation.tasks.odr_random import ODRRandom
+from rlbrainmaturation.tasks.overlap import Overlap
+from rlbrainmaturation.tasks.zero_gap import ZeroGap
+
+# task classes by name, as used in sweep configs and benchmarks
+TASKS: Dict[str, Type[Task]] = {
+    "ODR": ODR,
+    "Gap": Gap,
+    "Overlap": Overlap,
+    "ZeroGap": ZeroGap,
+    "ODRRandom": ODRRandom,
+    "ODRDistract": ODRDistract,
+}
+
+
+def make_task(name: str, **kwargs: Any) -> Task:
+    """Builds the task registered under name with the given constructor arguments. A name ending
+    in .json or .toml is the path of a declarative task spec, built with TaskSpec.build.
+    """
+    if name.endswith((".json", ".toml")):
+        from rlbrainmaturation.tasks.spec import TaskSpec
+
+        return TaskSpec.from_file(name).build(**kwargs)
+    assert name in TASKS, f"Unknown task {name}, expected one of {list(TASKS)}"
+    return TASKS[name](**kwargs)
+
+
+class TaskDescriptor(NamedTuple):
+    """Compact, picklable description of a task: its registry name (or spec path), constructor
+    params and integer seed. It pickles to a few hundred bytes, unlike a Task with its
+    instructions and generators, so it is cheap to ship in the env_config of many workers, which
+    rebuild the task with build_task.
+    """
+
+    name: str
+    params: Dict[str, Any]
+    seed: int
+
+    def build(self) -> Task:
+        """Builds the task, or returns the one already built in this process.
+        """
+        return build_task(self)
+
+    def rng(self, worker_index: int = 0, vector_index: int = 0) -> np.random.Generator:
+        """Stream of the randomized signals of the env at (worker_index, vector_index). Streams
+        of different envs are independent, and each is reproducible from the seed.
+        """
+        sequence = np.random.SeedSequence(self.seed, spawn_key=(worker_index, vector_index))
+        return np.random.default_rng(sequence)
+
+
+def describe_task(name: str, seed: Optional[int] = None, **params: Any) -> TaskDescriptor:
+    """Describes the task registered under name (or the spec at path name) with the given
+    constructor params, e.g. describe_task("ODRRandom", seed=0, width=84, height=84). A missing
+    seed is drawn from fresh entropy and recorded, so the descriptor stays reproducible.
+    """
+    assert name in TASKS or name.endswith(
+        (".json", ".toml")
+    ), f"Unknown task {name}, expected one of {list(TASKS)}"
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+    return TaskDescriptor(name, params, int(seed))
+
+
+# tasks built in this process from descriptors, so every env of a worker shares one compiled task
+_BUILT_TASKS: Dict[str, Task] = {}
+
+
+def build_task(descriptor: TaskDescriptor) -> Task:
+    """Builds the task of descriptor, caching it per process. The seed is only passed to the
+    task classes that take one.
+    """
+    key = json.dumps(descriptor, sort_keys=True, default=str)
+    task = _BUILT_TASKS.get(key)
+    if task is None:
+        kwargs = dict(descriptor.params)
+        if descriptor.name.endswith((".json", ".toml")) or "seed" in inspect.signature(
+            TASKS[descriptor.name]
+        ).parameters:
+            kwargs["seed"] = descriptor.seed
+        task = _BUILT_TASKS[key] = make_task(descriptor.name, **kwargs)
+    return task
+
+
+def resolve_task(env_config: Dict[str, Any]) -> Tuple[Task, Optional[np.random.Generator]]:
+    """Resolves the "task" and "rng" entries of an env_config. A TaskDescriptor is built in this
+    process and, unless "rng" is given, seeds a stream of its own for the env, keyed by the
+    worker_index and vector_index of an RLlib EnvContext (or env_config entries of these names).
+    """
+    task, rng = env_config.get("task"), env_config.get("rng")
+    if not isinstance(task, TaskDescriptor):
+        return task, rng
+    if rng is None:
+        indices = [
+            getattr(env_config, key, env_config.get(key, 0))
+            for key in ("worker_index", "vector_index")
+        ]
+        rng = task.rng(*indices)
+    return task.build(), rng
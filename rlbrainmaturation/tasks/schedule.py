@@ -0,0 +1,406 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
+import hashlib
+import os
+import numpy as np
+from rlbrainmaturation.utils.general_utils import cached_property
+from rlbrainmaturation.utils.random_utils import SignalPositionSampler
+
+if TYPE_CHECKING:
+    from rlbrainmaturation.tasks.task import Task, Instruction
+
+# version of the tables stored by CompiledSchedule.save, part of the keys of on-disk caches
+SCHEDULE_FORMAT = 2
+
+# (start, stop, items) of a run of frames sharing the same signals
+Run = Tuple[int, int, list]
+
+# tables of a compiled schedule, as stored by CompiledSchedule.save
+TABLES = (
+    "fixed_x",
+    "fixed_y",
+    "fixed_mask",
+    "fixed_coef",
+    "random_ids",
+    "random_mask",
+    "random_scale",
+)
+
+
+class CompiledSchedule:
+    """Dense, validated form of the instruction dictionary of a task.
+
+    Fixed signals are stored as padded (tot_frames, max_signals) coordinate tables with a
+    validity mask, and as a read-only (tot_frames, height, width) template of the screen.
+    Randomized signals are numbered once per task; each frame only refers to them by id,
+    so their positions can be drawn once per episode and gathered for any batch of frames.
+    Fixed signals that move with the target keep their target coefficient, so the frames of
+    episodes with other targets are gathered with one extra affine term.
+
+    Instructions given as runs of frames (Task.from_epochs) are validated and filled once per
+    run. Whatever the input, the frames are also run-length encoded: changes flags the frames
+    whose signals differ from the previous frame, so envs can step through unchanged frames
+    without rendering them again, and run_end gives the last frame of the run of every frame.
+    """
+
+    def __init__(self, task: Task) -> None:
+        """
+        Args:
+            task: Task
+                The task whose instructions are compiled. Signals are validated once here.
+        """
+        self.tot_frames = task.tot_frames
+        self.width = task.width
+        self.height = task.height
+        # target the fixed coordinates are compiled for
+        self.target = np.array(task.target_pos, dtype=np.int64)
+
+        fixed: List[Run] = []
+        random_ids: List[Run] = []
+        self.random_instructions: List[Instruction] = []  # unique randomized signals
+        signal_ids: Dict[int, int] = {}
+        for start, stop, instructions in _runs(task):
+            task._validate_signals(instructions)
+            fixed.append(
+                (start, stop, [inst for inst in instructions if inst.rng is None])
+            )
+            ids = []
+            for inst in instructions:
+                if inst.rng is None:
+                    continue
+                # the same Instruction shown in several frames keeps one position
+                if id(inst) not in signal_ids:
+                    signal_ids[id(inst)] = len(self.random_instructions)
+                    self.random_instructions.append(inst)
+                ids.append(signal_ids[id(inst)])
+            random_ids.append((start, stop, ids))
+
+        self.fixed_x, self.fixed_y, self.fixed_mask = self._pad(
+            [
+                (start, stop, [(inst.x, inst.y) for inst in signals])
+                for start, stop, signals in fixed
+            ]
+        )
+        self.fixed_coef = self._pad(
+            [
+                (start, stop, [(inst.target_coef, 0) for inst in signals])
+                for start, stop, signals in fixed
+            ]
+        )[0]
+        self.random_ids, _, self.random_mask = self._pad(
+            [(start, stop, [(i, 0) for i in ids]) for start, stop, ids in random_ids]
+        )
+        # upper bounds (exclusive) of the random coordinates of each randomized signal
+        self.random_scale = np.array(
+            [(inst.x, inst.y) for inst in self.random_instructions], dtype=np.int64
+        ).reshape(-1, 2)
+        self._summarize()
+
+    @classmethod
+    def load(cls, path: str, task: Task) -> CompiledSchedule:
+        """Loads a schedule saved by save, skipping the validation and compilation of task.
+        Args:
+            path: str
+                Path of the .npz file.
+            task: Task
+                The task the schedule was compiled from, whose randomized signals it refers to.
+        """
+        schedule = cls.__new__(cls)
+        with np.load(path) as tables:
+            for name in TABLES:
+                setattr(schedule, name, tables[name])
+            schedule.tot_frames, schedule.width, schedule.height = (
+                int(value) for value in tables["size"]
+            )
+            schedule.target = tables["target"]
+        random_instructions: Dict[int, Instruction] = {}
+        for t in range(schedule.tot_frames):
+            for inst in task.instructions.get(t, None) or []:
+                if inst.rng is not None:
+                    random_instructions.setdefault(id(inst), inst)
+        schedule.random_instructions = list(random_instructions.values())
+        schedule._summarize()
+        return schedule
+
+    def save(self, path: str) -> None:
+        """Saves the compiled tables to a .npz file, atomically.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            np.savez(
+                fh,
+                size=np.array([self.tot_frames, self.width, self.height]),
+                target=self.target,
+                **{name: getattr(self, name) for name in TABLES},
+            )
+        os.replace(tmp_path, path)
+
+    @property
+    def digest(self) -> str:
+        """Digest of the compiled tables, equal for schedules that render the same frames.
+        """
+        if self._digest is None:
+            digest = hashlib.sha1(
+                repr((self.tot_frames, self.width, self.height)).encode()
+            )
+            for table in [self.target] + [getattr(self, name) for name in TABLES]:
+                digest.update(repr(table.shape).encode())
+                digest.update(np.ascontiguousarray(table).tobytes())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    @property
+    def template(self) -> np.ndarray:
+        """Read-only (tot_frames, height, width) uint8 screens holding the fixed signals.
+        Long schedules should prefer run_template, which holds one screen per run.
+        """
+        if self._template is None:
+            template = self.run_template[self.frame_run]
+            template.flags.writeable = False
+            self._template = template
+        return self._template
+
+    @property
+    def run_template(self) -> np.ndarray:
+        """Read-only (number of runs, height, width) uint8 screens holding the fixed signals of
+        every run of unchanged frames. Frame t shows run_template[frame_run[t]].
+        """
+        if self._run_template is None:
+            starts = self.run_starts
+            mask = self.fixed_mask[starts]
+            template = np.zeros((len(starts), self.height, self.width), dtype=np.uint8)
+            run_idx = np.broadcast_to(np.arange(len(starts))[:, None], mask.shape)[mask]
+            template[run_idx, self.fixed_x[starts][mask], self.fixed_y[starts][mask]] = 1
+            template.flags.writeable = False
+            self._run_template = template
+        return self._run_template
+
+    def sampler(
+        self, rng: Optional[np.random.Generator] = None, block_size: int = 4096
+    ) -> SignalPositionSampler:
+        """Builds a block sampler of the positions of the randomized signals.
+        Args:
+            rng: Optional[np.random.Generator]
+                Generator of the random stream, e.g. from Task.spawn_rngs.
+            block_size: int
+                Number of episodes drawn per call into the generator.
+        """
+        return SignalPositionSampler(self.random_scale, rng=rng, block_size=block_size)
+
+    @cached_property
+    def target_dependent(self) -> np.ndarray:
+        """Boolean (tot_frames,) mask of the frames holding a signal that moves with the target.
+        """
+        return ((self.fixed_coef != 0) & self.fixed_mask).any(axis=1)
+
+    def frame_coordinates(
+        self,
+        times: np.ndarray,
+        random_positions: Optional[np.ndarray] = None,
+        targets: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Gathers the lit pixels of a batch of frames.
+        Args:
+            times: np.ndarray
+                Integer array of shape (n,) with the frame of each episode.
+            random_positions: Optional[np.ndarray]
+                Positions of the randomized signals of each episode, as returned by
+                SignalPositionSampler.draw(n). Required when the task has random signals.
+            targets: Optional[np.ndarray]
+                Integer array of shape (n, 2) with the target of each episode, e.g. from
+                Task.sample_targets. Default is the target the task was built with.
+
+        Returns:
+            Tuple of (episode index, x, y) integer arrays, one entry per lit pixel.
+        """
+        shift = None if targets is None else np.asarray(targets) - self.target
+        return _gather_rows(self, np.asarray(times), random_positions, shift)
+
+    def _summarize(self) -> None:
+        """Helper function that derives the summary attributes from the compiled tables.
+        """
+        self.num_random = len(self.random_scale)
+        self.has_random = self.num_random > 0
+        # maximum number of lit pixels on any frame
+        self.max_signals = int(
+            (self.fixed_mask.sum(axis=1) + self.random_mask.sum(axis=1)).max(initial=0)
+        )
+        # run-length encoding of the frames: a new run starts wherever the signals change
+        tables = np.concatenate(
+            [getattr(self, name).reshape(self.tot_frames, -1) for name in TABLES[:-1]], axis=1
+        )
+        self.changes = np.ones(self.tot_frames, dtype=bool)
+        self.changes[1:] = (tables[1:] != tables[:-1]).any(axis=1)
+        self.run_starts = np.flatnonzero(self.changes)
+        # run of every frame, and last frame of the run of every frame
+        self.frame_run = np.cumsum(self.changes) - 1
+        run_stops = np.append(self.run_starts[1:], self.tot_frames)
+        self.run_end = run_stops[self.frame_run] - 1
+        self._template: Optional[np.ndarray] = None
+        self._run_template: Optional[np.ndarray] = None
+        self._digest: Optional[str] = None
+
+    def _pad(
+        self, runs: List[Tuple[int, int, List[Tuple[int, int]]]]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Helper function that pads the lists of coordinates of runs of frames into dense
+        per-frame tables. Every run fills its frames start to stop with one slice per signal.
+        """
+        width = max([len(signals) for _, _, signals in runs] + [1])
+        x = np.zeros((self.tot_frames, width), dtype=np.int64)
+        y = np.zeros((self.tot_frames, width), dtype=np.int64)
+        mask = np.zeros((self.tot_frames, width), dtype=bool)
+        for start, stop, signals in runs:
+            for i, (signal_x, signal_y) in enumerate(signals):
+                x[start:stop, i] = signal_x
+                y[start:stop, i] = signal_y
+                mask[start:stop, i] = True
+        return x, y, mask
+
+
+class StackedSchedule:
+    """Compiled schedules of several tasks of one screen size, stacked into one set of tables.
+
+    The tables of CompiledSchedule are padded with masked entries to the longest task and
+    concatenated, with row task_id * tot_frames + time, so the lit pixels of a batch of (task,
+    frame) pairs are gathered at once, as CompiledSchedule.frame_coordinates does for one
+    task. Frames past the end of a task are blank. The rows are run-length encoded like the
+    frames of CompiledSchedule, with a new run at the first frame of every task and at the
+    padding after its last frame, so stepping through unchanged frames never skips the
+    rewarded last frame.
+    """
+
+    def __init__(self, schedules: Sequence[CompiledSchedule]) -> None:
+        """
+        Args:
+            schedules: Sequence[CompiledSchedule]
+                Schedules of the tasks, in task id order.
+        """
+        self.num_tasks = len(schedules)
+        self.tot_frames = max(schedule.tot_frames for schedule in schedules)
+        self.task_frames = np.array([schedule.tot_frames for schedule in schedules])
+        # frames are gathered for the targets the fixed coordinates were compiled for
+        self.targets = np.stack([schedule.target for schedule in schedules])
+        self.num_random = max(schedule.num_random for schedule in schedules)
+        self.max_signals = max(schedule.max_signals for schedule in schedules)
+        for name in TABLES[:-1]:
+            setattr(self, name, self._stack(schedules, name))
+        self.has_random = bool(self.random_mask.any())
+        self.has_coef = bool(self.fixed_coef.any())
+
+        # run-length encoding of the rows, split at the first frame of every task and at the
+        # padding after its last frame, with run_end as the time of the last frame of the run
+        # of every row
+        rows = self.num_tasks * self.tot_frames
+        tables = np.concatenate(
+            [getattr(self, name).reshape(rows, -1) for name in TABLES[:-1]], axis=1
+        )
+        self.changes = np.ones(rows, dtype=bool)
+        self.changes[1:] = (tables[1:] != tables[:-1]).any(axis=1)
+        firsts = np.arange(self.num_tasks) * self.tot_frames
+        self.changes[firsts] = True
+        padded = self.task_frames < self.tot_frames
+        self.changes[(firsts + self.task_frames)[padded]] = True
+        run_starts = np.flatnonzero(self.changes)
+        frame_run = np.cumsum(self.changes) - 1
+        run_stops = np.append(run_starts[1:], rows)
+        self.run_end = run_stops[frame_run] - 1 - np.repeat(firsts, self.tot_frames)
+
+    def rows(self, task_ids: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """Rows of the tables holding the frames times of the tasks task_ids.
+        """
+        return task_ids * self.tot_frames + times
+
+    def frame_coordinates(
+        self,
+        task_ids: np.ndarray,
+        times: np.ndarray,
+        random_positions: Optional[np.ndarray] = None,
+        targets: Optional[np.ndarray] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Gathers the lit pixels of a batch of frames of several tasks.
+        Args:
+            task_ids: np.ndarray
+                Integer array of shape (n,) with the task of each episode.
+            times: np.ndarray
+                Integer array of shape (n,) with the frame of each episode.
+            random_positions: Optional[np.ndarray]
+                Integer array of shape (n, num_random, 2) with the positions of the randomized
+                signals of each episode. Required when a task has random signals.
+            targets: Optional[np.ndarray]
+                Integer array of shape (n, 2) with the target of each episode. Default is the
+                target every task was built with.
+            rows: Optional[np.ndarray]
+                The rows of the (task, frame) pairs, when already computed. Default computes
+                them with rows.
+
+        Returns:
+            Tuple of (episode index, x, y) integer arrays, one entry per lit pixel.
+        """
+        if rows is None:
+            rows = self.rows(task_ids, times)
+        shift = None
+        if targets is not None and self.has_coef:
+            shift = targets - self.targets[task_ids]
+        return _gather_rows(self, rows, random_positions, shift)
+
+    def _stack(self, schedules: Sequence[CompiledSchedule], name: str) -> np.ndarray:
+        """Helper function that stacks table name of every schedule, padded with zeros.
+        """
+        tables = [getattr(schedule, name) for schedule in schedules]
+        width = max(table.shape[1] for table in tables)
+        stacked = np.zeros((len(tables), self.tot_frames, width), dtype=tables[0].dtype)
+        for k, table in enumerate(tables):
+            stacked[k, : table.shape[0], : table.shape[1]] = table
+        return stacked.reshape(len(tables) * self.tot_frames, width)
+
+
+def _gather_rows(
+    schedule: Any,
+    rows: np.ndarray,
+    random_positions: Optional[np.ndarray] = None,
+    shift: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Helper function that gathers the lit pixels of one row of the tables of schedule (a
+    CompiledSchedule or a StackedSchedule) per episode, with the fixed signals moving with the
+    target shifted by the (n, 2) shift of every episode.
+    """
+    episodes = np.arange(len(rows))
+    mask = schedule.fixed_mask[rows]
+    episode_idx = np.broadcast_to(episodes[:, None], mask.shape)[mask]
+    x_idx = schedule.fixed_x[rows]
+    y_idx = schedule.fixed_y[rows]
+    if shift is not None:
+        coef = schedule.fixed_coef[rows]
+        x_idx = x_idx + coef * shift[:, :1]
+        y_idx = y_idx + coef * shift[:, 1:]
+    x_idx = x_idx[mask]
+    y_idx = y_idx[mask]
+
+    if schedule.has_random:
+        random_mask = schedule.random_mask[rows]
+        ids = schedule.random_ids[rows]
+        positions = random_positions[episodes[:, None], ids][random_mask]
+        episode_idx = np.concatenate(
+            [
+                episode_idx,
+                np.broadcast_to(episodes[:, None], random_mask.shape)[random_mask],
+            ]
+        )
+        x_idx = np.concatenate([x_idx, positions[:, 0]])
+        y_idx = np.concatenate([y_idx, positions[:, 1]])
+    return episode_idx, x_idx, y_idx
+
+
+def _runs(task: Task) -> Iterator[Tuple[int, int, List[Instruction]]]:
+    """Helper function that lists the (start, stop, instructions) runs of frames of a task:
+    the epochs of run-length encoded instructions (e.g. EpochInstructions), and one run per
+    frame for an instruction dictionary.
+    """
+    runs = getattr(task.instructions, "runs", None)
+    if runs is not None:
+        yield from runs()
+        return
+    for t in range(task.tot_frames):
+        yield t, t + 1, task.instructions.get(t, None) or []
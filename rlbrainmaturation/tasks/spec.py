@@ -0,0 +1,292 @@
+"""Declarative task specs, compiled into tasks without writing a Task subclass.
+
+A spec lists the frames of the task, its signals, which of them are randomized and how the
+final saccade is rewarded. Coordinates are numbers or arithmetic expressions of the params, so
+one spec describes a whole family of layouts. The Gap task, for instance, reads in TOML:
+
+    name = "Gap"
+    tot_frames = 4
+
+    [params]
+    target_x = 1
+    target_y = 5
+    width = 42
+    height = 42
+
+    [reward]
+    encourage_mode = true
+    epsilon = 1.0
+
+    [[signals]]  # fixation
+    frames = [0]
+    x = 5
+    y = 5
+
+    [[signals]]  # cue, opposite to the target
+    frames = [2]
+    x = "width - target_x"
+    y = "height - target_y"
+
+A randomized signal sets random = true; its x and y are then the exclusive upper bounds of its
+coordinates. A signal shown in several frames keeps one position per episode. frames is a list
+of frame indices or a {start, stop} range (stop excluded), and may also use expressions.
+
+A signal whose position moves with the target by the same amount on both axes, like the cue
+above, gets the matching Instruction.target_coef (here -1), so that it follows the target in
+target-distribution mode. target_coef may also be given explicitly.
+"""
+from __future__ import annotations
+import ast
+import hashlib
+import json
+import operator
+import os
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from rlbrainmaturation.tasks.schedule import SCHEDULE_FORMAT, CompiledSchedule
+from rlbrainmaturation.tasks.task import Task, Instruction
+from rlbrainmaturation.utils.random_utils import Seed
+
+try:
+    import tomllib  # Python >= 3.11
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# params every spec has, with their defaults
+DEFAULT_PARAMS = {"target_x": 1, "target_y": 5, "width": 42, "height": 42}
+DEFAULT_REWARD = {"encourage_mode": True, "epsilon": 1.0}
+
+_BINARY_OPERATORS: Dict[type, Callable[[Any, Any], Any]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+_UNARY_OPERATORS: Dict[type, Callable[[Any], Any]] = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+_FUNCTIONS: Dict[str, Callable[..., Any]] = {"min": min, "max": max, "abs": abs}
+
+
+class TaskSpec:
+    """Validated declarative description of a task.
+    """
+
+    def __init__(self, spec: Dict[str, Any]) -> None:
+        """
+        Args:
+            spec: Dict[str, Any]
+                Parsed spec with "tot_frames", "signals" and optional "name", "params" and
+                "reward" entries, as in the module docstring.
+        """
+        unknown = set(spec) - {"name", "tot_frames", "params", "reward", "signals"}
+        assert not unknown, f"Unknown entries {sorted(unknown)} in task spec"
+        assert "tot_frames" in spec, "Task spec needs tot_frames"
+        unknown = set(spec.get("reward", {})) - set(DEFAULT_REWARD)
+        assert not unknown, f"Unknown reward entries {sorted(unknown)} in task spec"
+        for signal in spec.get("signals", []):
+            unknown = set(signal) - {"frames", "x", "y", "random", "target_coef", "label"}
+            assert not unknown, f"Unknown signal entries {sorted(unknown)} in task spec"
+            assert {"frames", "x", "y"} <= set(signal), "Signals need frames, x and y"
+        self.spec = spec
+        self.name = spec.get("name", "SpecTask")
+
+    @classmethod
+    def from_file(cls, path: str) -> TaskSpec:
+        """Reads a spec from a .json or .toml file.
+        """
+        if path.endswith(".toml"):
+            assert tomllib is not None, "Reading TOML specs needs Python >= 3.11 or tomli"
+            with open(path, "rb") as fh:
+                return cls(tomllib.load(fh))
+        with open(path) as fh:
+            return cls(json.load(fh))
+
+    def params(self, **overrides: Any) -> Dict[str, Any]:
+        """Params of the spec with their defaults, updated by overrides. Reward entries
+        (encourage_mode, epsilon) can be overridden too.
+        """
+        params = dict(DEFAULT_PARAMS, **DEFAULT_REWARD)
+        params.update(self.spec.get("params", {}))
+        params.update(self.spec.get("reward", {}))
+        unknown = set(overrides) - set(params)
+        assert not unknown, f"Unknown params {sorted(unknown)} of task spec {self.name}"
+        params.update(overrides)
+        return params
+
+    def digest(self, **overrides: Any) -> str:
+        """Digest of the spec with its resolved params, keying compiled schedules on disk.
+        """
+        canonical = json.dumps(
+            {
+                "spec": self.spec,
+                "params": self.params(**overrides),
+                "format": SCHEDULE_FORMAT,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def instructions(
+        self, params: Dict[str, Any], seed: Seed = None
+    ) -> Dict[int, List[Instruction]]:
+        """Builds the instruction dictionary of the spec for resolved params.
+        """
+        rng = np.random.default_rng(seed)
+        instructions: Dict[int, List[Instruction]] = {}
+        for signal in self.spec.get("signals", []):
+            frames = self._frames(signal["frames"], params)
+            random = signal.get("random", False)
+            instruction = Instruction(
+                time=frames[0] if frames else 0,
+                x=_evaluate_int(signal["x"], params),
+                y=_evaluate_int(signal["y"], params),
+                rng=rng if random else None,
+                target_coef=signal.get(
+                    "target_coef", 0 if random else self._target_coef(signal, params)
+                ),
+            )
+            for t in frames:
+                instructions.setdefault(t, []).append(instruction)
+        return instructions
+
+    def build(
+        self, seed: Seed = None, cache_dir: Optional[str] = None, **overrides: Any
+    ) -> SpecTask:
+        """Builds the task of the spec.
+        Args:
+            seed: Union[None, int, np.random.SeedSequence]
+                Seed of the randomized signals.
+            cache_dir: Optional[str]
+                Directory of compiled schedules. The schedule of a spec and params already
+                compiled there is loaded instead of being validated and compiled again.
+            overrides: Any
+                Values of params, e.g. target_x=3, width=128.
+        """
+        return SpecTask(self, seed=seed, cache_dir=cache_dir, **overrides)
+
+    def _target_coef(self, signal: Dict[str, Any], params: Dict[str, Any]) -> int:
+        """Helper function that finds how a signal moves when the target moves by one pixel on
+        both axes. Signals that do not move as (x + c * dx, y + c * dy) get 0.
+        """
+        x, y = _evaluate_int(signal["x"], params), _evaluate_int(signal["y"], params)
+        moved = {}
+        for axis in ("target_x", "target_y"):
+            shifted = dict(params, **{axis: params[axis] + 1})
+            moved[axis] = (
+                _evaluate_int(signal["x"], shifted) - x,
+                _evaluate_int(signal["y"], shifted) - y,
+            )
+        coef = moved["target_x"][0]
+        if moved == {"target_x": (coef, 0), "target_y": (0, coef)} and coef in (-1, 1):
+            return coef
+        return 0
+
+    def _frames(self, frames: Any, params: Dict[str, Any]) -> List[int]:
+        """Helper function that resolves the frames entry of a signal.
+        """
+        if isinstance(frames, dict):
+            return list(
+                range(
+                    _evaluate_int(frames["start"], params),
+                    _evaluate_int(frames["stop"], params),
+                )
+            )
+        return [_evaluate_int(t, params) for t in frames]
+
+
+class SpecTask(Task):
+    """Task built from a TaskSpec.
+    """
+
+    def __init__(
+        self,
+        spec: TaskSpec,
+        seed: Seed = None,
+        cache_dir: Optional[str] = None,
+        **overrides: Any,
+    ):
+        """
+        Args:
+            spec: TaskSpec
+                The spec of the task.
+            seed: Union[None, int, np.random.SeedSequence]
+                Seed of the randomized signals.
+            cache_dir: Optional[str]
+                Directory of compiled schedules, see TaskSpec.build.
+            overrides: Any
+                Values of params of the spec.
+        """
+        params = spec.params(**overrides)
+        self.spec = spec
+        self.name = spec.name
+        self.params = params
+        super().__init__(
+            target_x=params["target_x"],
+            target_y=params["target_y"],
+            instructions=spec.instructions(params, seed),
+            tot_frames=_evaluate_int(spec.spec["tot_frames"], params),
+            width=params["width"],
+            height=params["height"],
+            encourage_mode=params["encourage_mode"],
+            epsilon=params["epsilon"],
+            seed=seed,
+        )
+        if cache_dir is not None:
+            self._schedule = self._cached_schedule(cache_dir, spec.digest(**overrides))
+
+    def _cached_schedule(self, cache_dir: str, digest: str) -> CompiledSchedule:
+        """Helper function that loads the compiled schedule from cache_dir, or compiles and
+        saves it on a miss.
+        """
+        path = os.path.join(cache_dir, f"{digest}.npz")
+        if os.path.exists(path):
+            return CompiledSchedule.load(path, self)
+        schedule = CompiledSchedule(self)
+        os.makedirs(cache_dir, exist_ok=True)
+        schedule.save(path)
+        return schedule
+
+
+def _evaluate_int(expression: Any, params: Dict[str, Any]) -> int:
+    """Helper function that evaluates a number or an arithmetic expression of the params to an
+    integer, e.g. "width - target_x".
+    """
+    if isinstance(expression, str):
+        value = _evaluate(ast.parse(expression, mode="eval").body, params)
+    else:
+        value = expression
+    assert float(value).is_integer(), f"{expression!r} does not evaluate to an integer"
+    return int(value)
+
+
+def _evaluate(node: ast.AST, params: Dict[str, Any]) -> Any:
+    """Helper function that evaluates the node of an expression, allowing only numbers, params,
+    arithmetic operators and min, max and abs, so specs cannot run arbitrary code.
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.Name):
+        assert node.id in params, f"Unknown param {node.id} in task spec expression"
+        return params[node.id]
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        return _BINARY_OPERATORS[type(node.op)](
+            _evaluate(node.left, params), _evaluate(node.right, params)
+        )
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        return _UNARY_OPERATORS[type(node.op)](_evaluate(node.operand, params))
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Name)
+        and node.func.id in _FUNCTIONS
+        and not node.keywords
+    ):
+        return _FUNCTIONS[node.func.id](*(_evaluate(arg, params) for arg in node.args))
+    raise ValueError(f"Unsupported expression in task spec: {ast.dump(node)}")
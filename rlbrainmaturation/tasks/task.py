@@ -1,6 +1,11 @@
 from __future__ import annotations
-from typing import Dict, List, Union, Tuple
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Sequence, Union, Tuple
 from ..utils.general_utils import Coordinates
+from ..utils.random_utils import Seed, make_seed_sequence, spawn_generators
+from .schedule import CompiledSchedule
+from functools import lru_cache
+import hashlib
 import numpy as np
 
 
@@ -9,7 +14,12 @@ class Instruction:
     """
 
     def __init__(
-        self, time: int, x: int, y: int, rng: Optional[np.random.Generator] = None
+        self,
+        time: int,
+        x: int,
+        y: int,
+        rng: Optional[np.random.Generator] = None,
+        target_coef: int = 0,
     ):
         """
         Args:
@@ -21,25 +31,99 @@ class Instruction:
                 The vertical coordinate where the signal displays
             rng: Optional[np.random.Generator] = None
                 Optional numpy raomdom number generator to add an randomized component to the signal          
+            target_coef: int
+                How the signal moves with the target of the task: 1 for a cue at the target, -1 for
+                a cue mirrored from it (e.g. at width - target_x), 0 for a signal independent of it.
+                x and y are the position for the target the task is built with, so the position for
+                another target is (x + target_coef * dx, y + target_coef * dy).
         """
+        assert target_coef in (-1, 0, 1), "target_coef has to be -1, 0 or 1"
+        assert (
+            rng is None or target_coef == 0
+        ), "Randomized signals cannot move with the target"
         self.time = time
         self.x = x
         self.y = y
         self.rng = rng
+        self.target_coef = target_coef
 
     @property
     def position(self) -> Coordinates:
-        """Coordinates of the signal
+        """Coordinates of the signal.
+        A randomized signal is drawn anew on every read, as the legacy per-step path expects;
+        the envs draw the positions of whole episodes from the compiled schedule instead.
         """
         if self.rng is None:
-            signal_pos = Coordinates(x=self.x, y=self.y)
-        else:
-            # random shrinkage factors
-            rand_factor_x, random_factor_y = self.rng.random(size=2)
-            signal_pos = Coordinates(
-                x=int(rand_factor_x * self.x), y=int(random_factor_y * self.y)
-            )
-        return signal_pos
+            return Coordinates(x=self.x, y=self.y)
+        # random shrinkage factors, drawn together for x and y
+        rand_factor_x, random_factor_y = self.rng.random(size=2)
+        return Coordinates(x=int(rand_factor_x * self.x), y=int(random_factor_y * self.y))
+
+
+class Epoch:
+    """A period of the task with a constant set of signals, e.g. fixation, cue, delay,
+    distractor or response, lasting duration frames.
+    """
+
+    def __init__(
+        self, name: str, duration: int, instructions: Optional[List[Instruction]] = None
+    ):
+        """
+        Args:
+            name: str
+                Name of the epoch, e.g. "delay".
+            duration: int
+                Number of frames of the epoch.
+            instructions: Optional[List[Instruction]]
+                Signals displayed during the whole epoch. A randomized signal keeps one position
+                for the whole epoch. Their time is only used in error messages.
+        """
+        assert duration >= 1, "The duration of an epoch has to be at least one frame"
+        self.name = name
+        self.duration = duration
+        self.instructions = list(instructions or [])
+
+
+class EpochInstructions(Mapping):
+    """Run-length encoded instruction dictionary of a sequence of epochs.
+
+    It maps every frame to the instructions of its epoch like the instruction dictionary of a
+    Task, but only stores the epochs and their start frames, so episodes of thousands of frames
+    cost as little as their handful of epochs.
+    """
+
+    def __init__(self, epochs: Sequence[Epoch]):
+        """
+        Args:
+            epochs: Sequence[Epoch]
+                The epochs of the task, in order.
+        """
+        self.epochs = list(epochs)
+        # first frame of every epoch, followed by the total number of frames
+        self.starts = np.cumsum([0] + [epoch.duration for epoch in self.epochs])
+        self.tot_frames = int(self.starts[-1])
+
+    def runs(self) -> Iterator[Tuple[int, int, List[Instruction]]]:
+        """Yields the (start, stop, instructions) of every epoch, stop excluded.
+        """
+        for epoch, start, stop in zip(self.epochs, self.starts[:-1], self.starts[1:]):
+            yield int(start), int(stop), epoch.instructions
+
+    def epoch_at(self, t: int) -> Epoch:
+        """The epoch frame t belongs to.
+        """
+        return self.epochs[int(np.searchsorted(self.starts, t, side="right")) - 1]
+
+    def __getitem__(self, t: int) -> List[Instruction]:
+        if not 0 <= t < self.tot_frames:
+            raise KeyError(t)
+        return self.epoch_at(t).instructions
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.tot_frames))
+
+    def __len__(self) -> int:
+        return self.tot_frames
 
 
 class Task:
@@ -50,12 +134,13 @@ class Task:
         self,
         target_x: int,
         target_y: int,
-        instructions: Dict[int, List[Instruction]],
+        instructions: Mapping[int, List[Instruction]],
         tot_frames: int = 5,
         width: int = 42,
         height: int = 42,
         encourage_mode: bool = True,
         epsilon: float = 1.0,
+        seed: Seed = None,
     ):
         """
         Args:
@@ -63,8 +148,8 @@ class Task:
                 The horizontal coordinate of the target focus point. The unit of the coordinate is pixel. 
             target_y: int
                 The vertical coordinate of the target focus point. The unit of the coordinate is pixel.     
-            instructions: List[Instruction]
-                List of instructions 
+            instructions: Dict[int, List[Instruction]]
+                Instructions of every frame, or the EpochInstructions of Task.from_epochs
             width: int
                 The width of the screen. Default value is 10. The unit of width is pixel. 
             height: int
@@ -74,6 +159,8 @@ class Task:
             encourage_mode: bool
                 Encourage mode or not. Default value is True, which allows to return the score as np.exp(-distance).
                 When encourage_mode is false, a sparse reward of 1 is only returned when the distance is smaller than epsilon. 
+            seed: Union[None, int, np.random.SeedSequence]
+                Root seed of the random streams of the randomized signals. Default draws fresh entropy.
         """
 
         assert 0 <= target_x <= width, "Target x has to be in the range of [0, width]"
@@ -87,18 +174,136 @@ class Task:
         self.target_pos = Coordinates(x=target_x, y=target_y)
         self.encourage_mode = encourage_mode
         self.epsilon = epsilon
+        self.seed = seed
+        self.seed_sequence = make_seed_sequence(seed)
+        self._schedule: Optional[CompiledSchedule] = None
+        # candidate targets and their probabilities in target-distribution mode
+        self.targets: Optional[np.ndarray] = None
+        self.target_probs: Optional[np.ndarray] = None
+        # bumped on every change of the target distribution, so that envs holding frames
+        # cached for the previous one know to fetch them again
+        self.revision = 0
+
+    @staticmethod
+    def from_epochs(target_x: int, target_y: int, epochs: Sequence[Epoch], **kwargs) -> Task:
+        """Builds a task from a sequence of epochs with durations, stored run-length encoded,
+        e.g. for delay periods of hundreds of frames:
+
+            Task.from_epochs(1, 5, [
+                Epoch("fixation", 50, [Instruction(0, 5, 5)]),
+                Epoch("cue", 10, [Instruction(50, 5, 5), Instruction(50, 1, 5, target_coef=1)]),
+                Epoch("delay", 500, [Instruction(60, 5, 5)]),
+                Epoch("response", 1),
+            ])
+
+        Takes the keyword arguments of Task, except instructions and tot_frames, which is the
+        sum of the durations. The result is always a plain Task, since the task subclasses
+        build their own instructions.
+        """
+        instructions = EpochInstructions(epochs)
+        return Task(
+            target_x, target_y, instructions, tot_frames=instructions.tot_frames, **kwargs
+        )
+
+    def compile(self) -> CompiledSchedule:
+        """Validates the instructions once and compiles them into a dense per-frame schedule.
+        The schedule is cached; set self._schedule to None after changing self.instructions.
+        """
+        if self._schedule is None:
+            self._schedule = CompiledSchedule(self)
+        return self._schedule
+
+    def fingerprint(self) -> str:
+        """Digest of everything that determines the screens of an episode: the task class, the
+        target, the screen size, the number of frames and the compiled schedule. Two tasks with
+        the same fingerprint render the same frames, so it keys caches shared across tasks.
+        """
+        digest = hashlib.sha1(
+            repr(
+                (
+                    type(self).__qualname__,
+                    tuple(self.target_pos),
+                    self.width,
+                    self.height,
+                    self.tot_frames,
+                )
+            ).encode()
+        )
+        digest.update(self.compile().digest.encode())
+        if self.targets is not None:
+            digest.update(self.targets.tobytes())
+        return digest.hexdigest()
+
+    def set_target_distribution(
+        self, targets: np.ndarray, weights: Optional[np.ndarray] = None
+    ) -> None:
+        """Switches the task to target-distribution mode, in which every episode draws its own
+        target, and the cues moving with the target (see Instruction.target_coef) follow it.
+        Envs built before the call switch at their next reset.
+        Args:
+            targets: np.ndarray
+                Integer array of shape (m, 2) with the candidate (x, y) targets.
+            weights: Optional[np.ndarray]
+                Relative probability of every candidate. Default is uniform.
+        """
+        targets = np.asarray(targets, dtype=np.int64).reshape(-1, 2)
+        assert len(targets) > 0, "The target distribution needs at least one target"
+        assert (
+            (targets[:, 0] >= 0).all() and (targets[:, 0] < self.width).all()
+        ), "Target x has to be in the range of [0, width)"
+        assert (
+            (targets[:, 1] >= 0).all() and (targets[:, 1] < self.height).all()
+        ), "Target y has to be in the range of [0, height)"
+        # every cue has to stay on the screen for every candidate target
+        schedule = self.compile()
+        moving = (schedule.fixed_coef != 0) & schedule.fixed_mask
+        coef = schedule.fixed_coef[moving]
+        for axis, (positions, size) in enumerate(
+            ((schedule.fixed_x, self.width), (schedule.fixed_y, self.height))
+        ):
+            shifts = targets[:, axis] - schedule.target[axis]
+            cue = positions[moving][:, None] + coef[:, None] * shifts[None, :]
+            assert (
+                (cue >= 0).all() and (cue < size).all()
+            ), "A cue moves outside the screen for some candidate target"
+        self.targets = targets
+        self.target_probs = None
+        self.revision += 1
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+            self.target_probs = weights / weights.sum()
+
+    def sample_targets(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        """Draws the targets of n episodes in one batch.
+
+        Returns:
+            Integer array of shape (n, 2). Without a target distribution, every row is the
+            target the task was built with.
+        """
+        if self.targets is None:
+            return np.tile(np.asarray(self.target_pos, dtype=np.int64), (n, 1))
+        return self.targets[rng.choice(len(self.targets), size=n, p=self.target_probs)]
+
+    def spawn_rngs(self, n: int = 1) -> List[np.random.Generator]:
+        """Splits the task seed into n new independent random streams.
+        Every call returns streams that do not overlap with the ones returned before, so
+        batched envs and parallel workers built in a fixed order are reproducible.
+        """
+        return spawn_generators(self.seed_sequence, n)
 
     def issue_instruction(self, t: int) -> Union[List[Instruction], None]:
         """This method is to release signals to display on the screen
         """
-        instructions_at_t = self.instructions.get(t, None)
+        # signals are validated once when the schedule is compiled
+        self.compile()
+        return self.instructions.get(t, None)
 
-        if instructions_at_t is not None:
-            # validate if any signals are located outside the screen
-            self._validate_signals(instructions_at_t)
-        return instructions_at_t
-
-    def score(self, focus_point: Tuple[int, int], time: int) -> float:
+    def score(
+        self,
+        focus_point: Tuple[int, int],
+        time: int,
+        target: Optional[Tuple[int, int]] = None,
+    ) -> float:
         """This method computes reward score. 
         In the base brain maturation tasks, reward is not returned until the last step. 
         At the last step, the score is based on how close the focus point is to the target focus points.
@@ -108,12 +313,14 @@ class Task:
                 The tuple that describes the coordinate of focus_point, which is the action taken by the agent
             time: int
                 Time step to compute the score
+            target: Optional[Tuple[int, int]]
+                Target of the episode, in target-distribution mode. Default is the target of the task.
         """
         if time < self.tot_frames - 1:
             # don't provide reward until the last step
             return 0
         else:
-            target_pos = self.target_pos
+            target_pos = self.target_pos if target is None else Coordinates(*target)
             distance_square = (focus_point[0] - target_pos.x) ** 2 + (
                 focus_point[1] - target_pos.y
             ) ** 2
@@ -122,6 +329,54 @@ class Task:
             else:
                 return 1.0 if distance_square < self.epsilon else 0.0
 
+    def score_batch(
+        self,
+        focus_points: np.ndarray,
+        times: Union[int, np.ndarray],
+        targets: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """This method computes the reward scores of a batch of focus points, as score does.
+        Every score is looked up in the cached reward kernel with one fancy-indexing op.
+
+        Args:
+            focus_points: np.ndarray
+                Integer array of shape (..., 2) with the focus points, i.e. the actions taken by the agents
+            times: Union[int, np.ndarray]
+                Time step, or array of time steps broadcastable to focus_points[..., 0]
+            targets: Optional[np.ndarray]
+                Integer array of shape (..., 2) with the target of every episode, for tasks whose
+                targets vary per episode. Default uses the fixed target of the task.
+        """
+        offsets = _kernel_offsets(
+            focus_points,
+            np.asarray(self.target_pos if targets is None else targets),
+            self.width,
+            self.height,
+        )
+        rewards = self.reward_kernel()[offsets]
+        # don't provide reward until the last step
+        return np.where(np.asarray(times) >= self.tot_frames - 1, rewards, 0.0)
+
+    def reward_kernel(self) -> np.ndarray:
+        """Read-only (2 * width + 1, 2 * height + 1) reward of every focus offset from a target.
+        Entry [dx + width, dy + height] is the score of a focus point at (target_x + dx, target_y + dy).
+        """
+        return _reward_kernel(self.width, self.height, self.encourage_mode, self.epsilon)
+
+    def reward_map(self, target: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """Read-only (width, height) final-step score of every focus point for one target.
+        The map is a view into the reward kernel, so maps of all targets share one cached array.
+
+        Args:
+            target: Optional[Tuple[int, int]]
+                The (x, y) target. Default is the target of the task.
+        """
+        target_x, target_y = self.target_pos if target is None else target
+        return self.reward_kernel()[
+            self.width - target_x : 2 * self.width - target_x,
+            self.height - target_y : 2 * self.height - target_y,
+        ]
+
     def _validate_signals(self, instructions: List[Instruction]) -> None:
         """validate if any signals from the list of instructions are outside the screen.
         """
@@ -133,3 +388,94 @@ class Task:
             assert (
                 0 <= instruction.y <= self.height
             ), f"y in Instruction at {instruction.time} is outside the screen"
+
+
+class StackedScorer:
+    """Reward kernels of several tasks of one screen size, stacked by task id, so that a batch
+    of episodes of different tasks is scored with one gather, as Task.score_batch does for
+    one task. Tasks with the same reward settings share their kernel, and a mixture whose
+    tasks all share it is scored from that kernel alone.
+    """
+
+    def __init__(self, tasks: Sequence[Task]) -> None:
+        """
+        Args:
+            tasks: Sequence[Task]
+                The tasks, in task id order.
+        """
+        self.width, self.height = tasks[0].width, tasks[0].height
+        assert all(
+            (task.width, task.height) == (self.width, self.height) for task in tasks
+        ), "Stacked tasks need the same screen size"
+        kernels = [task.reward_kernel() for task in tasks]
+        # the kernels are cached per reward setting, so shared ones are the same array
+        self.shared_kernel: Optional[np.ndarray] = (
+            kernels[0] if all(kernel is kernels[0] for kernel in kernels) else None
+        )
+        self.kernels = np.stack(kernels)
+        self.last_frames = np.array([task.tot_frames - 1 for task in tasks])
+
+    def score_batch(
+        self,
+        task_ids: np.ndarray,
+        focus_points: np.ndarray,
+        times: np.ndarray,
+        targets: np.ndarray,
+        last_frames: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """Computes the reward scores of a batch of episodes of the tasks task_ids.
+        Args:
+            task_ids: np.ndarray
+                Integer array of shape (n,) with the task of each episode.
+            focus_points: np.ndarray
+                Integer array of shape (n, 2) with the focus points, i.e. the actions taken by
+                the agents.
+            times: np.ndarray
+                Integer array of shape (n,) with the time step of each episode.
+            targets: np.ndarray
+                Integer array of shape (n, 2) with the target of each episode.
+            last_frames: Optional[np.ndarray]
+                The last frame of the task of each episode, when already gathered. Default
+                gathers it from task_ids.
+
+        Returns:
+            The rewards, only given at the last frame of the task of each episode.
+        """
+        offsets = _kernel_offsets(focus_points, targets, self.width, self.height)
+        if self.shared_kernel is not None:
+            rewards = self.shared_kernel[offsets]
+        else:
+            rewards = self.kernels[(task_ids,) + offsets]
+        if last_frames is None:
+            last_frames = self.last_frames[task_ids]
+        return np.where(times == last_frames, rewards, 0.0)
+
+
+def _kernel_offsets(
+    focus_points: np.ndarray, targets: np.ndarray, width: int, height: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Helper function that computes the indices into a reward kernel of the offsets of focus
+    points from their targets.
+    """
+    focus_points = np.asarray(focus_points)
+    return (
+        focus_points[..., 0] - targets[..., 0] + width,
+        focus_points[..., 1] - targets[..., 1] + height,
+    )
+
+
+@lru_cache(maxsize=64)
+def _reward_kernel(
+    width: int, height: int, encourage_mode: bool, epsilon: float
+) -> np.ndarray:
+    """Helper function that builds the reward kernel shared by every task with these settings.
+    """
+    offset_x = np.arange(-width, width + 1)
+    offset_y = np.arange(-height, height + 1)
+    distance_square = offset_x[:, None] ** 2 + offset_y[None, :] ** 2
+    if encourage_mode:
+        kernel = np.exp(-distance_square.astype(np.float64))
+    else:
+        kernel = (distance_square < epsilon).astype(np.float64)
+    kernel.flags.writeable = False
+    return kernel
@@ -38,7 +38,11 @@ class ZeroGap(Task):
 
         instructions: Dict[int, List[Instruction]] = {
             0: [Instruction(time=0, x=5, y=5)],  # fixation
-            1: [Instruction(time=1, x=width - target_x, y=height - target_y)],  # cue
+            1: [
+                Instruction(
+                    time=1, x=width - target_x, y=height - target_y, target_coef=-1
+                )
+            ],  # cue
         }
 
         super().__init__(
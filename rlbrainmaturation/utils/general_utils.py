@@ -1,5 +1,25 @@
 from typing import Tuple, Optional, NamedTuple
 
+try:
+    from functools import cached_property
+except ImportError:  # Python 3.7
+
+    class cached_property:
+        # Minimal functools.cached_property: computes the attribute once per instance
+        def __init__(self, func):
+            self.func = func
+            self.__doc__ = func.__doc__
+
+        def __set_name__(self, owner, name):
+            self.name = name
+
+        def __get__(self, instance, owner=None):
+            if instance is None:
+                return self
+            value = instance.__dict__[self.name] = self.func(instance)
+            return value
+
+
 class Coordinates(NamedTuple):
     # NamedTuple class for coordinates
     x: int
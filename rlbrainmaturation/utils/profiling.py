@@ -0,0 +1,144 @@
+from __future__ import annotations
+import json
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# a sink receives every snapshot emitted by a Profiler
+Sink = Callable[[Dict[str, Any]], None]
+
+
+class Profiler:
+    """Per-phase timers and event counters of the hot paths of the envs and tasks.
+
+    A profiler is attached by replacing methods of the profiled instances with timed wrappers,
+    so an env or task built without one runs its plain methods and pays nothing. Timers are
+    inclusive: a phase called inside another one (e.g. env.render inside env.step) counts in
+    both. Snapshots are plain dicts, read with snapshot() or pushed to sinks with emit().
+    """
+
+    def __init__(self, sinks: Optional[List[Sink]] = None, emit_every: int = 0) -> None:
+        """
+        Args:
+            sinks: Optional[List[Callable[[Dict[str, Any]], None]]]
+                Callables receiving every emitted snapshot, e.g. a JsonlSink.
+            emit_every: int
+                Emits a snapshot every emit_every env steps. 0 only emits on explicit emit().
+        """
+        self.sinks: List[Sink] = list(sinks or [])
+        self.emit_every = emit_every
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._installed: List[Tuple[Any, str]] = []
+        self._start = time.perf_counter()
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Adds n to the counter name.
+        """
+        self.counters[name] += n
+        if name == "steps" and self.emit_every and self.sinks:
+            if self.counters[name] % self.emit_every < n:
+                self.emit()
+
+    def instrument(
+        self,
+        obj: Any,
+        method: str,
+        phase: str,
+        counter: Optional[str] = None,
+        amount: Optional[Callable[..., int]] = None,
+    ) -> None:
+        """Replaces obj.method by a wrapper timing every call under phase.
+        Args:
+            obj: Any
+                Instance to profile. Only this instance is affected, not its class.
+            method: str
+                Name of the method.
+            phase: str
+                Name of the timer, e.g. "env.step".
+            counter: Optional[str]
+                Counter increased by every call, e.g. "steps".
+            amount: Optional[Callable[..., int]]
+                Computes the increase of counter from the call arguments. Default is 1.
+        """
+        func = getattr(obj, method)
+        if getattr(func, "profiler", None) is not None:
+            return  # e.g. a task shared by several profiled envs
+        clock = time.perf_counter
+        seconds, calls = self.seconds, self.calls
+
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds[phase] += clock() - start
+                calls[phase] += 1
+                if counter is not None:
+                    self.count(counter, 1 if amount is None else amount(*args, **kwargs))
+
+        wrapper.profiler = self
+        wrapper.__doc__ = func.__doc__
+        setattr(obj, method, wrapper)
+        self._installed.append((obj, method))
+
+    def detach(self) -> None:
+        """Restores every instrumented method.
+        """
+        for obj, method in reversed(self._installed):
+            obj.__dict__.pop(method, None)
+        self._installed = []
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current timers and counters.
+
+        Returns:
+            {"elapsed_s": seconds since the start or the last reset, "timers": {phase:
+            {"calls", "total_s", "mean_us"}}, "counters": {name: count}}.
+        """
+        return {
+            "elapsed_s": time.perf_counter() - self._start,
+            "timers": {
+                phase: {
+                    "calls": self.calls[phase],
+                    "total_s": total,
+                    "mean_us": 1e6 * total / max(self.calls[phase], 1),
+                }
+                for phase, total in self.seconds.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def emit(self) -> Dict[str, Any]:
+        """Sends the current snapshot to every sink and returns it.
+        """
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink(snapshot)
+        return snapshot
+
+    def reset(self) -> None:
+        """Zeroes the timers and counters.
+        """
+        self.seconds.clear()
+        self.calls.clear()
+        self.counters.clear()
+        self._start = time.perf_counter()
+
+
+class JsonlSink:
+    """Sink appending every snapshot as one JSON line to a file.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: str
+                Path of the JSON lines file.
+        """
+        self.path = path
+
+    def __call__(self, snapshot: Dict[str, Any]) -> None:
+        with open(self.path, "a") as fh:
+            fh.write(json.dumps(snapshot) + "\n")
@@ -0,0 +1,77 @@
+from __future__ import annotations
+from typing import List, Optional, Union
+import numpy as np
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+def make_seed_sequence(seed: Seed = None) -> np.random.SeedSequence:
+    """Builds a SeedSequence from an integer seed, an existing SeedSequence or fresh entropy.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+def spawn_generators(seed: Seed, n: int) -> List[np.random.Generator]:
+    """Splits a seed into n independent, non-overlapping random number generators.
+    Args:
+        seed: Union[None, int, np.random.SeedSequence]
+            Root seed. Spawning twice from the same SeedSequence object yields new streams.
+        n: int
+            Number of generators, e.g. one per batched env or parallel worker.
+    """
+    return [np.random.default_rng(child) for child in make_seed_sequence(seed).spawn(n)]
+
+
+class SignalPositionSampler:
+    """Draws positions of randomized signals in large blocks.
+
+    Every randomized signal gets one position per episode, with x and y taken from the same
+    draw. Draws are made block_size episodes at a time, so sampling a handful of episodes
+    costs a slice of a precomputed array rather than a call into the generator.
+    """
+
+    def __init__(
+        self,
+        scale: np.ndarray,
+        rng: Optional[np.random.Generator] = None,
+        block_size: int = 4096,
+    ):
+        """
+        Args:
+            scale: np.ndarray
+                Integer array of shape (num_signals, 2) with the exclusive upper bound of x and y
+                of each randomized signal.
+            rng: Optional[np.random.Generator] = None
+                Generator of this stream. Default is a generator seeded from fresh entropy.
+            block_size: int
+                Number of episodes drawn per call into the generator.
+        """
+        self.scale = np.asarray(scale, dtype=np.int64).reshape(-1, 2)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.block_size = block_size
+        self._block = np.zeros((0, len(self.scale), 2), dtype=np.int64)
+        self._cursor = 0
+
+    def draw(self, n_episodes: int) -> np.ndarray:
+        """Returns the signal positions of the next n_episodes episodes.
+
+        Returns:
+            Integer array of shape (n_episodes, num_signals, 2).
+        """
+        available = len(self._block) - self._cursor
+        if n_episodes > available:
+            block = self._draw_block(max(self.block_size, n_episodes - available))
+            self._block = np.concatenate([self._block[self._cursor :], block])
+            self._cursor = 0
+        positions = self._block[self._cursor : self._cursor + n_episodes]
+        self._cursor += n_episodes
+        return positions
+
+    def _draw_block(self, n_episodes: int) -> np.ndarray:
+        """Helper function that draws a new block of positions from the generator.
+        """
+        # random shrinkage factors of the screen bounds
+        factors = self.rng.random(size=(n_episodes, len(self.scale), 2))
+        return (factors * self.scale).astype(np.int64)
@@ -13,6 +13,13 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/jiajiexiao/RL_BrainMaturation",
     packages=setuptools.find_packages(),
+    install_requires=["numpy"],
+    extras_require={
+        # gym-compatible Environment wrapper and observation/action spaces
+        "gym": ["gym"],
+        # RLlib trainers, see rlbrainmaturation.integrations.rllib
+        "rllib": ["gym", "ray[rllib]"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
@@ -0,0 +1,33 @@
+import numpy as np
+from rlbrainmaturation.agents.history import StimulusHistory
+from rlbrainmaturation.agents.q_learning import QLearningAgent
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from rlbrainmaturation.tasks.odr_random import ODRRandom
+
+
+def test_q_learning_grows_table_on_random_signals():
+    env = VectorEnvironment(
+        {
+            "task": ODRRandom(),
+            "num_envs": 256,
+            "observation_mode": "coords",
+            "rng": np.random.default_rng(0),
+        }
+    )
+    agent = QLearningAgent(env, seed=0)
+    initial_rows = len(agent.q_values)
+    metrics = agent.train(5)
+    assert len(metrics) == 5
+    assert len(agent.state_ids) > initial_rows
+    assert len(agent.q_values) >= len(agent.state_ids)
+
+
+def test_stimulus_history_ids_are_unique_on_non_square_screens():
+    for width, height in ((8, 16), (16, 8)):
+        history = StimulusHistory(1, 2, width * height, width, height)
+        xy = np.stack(np.meshgrid(np.arange(width), np.arange(height)), axis=-1).reshape(-1, 2)
+        observations = {"coords": xy[None], "mask": np.ones((1, len(xy)), dtype=np.int8)}
+        history.update(observations, np.array([1]))
+        ids = history.features[0, len(xy):]
+        assert len(np.unique(ids)) == len(xy)
+        assert ids.min() == width * height and ids.max() < history.num_features
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from rlbrainmaturation.envs.core import EnvironmentCore
+from rlbrainmaturation.tasks.odr import ODR
+
+
+def test_rollout_stacks_frames_like_step():
+    env = EnvironmentCore({"task": ODR(), "frame_stack": 3})
+    actions = np.array([10, 20])
+    result = env.rollout(lambda observations, times: np.tile(actions, (len(times), 1)), 4)
+
+    steps = env.task.tot_frames
+    assert result["observations"].shape == (steps, 4, 42, 42, 3)
+    expected = [np.array(env.reset())]
+    for _ in range(steps - 1):
+        observation, _, _, _ = env.step(tuple(actions))
+        expected.append(np.array(observation))
+    for t, observation in enumerate(expected):
+        assert observation.shape == (42, 42, 3)
+        for i in range(4):
+            np.testing.assert_array_equal(result["observations"][t, i], observation)
+
+
+def test_target_distribution_set_after_env_is_built():
+    task = ODR()
+    env = EnvironmentCore({"task": task, "observation_mode": "coords"})
+    task.set_target_distribution([[7, 7]])
+    env.reset()
+    assert tuple(env.target) == (7, 7)
+    observation, _, _, _ = env.step((0, 0))  # frame 1 shows the fixation and the cue
+    lit = {tuple(xy) for xy, m in zip(observation["coords"], observation["mask"]) if m}
+    assert (7, 7) in lit
+    assert (1, 5) not in lit
+    env.step((0, 0))
+    _, reward, done, _ = env.step((7, 7))
+    assert done and reward == 1.0
+
+
+def test_target_distribution_rejects_targets_off_the_screen():
+    task = ODR()
+    for targets in ([[task.width, 5]], [[1, task.height]]):
+        with pytest.raises(AssertionError):
+            task.set_target_distribution(targets)
+    task.set_target_distribution([[task.width - 1, task.height - 1]])
@@ -0,0 +1,49 @@
+import numpy as np
+from rlbrainmaturation.envs.multitask_environment import MultiTaskVectorEnvironment
+from rlbrainmaturation.envs.vector_environment import VectorEnvironment
+from rlbrainmaturation.tasks.odr import ODR
+from rlbrainmaturation.tasks.odr_distract import ODRDistract
+
+
+def test_multitask_frame_skip_matches_vector_environment():
+    config = {"num_envs": 8, "frame_skip": True, "observation_mode": "coords"}
+    single = VectorEnvironment({"task": ODRDistract(), **config})
+    multi = MultiTaskVectorEnvironment({"tasks": [ODRDistract()], **config})
+    single.reset()
+    multi.reset()
+    for _ in range(3 * single.task.tot_frames):
+        _, single_rewards, single_dones, single_info = single.step(single.targets)
+        _, multi_rewards, multi_dones, multi_info = multi.step(multi.targets)
+        np.testing.assert_array_equal(multi_info["frames"], single_info["frames"])
+        np.testing.assert_array_equal(multi_dones, single_dones)
+        np.testing.assert_array_equal(multi_rewards, single_rewards)
+
+
+def test_multitask_frame_skip_stops_at_the_last_frame_of_each_task():
+    tasks = [ODR(), ODRDistract()]
+    env = MultiTaskVectorEnvironment({"tasks": tasks, "num_envs": 64, "frame_skip": True})
+    env.reset()
+    rewarded = np.zeros(env.num_envs, dtype=int)
+    for _ in range(3 * env.tot_frames):
+        last = env.schedule.task_frames[env.task_ids] - 1
+        before = env.times.copy()
+        _, rewards, _, info = env.step(env.targets)
+        crossed = (before < last) & (before + info["frames"] > last)
+        assert not crossed.any()
+        rewarded += rewards > 0.99
+    assert (rewarded > 0).all()
+
+
+def test_multitask_target_distribution_set_after_env_is_built():
+    odr = ODR()
+    env = MultiTaskVectorEnvironment({"tasks": [odr, ODRDistract()], "num_envs": 256})
+    odr.set_target_distribution([(1, 1), (8, 8), (2, 7)])
+    env.reset()
+    drawn = {tuple(target) for target in env.targets[env.task_ids == 0]}
+    assert drawn == {(1, 1), (8, 8), (2, 7)}
+    task_ids = env.task_ids.copy()
+    hits = np.zeros(env.num_envs)
+    for _ in range(env.tot_frames - 1):
+        _, rewards, _, _ = env.step(env.targets)
+        hits += rewards > 0.99
+    assert (hits == 1).all() and (task_ids == 0).any()
@@ -0,0 +1,19 @@
+from rlbrainmaturation.envs.episode_cache import EpisodeCache
+from rlbrainmaturation.tasks.odr import ODR
+
+
+def test_episode_cache_evicts_the_least_recently_used_entry():
+    cache = EpisodeCache(max_entries=2)
+    first, second, third = ODR(target_x=1), ODR(target_x=2), ODR(target_x=3)
+    entry = cache.get(first)
+    cache.get(second)
+    assert cache.get(ODR(target_x=1)) is entry  # same parameters, same entry
+    cache.get(third)  # evicts second, the least recently used
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.get(first) is entry
+    cache.get(second)
+    assert (cache.hits, cache.misses) == (2, 4)
+    assert len(cache) == 2
+    assert cache.get(first) is entry  # first was used after third, so third went instead
+    assert cache.misses == 4
@@ -0,0 +1,24 @@
+import numpy as np
+from rlbrainmaturation.envs.core import EnvironmentCore
+from rlbrainmaturation.envs.recorder import TrajectoryReader, TrajectoryRecorder
+from rlbrainmaturation.tasks.odr_random import ODRRandom
+
+
+def _record_episode(recorder, seed):
+    env = EnvironmentCore({"task": ODRRandom(seed=seed), "recorder": recorder})
+    env.reset()
+    for _ in range(env.task.tot_frames - 1):
+        env.step((0, 0))
+
+
+def test_recorded_seed_defaults_to_the_task_seed(tmp_path):
+    with TrajectoryRecorder(str(tmp_path), max_signals=8) as recorder:
+        _record_episode(recorder, 3)
+        recorder.set_context(seed=7)
+        _record_episode(recorder, 3)
+    reader = TrajectoryReader(str(tmp_path))
+    steps = ODRRandom().tot_frames - 1
+    assert len(list(reader.iter_steps(seed=3))) == steps
+    assert len(list(reader.iter_steps(seed=7))) == steps
+    seeds = {int(step["seed"]) for step in reader.iter_steps()}
+    assert seeds == {3, 7}
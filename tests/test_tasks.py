@@ -0,0 +1,51 @@
+import numpy as np
+from rlbrainmaturation.envs.core import EnvironmentCore
+from rlbrainmaturation.tasks import registry
+from rlbrainmaturation.tasks.odr import ODR
+from rlbrainmaturation.tasks.odr_random import ODRRandom
+from rlbrainmaturation.tasks.task import Epoch, Instruction, Task
+
+
+def test_random_instruction_position_is_drawn_on_every_read():
+    task = ODRRandom(seed=3)
+    positions = {tuple(task.issue_instruction(2)[0].position) for _ in range(20)}
+    assert len(positions) > 1
+
+
+def test_random_signal_positions_vary_across_episodes():
+    env = EnvironmentCore({"task": ODRRandom(seed=3), "observation_mode": "coords"})
+    positions = set()
+    for _ in range(20):
+        env.reset()
+        env.step((0, 0))
+        observation, _, _, _ = env.step((0, 0))  # frame 2 shows the random signal
+        positions.add(tuple(observation["coords"][0]))
+    assert len(positions) > 1
+
+
+def test_from_epochs_builds_a_plain_task_on_subclasses():
+    epochs = [Epoch("fixation", 2, [Instruction(0, 5, 5)]), Epoch("response", 1)]
+    task = ODR.from_epochs(1, 5, epochs)
+    assert type(task) is Task
+    assert task.tot_frames == 3
+    per_frame = Task(1, 5, {0: [Instruction(0, 5, 5)], 1: [Instruction(1, 5, 5)]}, tot_frames=3)
+    np.testing.assert_array_equal(task.compile().template, per_frame.compile().template)
+
+
+def test_compiled_schedule_matches_issue_instruction():
+    for name in registry.TASKS:
+        task = registry.make_task(name, **({"seed": 0} if name == "ODRRandom" else {}))
+        schedule = task.compile()
+        for t in range(task.tot_frames):
+            instructions = task.issue_instruction(t) or []
+            fixed = {(i.x, i.y) for i in instructions if i.rng is None}
+            mask = schedule.fixed_mask[t]
+            xs, ys = schedule.fixed_x[t][mask].tolist(), schedule.fixed_y[t][mask].tolist()
+            compiled = set(zip(xs, ys))
+            assert compiled == fixed, (name, t)
+            num_random = sum(i.rng is not None for i in instructions)
+            assert schedule.random_mask[t].sum() == num_random, (name, t)
+            template = np.zeros((task.height, task.width), dtype=np.uint8)
+            for x, y in fixed:
+                template[x, y] = 1
+            np.testing.assert_array_equal(schedule.template[t], template)